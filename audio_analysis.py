@@ -1,10 +1,23 @@
-def normalize_data(data):
-    min_val = min(data)
-    max_val = max(data)
-    new_data = []
-    for el in data:
-        new_data.append((el - min_val) / (max_val - min_val))
-    return new_data
+import numpy as np
+from wav_io import get_sample_scale
+
+def normalize_data(data, axis=-1):
+    data = np.asarray(data, dtype=float)
+    if data.size == 0:
+        return data
+    min_val = data.min(axis=axis, keepdims=True)
+    value_range = data.max(axis=axis, keepdims=True) - min_val
+    value_range[value_range == 0] = 1
+    return (data - min_val) / value_range
+
+def center_samples(data, dtype=None):
+    # unsigned samples sit around half of their range; centred on zero their signs
+    # mean the same as for signed samples, which zero crossings depend on
+    data = np.asarray(data)
+    dtype = data.dtype if dtype is None else np.dtype(dtype)
+    if dtype.kind != 'u':
+        return data
+    return data - get_sample_scale(dtype)[0]
 
 def calculate_energy(data):
     energy = []
@@ -20,60 +33,152 @@ def calculate_zero_crossing_rate(data):
     for i in range(0, len(data)):
         frame_zcr = 0
         for j in range(1, len(data[i])):
-            frame_zcr += abs(1 if data[i][j] >= 0 else -1 - 1 if data[i][j-1] >= 0 else -1)
+            frame_zcr += abs((1 if data[i][j] >= 0 else -1) - (1 if data[i][j-1] >= 0 else -1))
         frame_zcr = frame_zcr/(2*len(data[i]))
         zcr.append(frame_zcr)
     return zcr
 
+def calculate_frame_energy(frames):
+    frames = np.asarray(frames)
+    return np.einsum('...i,...i->...', frames, frames, dtype=float, casting='unsafe')
+
+def calculate_frame_zero_crossing_rate(frames):
+    signs = np.asarray(frames) >= 0
+    crossings = np.count_nonzero(signs[..., 1:] != signs[..., :-1], axis=-1)
+    return crossings / signs.shape[-1]
+
+def calculate_block_features(frame_blocks, calculate):
+    if isinstance(frame_blocks, np.ndarray):
+        return calculate(frame_blocks)
+    return np.concatenate([calculate(frames) for frames in frame_blocks], axis=-1)
+
 def get_energy(normalized_data_frames):
-    energy = []
-    for frame in normalized_data_frames:
-        energy.append(normalize_data(calculate_energy(frame)))
-    return energy
+    return normalize_data(calculate_block_features(normalized_data_frames, calculate_frame_energy))
 
 def get_zcr(data_frames):
-    zcr = []
-    for frame in data_frames:
-        zcr.append(calculate_zero_crossing_rate(frame))
-    return zcr
+    return calculate_block_features(data_frames, calculate_frame_zero_crossing_rate)
+
+def get_normalized_zcr(data_frames):
+    return normalize_data(get_zcr(data_frames))
 
 def get_frame_size(frame_size_in_ms, samplerate):
     return int(samplerate/1000*frame_size_in_ms)
 
-def split_data_into_frames(data, samplerate, frame_size_in_ms):
+def get_hop_size(frame_size, frame_overlap=0.5):
+    return max(int(frame_size*(1 - frame_overlap)), 1)
+
+def get_frame_count(length, frame_size, hop_size, tail="shift"):
+    if length < frame_size:
+        return 0 if tail == "drop" else 1
+    frame_count = (length - frame_size)//hop_size + 1
+    if tail != "drop" and (frame_count - 1)*hop_size + frame_size < length:
+        frame_count += 1
+    return frame_count
+
+def pad_tail(data, frame_size, hop_size):
+    # only the 'pad' policy needs a copy, every other policy stays a view
+    frame_count = get_frame_count(data.shape[-1], frame_size, hop_size, tail="pad")
+    padded_length = (frame_count - 1)*hop_size + frame_size
+    if padded_length == data.shape[-1]:
+        return data
+    padded = np.zeros(data.shape[:-1] + (padded_length,), dtype=data.dtype)
+    padded[..., :data.shape[-1]] = data
+    return padded
+
+def frame_signal(data, frame_size, hop_size, tail="shift"):
+    # tail policies: 'drop' ignores an incomplete last frame, 'pad' zero-fills
+    # it and 'shift' aligns the last frame with the end of the signal, which is
+    # how the frames have always ended, so the last samples are never left out;
+    # that frame is off the hop grid, so 'shift' gives it as a second block of
+    # frames next to the strided view instead of copying the view to append it
+    data = np.asarray(data)
+    if tail == "pad":
+        data = pad_tail(data, frame_size, hop_size)
+    elif tail not in ("drop", "shift"):
+        raise ValueError(f"Unknown tail policy '{tail}'")
+
+    length = data.shape[-1]
+    frame_count = get_frame_count(length, frame_size, hop_size, tail="drop")
+    frames = np.lib.stride_tricks.as_strided(
+        data,
+        shape=data.shape[:-1] + (frame_count, frame_size),
+        strides=data.strides[:-1] + (hop_size*data.strides[-1], data.strides[-1]),
+        writeable=False
+    )
+    if tail == "shift" and get_frame_count(length, frame_size, hop_size, tail) > frame_count:
+        if length < frame_size:
+            return frame_signal(data, frame_size, hop_size, tail="pad")
+        return [frames, data[..., np.newaxis, length - frame_size:]]
+    return frames
+
+def split_data_into_frames(data, samplerate, frame_size_in_ms, frame_overlap=0.5, tail="shift"):
     frame_size = get_frame_size(frame_size_in_ms, samplerate)
-    frame_overlap = 0.5
-    frame_change_rate = int(frame_size*frame_overlap)
-    data_frames = []
-
-    for i in range(0, (len(data)//frame_change_rate-1)*frame_change_rate, frame_change_rate):
-        single_frame = []
-        for j in range(i, i+frame_size):
-            single_frame.append(data[j])
-        data_frames.append(single_frame)
-
-    single_frame = []
-    for i in range(len(data)-frame_size, len(data)):
-        single_frame.append(data[i])
-    data_frames.append(single_frame)
-    return data_frames
-
-def get_normalized_data_frames(data, samplerate, frame_size_in_ms):
-    normalized_data_frames = []
-    for channel in data:
-        normalized_data_frames.append(
-            split_data_into_frames(
-                normalize_data(channel),
-                samplerate,
-                frame_size_in_ms
-            ))
-    return normalized_data_frames
-
-def get_data_frames(data, samplerate, frame_size_in_ms):
-    data_frames = []
-    for channel in data:
-        data_frames.append(split_data_into_frames(channel, samplerate, frame_size_in_ms))
-    return data_frames
+    hop_size = get_hop_size(frame_size, frame_overlap)
+    return frame_signal(data, frame_size, hop_size, tail=tail)
+
+def get_normalized_data_frames(data, samplerate, frame_size_in_ms, frame_overlap=0.5, tail="shift"):
+    normalized_data = normalize_data(data)
+    return split_data_into_frames(normalized_data, samplerate, frame_size_in_ms, frame_overlap, tail)
+
+def get_data_frames(data, samplerate, frame_size_in_ms, frame_overlap=0.5, tail="shift"):
+    return split_data_into_frames(center_samples(data), samplerate, frame_size_in_ms, frame_overlap, tail)
+
+def iter_data_blocks(data, block_size, overlap=0):
+    if hasattr(data, 'iter_blocks'):
+        yield from data.iter_blocks(block_size, overlap)
+        return
+    for start in range(0, max(data.shape[-1] - overlap, 1), block_size):
+        yield start, data[..., start:start + block_size + overlap]
+
+def get_data_length(data):
+    return data.shape[-1] if isinstance(data, np.ndarray) else data.length
+
+def read_data_block(data, start, stop):
+    if hasattr(data, 'read_block'):
+        return data.read_block(start, stop)
+    return data[..., start:stop]
+
+def get_data_range(data, block_size=2**20):
+    min_val, max_val = np.inf, -np.inf
+    for _, block in iter_data_blocks(data, block_size):
+        min_val = np.minimum(min_val, block.min(axis=-1, keepdims=True))
+        max_val = np.maximum(max_val, block.max(axis=-1, keepdims=True))
+    value_range = max_val - min_val
+    value_range[value_range == 0] = 1
+    return min_val, value_range
+
+def iter_frame_blocks(data, frame_size, hop_size, frames_per_block=4096, transform=None, tail="shift"):
+    # consecutive blocks overlap by frame_size - hop_size samples so every
+    # frame is produced exactly once and only one block is resident at a time;
+    # the tail frame is read on its own at the end
+    block_step = frames_per_block*hop_size
+    for _, block in iter_data_blocks(data, block_step, frame_size - hop_size):
+        block = np.ascontiguousarray(block)
+        if transform is not None:
+            block = transform(block)
+        yield frame_signal(block, frame_size, hop_size, tail="drop")
+    length = get_data_length(data)
+    frame_count = get_frame_count(length, frame_size, hop_size, "drop")
+    if get_frame_count(length, frame_size, hop_size, tail) > frame_count:
+        # a padded frame continues the hop grid, a shifted one ends with the signal
+        start = frame_count*hop_size if tail == "pad" else max(length - frame_size, 0)
+        block = np.ascontiguousarray(read_data_block(data, start, length))
+        if transform is not None:
+            block = transform(block)
+        yield frame_signal(block, frame_size, hop_size, tail)
+
+def get_data_frame_blocks(data, samplerate, frame_size_in_ms, frame_overlap=0.5, frames_per_block=4096, tail="shift"):
+    frame_size = get_frame_size(frame_size_in_ms, samplerate)
+    hop_size = get_hop_size(frame_size, frame_overlap)
+    return iter_frame_blocks(data, frame_size, hop_size, frames_per_block, center_samples, tail)
+
+def get_normalized_data_frame_blocks(data, samplerate, frame_size_in_ms, frame_overlap=0.5, frames_per_block=4096,
+                                     tail="shift"):
+    frame_size = get_frame_size(frame_size_in_ms, samplerate)
+    hop_size = get_hop_size(frame_size, frame_overlap)
+    min_val, value_range = get_data_range(data)
+    normalize = lambda block: (block - min_val) / value_range
+    return iter_frame_blocks(data, frame_size, hop_size, frames_per_block, normalize, tail)
 
 def find_segments(data, step):
     segments = []
@@ -83,3 +188,94 @@ def find_segments(data, step):
             segments.append(i)
             multiplier *= (-1)
     return segments
+
+segment_dtype = np.dtype([
+    ("channel", np.int32),
+    ("start_frame", np.int64),
+    ("end_frame", np.int64),
+    ("start", np.int64),
+    ("end", np.int64),
+    ("start_time", float),
+    ("end_time", float),
+    ("peak_energy", float),
+    ("mean_energy", float)
+])
+
+def get_hysteresis_mask(data, on_threshold, off_threshold=None):
+    # a frame is active from the first value >= on_threshold until the first
+    # value < off_threshold; values in between keep the previous state
+    data = np.atleast_2d(data)
+    off_threshold = on_threshold if off_threshold is None else off_threshold
+    positions = np.arange(data.shape[-1])
+    if off_threshold == on_threshold:
+        # as in find_segments: a value equal to the threshold starts a segment
+        # when none is active and ends the active one, so runs of equal values
+        # flip the state of the last value above or below the threshold
+        above = data > on_threshold
+        decided = above | (data < on_threshold)
+        last_decided = np.maximum.accumulate(np.where(decided, positions, -1), axis=-1)
+        state = np.take_along_axis(above, np.maximum(last_decided, 0), axis=-1) & (last_decided >= 0)
+        return state ^ ((positions - last_decided) % 2 == 1)
+    above = data >= on_threshold
+    decided = above | (data < off_threshold)
+    positions = np.where(decided, positions, -1)
+    last_decided = np.maximum.accumulate(positions, axis=-1)
+    state = np.take_along_axis(above, np.maximum(last_decided, 0), axis=-1)
+    return state & (last_decided >= 0)
+
+def get_segment_table(energy, on_threshold, off_threshold=None, frame_size=1, hop_size=1, samplerate=1,
+                      min_duration=0, min_gap=0, length=None):
+    energy = np.atleast_2d(np.asarray(energy, dtype=float))
+    channel_count, frame_count = energy.shape
+    length = (frame_count - 1)*hop_size + frame_size if length is None else length
+    mask = get_hysteresis_mask(energy, on_threshold, off_threshold)
+    edges = np.diff(mask.astype(np.int8), prepend=0, append=0, axis=-1)
+    channels, start_frames = np.nonzero(edges == 1)
+    end_frames = np.nonzero(edges == -1)[1]
+    # the last frame may be shifted back to end with the signal
+    starts = np.minimum(start_frames*hop_size, max(length - frame_size, 0))
+    ends = np.minimum((end_frames - 1)*hop_size + frame_size, length)
+
+    # gaps shorter than min_gap join their neighbours, then short segments are dropped
+    joined = (channels[1:] == channels[:-1]) & (starts[1:] - ends[:-1] < min_gap*samplerate)
+    keep_start = np.ones(len(channels), dtype=bool)
+    keep_end = np.ones(len(channels), dtype=bool)
+    keep_start[1:] = ~joined
+    keep_end[:-1] = ~joined
+    channels, start_frames, starts = channels[keep_start], start_frames[keep_start], starts[keep_start]
+    end_frames, ends = end_frames[keep_end], ends[keep_end]
+    long_enough = ends - starts >= min_duration*samplerate
+    channels, start_frames, end_frames = channels[long_enough], start_frames[long_enough], end_frames[long_enough]
+    starts, ends = starts[long_enough], ends[long_enough]
+
+    table = np.zeros(len(channels), dtype=segment_dtype)
+    table["channel"] = channels
+    table["start_frame"] = start_frames
+    table["end_frame"] = end_frames
+    table["start"] = starts
+    table["end"] = ends
+    table["start_time"] = starts/samplerate
+    table["end_time"] = ends/samplerate
+    if len(table):
+        # segments are sorted and disjoint, so one reduceat over the flattened
+        # energy covers every channel
+        flat = np.append(energy.ravel(), 0)
+        bounds = np.column_stack((channels*frame_count + start_frames, channels*frame_count + end_frames)).ravel()
+        table["peak_energy"] = np.maximum.reduceat(flat, bounds)[::2]
+        table["mean_energy"] = np.add.reduceat(flat, bounds)[::2]/(end_frames - start_frames)
+    return table
+
+def get_segment_frames(table, channel_count):
+    # start and end frame indices per channel, in the layout find_segments returns
+    segments = []
+    for channel in range(channel_count):
+        rows = table[table["channel"] == channel]
+        segments.append(np.column_stack((rows["start_frame"], rows["end_frame"])).ravel())
+    return segments
+
+def export_segment_table(table, file_path):
+    if file_path.endswith(".npy"):
+        np.save(file_path, table)
+        return
+    formats = ["%d", "%d", "%d", "%d", "%d", "%.6f", "%.6f", "%.6f", "%.6f"]
+    np.savetxt(file_path, table, fmt=formats, delimiter=",", header=",".join(segment_dtype.names), comments="")
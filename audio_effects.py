@@ -1,40 +1,64 @@
 import math
+from functools import lru_cache
+import numpy as np
 from plot_data import plot_tools
+from wav_io import get_sample_scale
 
-def linear_fade(data, fade_value_count):
+fade_curves = {
+    "linear": lambda x: x,
+    "log": lambda x: 1 - np.exp(-(math.e**2)*x),
+    "equal_power": lambda x: np.sin(np.pi/2*x),
+    "s_curve": lambda x: 0.5 - 0.5*np.cos(np.pi*x)
+}
 
-    fade_in_data, fade_out_data = [], []
-    fade_factor = 1/fade_value_count
+fade_types = {
+    "1": "linear",
+    "2": "log",
+    "3": "equal_power",
+    "4": "s_curve"
+}
 
-    for i in range(0, fade_value_count):
-        fading_factor = fade_factor * (i+1)
-        fade_in_data.append(round(data[i] * fading_factor))
+@lru_cache(maxsize=64)
+def get_fade_curve(fade_value_count, fade_type, direction="in"):
+    if direction == "in":
+        positions = np.arange(1, fade_value_count + 1)/fade_value_count
+    else:
+        positions = np.arange(fade_value_count - 1, -1, -1)/fade_value_count
+    curve = fade_curves[fade_type](positions)
+    curve.flags.writeable = False
+    return curve
 
-    for i in range(len(data)-fade_value_count, len(data)):
-        fading_factor = 1 - fade_factor * (i - (len(data) - fade_value_count) + 1)
-        fade_out_data.append(round(data[i] * fading_factor))
+def apply_gain(data, gain):
+    if np.issubdtype(data.dtype, np.integer):
+        # unsigned samples are silent at their offset, so they are scaled around it
+        offset = get_sample_scale(data.dtype)[0]
+        data[...] = np.rint((data - offset)*gain + offset)
+    else:
+        data *= gain
 
-    return(fade_in_data, fade_out_data)
+def apply_fade(data, fade_in_count, fade_out_count=None, fade_type="linear"):
+    # fades every channel of data in place, only the faded samples are touched
+    data = np.atleast_2d(data)
+    length = data.shape[-1]
+    fade_in_count = min(fade_in_count, length)
+    fade_out_count = min(fade_in_count if fade_out_count is None else fade_out_count, length)
+    if fade_in_count > 0:
+        apply_gain(data[:, :fade_in_count], get_fade_curve(fade_in_count, fade_type, "in"))
+    if fade_out_count > 0:
+        apply_gain(data[:, length - fade_out_count:], get_fade_curve(fade_out_count, fade_type, "out"))
+    return data
 
-def log_fade(data, fade_value_count):
-
-    fade_in_data, fade_out_data = [], []
-    fade_factor = (math.e**2)/fade_value_count
-
-    for i in range(0, fade_value_count):
-        fading_factor = 1 - math.exp(-fade_factor*(i + 1))
-        fade_in_data.append(round(data[i] * fading_factor))
-
-    for i in range(len(data)-fade_value_count, len(data)):
-        fading_factor = (1 - math.exp(-fade_factor * (fade_value_count - (i - (len(data) - fade_value_count) + 1))))
-        fade_out_data.append(round(data[i] * fading_factor))
-
-    return(fade_in_data, fade_out_data)
-
-def get_fade_data(file):
-    print(f"Audio length: {plot_tools.convert_time_to_readable_string(file.duration)}")
-    fade_time = int(input("Enter fade time in ms:\n> "))
-    fade_type = input("Choose fade type:\n[1] Linear\n[2] Logarithmic\n> ")
-    fade_value_count = round(file.samplerate*(fade_time/1000))
-    fade = linear_fade if fade_type == "1" else log_fade
-    return fade_value_count, fade
+def get_fade_data(file, fade_time=0, fade_type="", fade_out_time=None):
+    if fade_time == 0:
+        print(f"Audio length: {plot_tools.convert_time_to_readable_string(file.duration)}")
+        fade_time = int(input("Enter fade-in time in ms:\n> "))
+        fade_out_input = input("Enter fade-out time in ms (leave empty to use the fade-in time):\n> ")
+        fade_out_time = int(fade_out_input) if fade_out_input.strip() else None
+    if fade_type == "":
+        fade_type = input("Choose fade type:\n[1] Linear\n[2] Logarithmic\n[3] Equal-power\n[4] S-curve\n> ")
+    fade_type = fade_types.get(fade_type, fade_type)
+    if fade_out_time is None:
+        fade_out_time = fade_time
+    fade_in_count = round(file.samplerate*(fade_time/1000))
+    fade_out_count = round(file.samplerate*(fade_out_time/1000))
+    return fade_in_count, fade_out_count, fade_type
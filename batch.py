@@ -0,0 +1,288 @@
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from file_data import read_file
+from handle_data import handle_signal, handle_fade
+from spectrum_analysis import get_spectrum
+from plot_data import Plot, plot_tools
+from feature_cache import feature_cache
+from feature_index import feature_indexes
+from instrumentation import instrumentation
+from channel_executor import ChannelExecutor, executor_types
+from audio_effects import fade_curves
+from audio_analysis import export_segment_table
+from export import sample_formats
+from features import get_feature_table, export_feature_table
+from goertzel import decode_dtmf, get_dtmf_table, export_dtmf_table
+from feature_store import FeatureStore
+from audio_analysis import get_frame_size, get_hop_size
+
+analyses = ["energy", "zcr", "segments", "spectrum", "features", "dtmf", "fade"]
+
+def skip_plot(*args, **kwargs):
+    pass
+
+def get_plot(options, file_name, analysis, plot_type="plot_time"):
+    if not options["plots"]:
+        return skip_plot
+    stem = os.path.splitext(file_name)[0]
+    output_file = os.path.join(options["output_dir"], f"{stem}_{analysis}.{options['plot_format']}")
+    return getattr(Plot(plot_tools, output_file), plot_type)
+
+def run_analyses(file, options, executor=None):
+    results = {}
+    frame_size = options["frame_size"]
+
+    if "energy" in options["analyses"]:
+        plot = get_plot(options, file.file_name, "energy")
+        energy_plot = handle_signal(file, "energyPlot", plot, frame_size_in_ms=frame_size, executor=executor)
+        results["energy"] = np.atleast_2d(energy_plot.energy)
+
+    if "zcr" in options["analyses"]:
+        plot = get_plot(options, file.file_name, "zcr")
+        zcr_plot = handle_signal(file, "zeroCrossingRatePlot", plot, frame_size_in_ms=frame_size, executor=executor)
+        results["zcr"] = np.atleast_2d(zcr_plot.normalized_zcr)
+
+    if "segments" in options["analyses"]:
+        plot = get_plot(options, file.file_name, "segments")
+        segment_plot = handle_signal(file, "segmentPlot", plot, frame_size_in_ms=frame_size, step=options["step"],
+                                     off_step=options["off_step"], min_duration_in_ms=options["min_segment"],
+                                     min_gap_in_ms=options["min_gap"], executor=executor)
+        segments = segment_plot.segments if file.channel_count > 1 else [segment_plot.segments]
+        for i, channel in enumerate(segments):
+            results[f"segments_{i}"] = np.array(channel, dtype=int)
+        results["segment_table"] = segment_plot.segment_table
+        stem = os.path.splitext(file.file_name)[0]
+        export_segment_table(segment_plot.segment_table, os.path.join(options["output_dir"], f"{stem}_segments.csv"))
+
+    if "spectrum" in options["analyses"]:
+        start, end = options["interval"]
+        interval, frequencies, magnitudes = get_spectrum(file, start, end)
+        plot = get_plot(options, file.file_name, "spectrum", "plot_spectrum")
+        plot(interval, frequencies, magnitudes)
+        results["spectrum_frequencies"] = frequencies
+        results["spectrum_magnitudes"] = magnitudes
+
+    if "features" in options["analyses"]:
+        table = get_feature_table(file, frame_size, executor=executor)
+        results["feature_table"] = table
+        stem = os.path.splitext(file.file_name)[0]
+        export_feature_table(table, os.path.join(options["output_dir"], f"{stem}_features.csv"))
+
+    if "dtmf" in options["analyses"]:
+        table = get_dtmf_table(decode_dtmf(file))
+        results["dtmf_table"] = table
+        stem = os.path.splitext(file.file_name)[0]
+        export_dtmf_table(table, os.path.join(options["output_dir"], f"{stem}_dtmf.csv"))
+
+    if "fade" in options["analyses"]:
+        plot = get_plot(options, file.file_name, "fade")
+        handle_fade(file, options["fade_time"], options["fade_type"], options["output_dir"],
+                    plot, options["fade_out_time"], **options["export"])
+    return results
+
+def store_results(store, file, results, frame_size_in_ms):
+    # frame-aligned arrays become frame columns, the tables keep their own groups
+    frames = {"energy": results.get("energy"), "normalized_zcr": results.get("zcr")}
+    if "feature_table" in results:
+        table = results["feature_table"]
+        frames.update({name: table[name] for name in table.dtype.names[2:] if name not in frames})
+    tables = {group: results[name] for group, name in (("segments", "segment_table"), ("dtmf", "dtmf_table"))
+              if name in results}
+    if "spectrum_magnitudes" in results:
+        magnitudes = np.atleast_2d(results["spectrum_magnitudes"])
+        spectrum = np.zeros(magnitudes.size, dtype=[("channel", np.int64), ("frequency", float), ("magnitude", float)])
+        spectrum["channel"] = np.repeat(np.arange(magnitudes.shape[0]), magnitudes.shape[1])
+        spectrum["frequency"] = np.tile(results["spectrum_frequencies"], magnitudes.shape[0])
+        spectrum["magnitude"] = magnitudes.ravel()
+        tables["spectrum"] = spectrum
+    frame_size = get_frame_size(frame_size_in_ms, file.samplerate)
+    store.append(file, frame_size, get_hop_size(frame_size),
+                 {name: values for name, values in frames.items() if values is not None}, tables)
+
+def set_cache_directories(options):
+    if options["cache_dir"] is not None and feature_cache.directory != options["cache_dir"]:
+        feature_cache.set_directory(options["cache_dir"], options["cache_size"])
+    if options["index_dir"] is not None and feature_indexes.directory != options["index_dir"]:
+        feature_indexes.set_directory(options["index_dir"])
+
+def process_file(file_path, options):
+    start_time = time.perf_counter()
+    summary = {"file": file_path, "status": "ok"}
+    set_cache_directories(options)
+    if options["profile"] is not None:
+        instrumentation.enable(options["profile_memory"])
+        instrumentation.clear()
+    stats_before = feature_cache.get_stats()
+    executor = None
+    if options["channel_workers"] > 1:
+        executor = ChannelExecutor(options["channel_workers"], options["channel_pool"])
+    try:
+        with instrumentation.stage("file", os.path.basename(file_path)):
+            with instrumentation.stage("load"):
+                file = read_file(file_path, options["samplerate"])
+            summary.update(samplerate=file.samplerate, channels=file.channel_count, duration=file.duration)
+            results = run_analyses(file, options, executor)
+            stem = os.path.splitext(file.file_name)[0]
+            with instrumentation.stage("save_results"):
+                np.savez_compressed(os.path.join(options["output_dir"], f"{stem}.npz"), **results)
+            if options["store"] is not None:
+                with instrumentation.stage("store"):
+                    store_results(FeatureStore(options["store"]), file, results, options["frame_size"])
+        summary["outputs"] = sorted(results)
+    except Exception as error:
+        summary.update(status="error", error=f"{type(error).__name__}: {error}",
+                       traceback=traceback.format_exc())
+    if executor is not None:
+        executor.shutdown()
+    if options["profile"] is not None:
+        summary["profile"] = instrumentation.get_records()
+    stats_after = feature_cache.get_stats()
+    summary["cache"] = {name: stats_after[name] - stats_before[name]
+                        for name in ("memory_hits", "disk_hits", "misses")}
+    summary["elapsed"] = time.perf_counter() - start_time
+    return summary
+
+def find_files(paths):
+    file_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            file_paths.extend(sorted(glob.glob(os.path.join(path, "*.wav"))))
+        else:
+            file_paths.append(path)
+    return file_paths
+
+def print_progress(done, total, summary):
+    status = "ok" if summary["status"] == "ok" else f"FAILED ({summary['error']})"
+    print(f"[{done}/{total}] {os.path.basename(summary['file'])}: {status} in {summary['elapsed']:.2f} s")
+
+def run_batch(file_paths, options, workers=None):
+    os.makedirs(options["output_dir"], exist_ok=True)
+    summaries = []
+    records = []
+    start_time = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(process_file, file_path, options): file_path for file_path in file_paths}
+        for future in as_completed(futures):
+            try:
+                summary = future.result()
+            except Exception as error:
+                summary = {"file": futures[future], "status": "error", "elapsed": 0,
+                           "error": f"{type(error).__name__}: {error}"}
+            records.extend(summary.pop("profile", []))
+            summaries.append(summary)
+            print_progress(len(summaries), len(file_paths), summary)
+
+    summaries.sort(key=lambda summary: summary["file"])
+    report = {
+        "options": options,
+        "elapsed": time.perf_counter() - start_time,
+        "succeeded": sum(summary["status"] == "ok" for summary in summaries),
+        "failed": sum(summary["status"] != "ok" for summary in summaries),
+        "cache": {name: sum(summary.get("cache", {}).get(name, 0) for summary in summaries)
+                  for name in ("memory_hits", "disk_hits", "misses")},
+        "files": summaries
+    }
+    with open(os.path.join(options["output_dir"], "summary.json"), "w") as summary_file:
+        json.dump(report, summary_file, indent=2)
+    if options["profile"] is not None:
+        instrumentation.write(options["profile"], options["profile_format"], records)
+        report["stages"] = instrumentation.get_summary(records)
+    return report
+
+def print_stages(stages, count=10):
+    stage_totals = {}
+    for entry in stages:
+        total = stage_totals.setdefault(entry["stage"], [0.0, 0.0])
+        total[0] += entry["self_wall"]
+        total[1] += entry["self_cpu"]
+    print("slowest stages (self time, CPU time):")
+    for stage, (wall, cpu) in sorted(stage_totals.items(), key=lambda item: -item[1][0])[:count]:
+        print(f"  {stage:<24} {wall:>8.3f} s {cpu:>8.3f} s")
+
+def parse_arguments(arguments):
+    parser = argparse.ArgumentParser(description="Run audio analyses on WAV files without the interactive menu.")
+    parser.add_argument("paths", nargs="+", help="WAV files or directories containing them")
+    parser.add_argument("-a", "--analyses", nargs="+", choices=analyses, default=["energy", "zcr"])
+    parser.add_argument("-o", "--output-dir", default="batch_output")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="process count, defaults to CPU count")
+    parser.add_argument("--frame-size", type=int, default=20, help="frame size in ms")
+    parser.add_argument("--samplerate", type=int, default=None,
+                        help="resample higher-rate files to this rate before analysis")
+    parser.add_argument("--channel-workers", type=int, default=1,
+                        help="workers sharing the channels of one file, 1 processes them together")
+    parser.add_argument("--channel-pool", choices=list(executor_types), default="thread")
+    parser.add_argument("--step", type=float, default=0.3, help="segmentation threshold")
+    parser.add_argument("--off-step", type=float, default=None,
+                        help="threshold that ends a segment, the segmentation threshold by default")
+    parser.add_argument("--min-segment", type=int, default=0, help="shortest kept segment in ms")
+    parser.add_argument("--min-gap", type=int, default=0, help="shorter gaps between segments are joined, in ms")
+    parser.add_argument("--interval", type=float, nargs=2, default=(0, 0), metavar=("START", "END"),
+                        help="spectrum interval in seconds, the whole file by default")
+    parser.add_argument("--fade-time", type=int, default=100, help="fade-in length in ms")
+    parser.add_argument("--fade-out-time", type=int, default=None, help="fade-out length in ms, the fade-in length by default")
+    parser.add_argument("--fade-type", choices=list(fade_curves), default="linear")
+    parser.add_argument("--export-format", choices=["native"] + list(sample_formats), default="native",
+                        help="sample format of exported WAV files, the source format by default")
+    parser.add_argument("--dither", action="store_true", help="TPDF dither when exporting to fewer bits")
+    parser.add_argument("--no-clip", action="store_true", help="fail on out-of-range samples instead of clipping")
+    parser.add_argument("--plot-format", choices=["png", "svg"], default="png")
+    parser.add_argument("--no-plots", action="store_true")
+    parser.add_argument("--cache-dir", default=None, help="directory of the on-disk feature cache and energy/ZCR index")
+    parser.add_argument("--cache-size", type=int, default=512, help="feature cache size limit in MB")
+    parser.add_argument("--store", default=None, help="append the results to the feature store in this directory")
+    parser.add_argument("--profile", default=None, help="record per-stage timings into this file")
+    parser.add_argument("--profile-format", choices=["jsonl", "trace"], default="jsonl",
+                        help="JSON lines or Chrome trace events")
+    parser.add_argument("--profile-memory", action="store_true", help="also record allocations, slows the run down")
+    return parser.parse_args(arguments)
+
+def get_options(args):
+    return {
+        "analyses": args.analyses,
+        "output_dir": args.output_dir,
+        "frame_size": args.frame_size,
+        "samplerate": args.samplerate,
+        "channel_workers": args.channel_workers,
+        "channel_pool": args.channel_pool,
+        "step": args.step,
+        "off_step": args.off_step,
+        "min_segment": args.min_segment,
+        "min_gap": args.min_gap,
+        "interval": tuple(args.interval),
+        "fade_time": args.fade_time,
+        "fade_type": args.fade_type,
+        "fade_out_time": args.fade_out_time,
+        "export": {"sample_format": args.export_format, "clip": not args.no_clip, "dither": args.dither},
+        "plot_format": args.plot_format,
+        "plots": not args.no_plots,
+        "cache_dir": args.cache_dir,
+        "cache_size": args.cache_size*2**20,
+        "index_dir": None if args.cache_dir is None else os.path.join(args.cache_dir, "index"),
+        "store": args.store,
+        "profile": args.profile,
+        "profile_format": args.profile_format,
+        "profile_memory": args.profile_memory
+    }
+
+def main(arguments=None):
+    args = parse_arguments(arguments)
+    options = get_options(args)
+    file_paths = find_files(args.paths)
+    report = run_batch(file_paths, options, args.workers)
+    print(f"{report['succeeded']} succeeded, {report['failed']} failed in {report['elapsed']:.2f} s")
+    if args.cache_dir is not None:
+        cache = report["cache"]
+        print(f"feature cache: {cache['memory_hits'] + cache['disk_hits']} hits, {cache['misses']} misses")
+    if args.profile is not None:
+        print_stages(report["stages"])
+    return 1 if report["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,232 @@
+import os
+import sys
+import json
+import time
+import glob
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import tracemalloc
+import numpy as np
+from file_data import read_file
+from wav_io import WavWriter
+from export import export_file
+from audio_analysis import get_energy, get_data_frame_blocks, get_normalized_data_frame_blocks, find_segments
+from handle_data import handle_signal, get_faded_file
+from feature_index import FeatureIndexCache
+from resample import resample_data
+from features import get_feature_table
+from goertzel import get_tone_amplitudes, dtmf_low, dtmf_high
+from spectrum_analysis import get_spectrum, get_interval_spectra
+from plot_data import PlotTools
+
+frame_size_in_ms = 20
+
+def skip_plot(*args, **kwargs):
+    pass
+
+def load_stage(file, workspace):
+    read_file(workspace["path"]).channels
+
+def framing_stage(file, workspace):
+    data = file.channels if file.source is None else file.source
+    for block in get_data_frame_blocks(data, file.samplerate, frame_size_in_ms):
+        pass
+
+def energy_stage(file, workspace):
+    handle_signal(file, "energyPlot", skip_plot, frame_size_in_ms=frame_size_in_ms, cache=None, indexes=None)
+
+def zcr_stage(file, workspace):
+    handle_signal(file, "zeroCrossingRatePlot", skip_plot, frame_size_in_ms=frame_size_in_ms, cache=None,
+                  indexes=None)
+
+def index_stage(file, workspace):
+    indexes = FeatureIndexCache(os.path.join(workspace["directory"], "index"))
+    indexes.clear()
+    index = indexes.get(file)
+    for frame_size in (256, 441, 882, 2048):
+        index.get_energy(frame_size, frame_size//2)
+
+def resample_stage(file, workspace):
+    data = file.channels if file.source is None else file.source
+    resample_data(data, file.samplerate, 16000)
+
+def features_stage(file, workspace):
+    get_feature_table(file, frame_size_in_ms, cache=None)
+
+def goertzel_stage(file, workspace):
+    get_tone_amplitudes(file, dtmf_low + dtmf_high, cache=None)
+
+def segmentation_stage(file, workspace):
+    for channel in workspace["energy"]:
+        find_segments(channel, 0.3)
+
+def spectrum_stage(file, workspace):
+    get_spectrum(file, cache=None)
+
+def interval_spectra_stage(file, workspace):
+    # 100 overlapping intervals between 50 ms and 1 s, like a table of detected segments
+    lengths = np.linspace(0.05, 1, 100)
+    starts = np.linspace(0, max(file.duration - 1, 0), 100)
+    get_interval_spectra(file, zip(starts, starts + lengths))
+
+def fade_stage(file, workspace):
+    fade_count = round(file.samplerate*0.1)
+    get_faded_file(file, fade_count, fade_count, "linear")
+
+def export_stage(file, workspace):
+    export_file(file, output_dir=workspace["directory"], file_name="export.wav")
+
+def plot_preparation_stage(file, workspace):
+    # a fresh PlotTools, so the envelope pyramid is built every run
+    PlotTools().get_envelope_values(file, file.data, 1000)
+
+stages = {
+    "load": load_stage,
+    "framing": framing_stage,
+    "energy": energy_stage,
+    "zcr": zcr_stage,
+    "index": index_stage,
+    "resample": resample_stage,
+    "features": features_stage,
+    "goertzel": goertzel_stage,
+    "segmentation": segmentation_stage,
+    "spectrum": spectrum_stage,
+    "interval_spectra": interval_spectra_stage,
+    "fade": fade_stage,
+    "export": export_stage,
+    "plot_preparation": plot_preparation_stage
+}
+
+def parse_duration(value):
+    units = {"s": 1, "m": 60, "h": 3600}
+    if value[-1] in units:
+        return float(value[:-1])*units[value[-1]]
+    return float(value)
+
+def generate_signal(file_path, duration, samplerate=44100, channel_count=2, block_size=2**20):
+    # a tone switching between loud and quiet every second over a noise floor
+    random = np.random.default_rng(0)
+    length = int(duration*samplerate)
+    with WavWriter(file_path, samplerate, channel_count) as writer:
+        for start in range(0, length, block_size):
+            time_values = np.arange(start, min(start + block_size, length))/samplerate
+            level = np.where(np.floor(time_values) % 2 == 0, 8000, 500)
+            tone = level*np.sin(2*np.pi*440*time_values)
+            noise = random.normal(0, 200, (channel_count, len(time_values)))
+            writer.write(np.clip(tone + noise, -32768, 32767))
+    return file_path
+
+def measure_stage(stage, file, workspace, repeat):
+    tracemalloc.start()
+    stage(file, workspace)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    times = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        stage(file, workspace)
+        times.append(time.perf_counter() - start_time)
+    samples = file.length*file.channel_count
+    return {
+        "seconds": min(times),
+        "median_seconds": statistics.median(times),
+        "samples": samples,
+        "samples_per_second": samples/max(min(times), 1e-9),
+        "peak_bytes": peak
+    }
+
+def benchmark_file(name, file_path, stage_names, repeat, directory):
+    file = read_file(file_path)
+    workspace = {"path": file_path, "directory": directory}
+    if "segmentation" in stage_names:
+        workspace["energy"] = get_energy(get_normalized_data_frame_blocks(file.channels, file.samplerate, frame_size_in_ms))
+    results = {}
+    for stage_name in stage_names:
+        result = measure_stage(stages[stage_name], file, workspace, repeat)
+        results[f"{name}/{stage_name}"] = result
+        print(f"{name:<32} {stage_name:<17} {result['seconds']*1000:>10.2f} ms"
+              f" {result['samples_per_second']/1e6:>10.1f} MS/s {result['peak_bytes']/2**20:>9.1f} MB")
+    return results
+
+def run_benchmarks(sound_paths, durations, stage_names, repeat=3):
+    directory = tempfile.mkdtemp(prefix="benchmark_")
+    results = {}
+    try:
+        for file_path in sound_paths:
+            results.update(benchmark_file(os.path.basename(file_path), file_path, stage_names, repeat, directory))
+        for duration in durations:
+            name = f"synthetic_{duration:g}s"
+            file_path = generate_signal(os.path.join(directory, f"{name}.wav"), duration)
+            results.update(benchmark_file(name, file_path, stage_names, repeat, directory))
+            os.remove(file_path)
+    finally:
+        shutil.rmtree(directory)
+    return {
+        "machine": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count()
+        },
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results
+    }
+
+def compare_results(results, baseline, threshold=0.25, time_slack=0.001, memory_slack=2**20):
+    # the slack values keep timer noise on sub-millisecond stages from being reported
+    regressions = []
+    improvements = []
+    for key, result in results["results"].items():
+        if key not in baseline["results"]:
+            continue
+        previous = baseline["results"][key]
+        ratio = result["seconds"]/max(previous["seconds"], 1e-9)
+        if result["seconds"] > previous["seconds"]*(1 + threshold) + time_slack:
+            regressions.append(f"{key}: {previous['seconds']*1000:.2f} ms -> {result['seconds']*1000:.2f} ms ({ratio:.2f}x)")
+        elif result["seconds"]*(1 + threshold) + time_slack < previous["seconds"]:
+            improvements.append(f"{key}: {previous['seconds']*1000:.2f} ms -> {result['seconds']*1000:.2f} ms ({1/ratio:.2f}x faster)")
+        if result["peak_bytes"] > previous["peak_bytes"]*(1 + threshold) + memory_slack:
+            regressions.append(f"{key}: peak memory {previous['peak_bytes']/2**20:.1f} MB -> {result['peak_bytes']/2**20:.1f} MB")
+    return regressions, improvements
+
+def parse_arguments(arguments):
+    parser = argparse.ArgumentParser(description="Time the processing stages on the Sounds corpus and synthetic signals.")
+    parser.add_argument("paths", nargs="*", default=["Sounds"], help="WAV files or directories, Sounds/ by default")
+    parser.add_argument("-s", "--stages", nargs="+", choices=list(stages), default=list(stages))
+    parser.add_argument("-d", "--durations", nargs="*", default=["10s", "60s", "10m"],
+                        help="synthetic signal lengths, e.g. 30s 10m 2h")
+    parser.add_argument("-n", "--repeat", type=int, default=3, help="timed runs per stage, the fastest is kept")
+    parser.add_argument("--save", default=None, help="write the results as a JSON baseline")
+    parser.add_argument("--compare", default=None, help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="relative slowdown reported as a regression")
+    return parser.parse_args(arguments)
+
+def main(arguments=None):
+    args = parse_arguments(arguments)
+    sound_paths = []
+    for path in args.paths:
+        sound_paths.extend(sorted(glob.glob(os.path.join(path, "*.wav"))) if os.path.isdir(path) else [path])
+    durations = [parse_duration(duration) for duration in args.durations]
+    results = run_benchmarks(sound_paths, durations, args.stages, args.repeat)
+
+    if args.save is not None:
+        with open(args.save, "w") as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+    if args.compare is None:
+        return 0
+    with open(args.compare) as baseline_file:
+        baseline = json.load(baseline_file)
+    regressions, improvements = compare_results(results, baseline, args.threshold)
+    for improvement in improvements:
+        print(f"faster    {improvement}")
+    for regression in regressions:
+        print(f"REGRESSED {regression}")
+    print(f"{len(regressions)} regressions, {len(improvements)} improvements against {args.compare}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,45 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+executor_types = {
+    "thread": ThreadPoolExecutor,
+    "process": ProcessPoolExecutor
+}
+
+class ChannelExecutor:
+
+    def __init__(self, workers=None, kind="thread"):
+        # threads suit the numpy kernels, which release the GIL; processes
+        # re-open mapped files by path, so only small arguments are pickled
+        if kind not in executor_types:
+            raise ValueError(f"Unknown executor type '{kind}'")
+        self.workers = workers or os.cpu_count()
+        self.kind = kind
+        self.pool = None
+
+    def get_pool(self):
+        if self.pool is None:
+            self.pool = executor_types[self.kind](max_workers=self.workers)
+        return self.pool
+
+    def map(self, function, items, *args):
+        items = list(items)
+        if len(items) < 2 or self.workers < 2:
+            return [function(item, *args) for item in items]
+        futures = [self.get_pool().submit(function, item, *args) for item in items]
+        return [future.result() for future in futures]
+
+    def map_channels(self, function, file, *args):
+        # results come back in channel order
+        return self.map(function, [file.get_channel_data(i) for i in range(file.channel_count)], *args)
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
@@ -0,0 +1,46 @@
+import os
+import numpy as np
+from wav_io import WavWriter
+from audio_analysis import iter_data_blocks
+from instrumentation import instrumentation
+
+sample_formats = {
+    "pcm8": (np.uint8, 8),
+    "pcm16": (np.int16, 16),
+    "pcm24": (np.int32, 24),
+    "pcm32": (np.int32, 32),
+    "float32": (np.float32, 32),
+    "float64": (np.float64, 64)
+}
+
+def get_native_format(file):
+    dtype = file.channels.dtype if file.source is None else file.source.dtype
+    return np.dtype(dtype), file.bit_depth
+
+def get_sample_format(file, sample_format="native"):
+    if sample_format == "native":
+        return get_native_format(file)
+    return sample_formats[sample_format]
+
+def iter_file_blocks(file, block_size=2**16):
+    data = file.channels if file.source is None else file.source
+    for _, block in iter_data_blocks(data, block_size):
+        yield block
+
+def export_file(file, blocks=None, output_dir="exported", sample_format="native", clip=True, dither=False,
+                file_name=None):
+    # blocks come in the scale of the file's own samples and are written one at a
+    # time, so the exported signal never has to be held in memory as a whole
+    os.makedirs(output_dir, exist_ok=True)
+    dtype, bit_depth = get_sample_format(file, sample_format)
+    output_path = os.path.join(output_dir, file_name or file.file_name)
+    if blocks is None:
+        blocks = iter_file_blocks(file)
+    with instrumentation.stage("export", file.file_name), \
+            WavWriter(output_path, file.samplerate, file.channel_count, dtype, bit_depth,
+                      get_native_format(file)[0], clip, dither) as writer:
+        for block in blocks:
+            writer.write(block)
+    if writer.clipped:
+        print(f"Warning: {writer.clipped} samples clipped while exporting '{output_path}'")
+    return output_path
@@ -0,0 +1,150 @@
+import os
+import json
+import hashlib
+import zipfile
+from collections import OrderedDict
+import numpy as np
+
+# raised whenever the stored values change for the same parameters, so older entries are never read
+cache_version = 2
+
+def get_cache_key(content_hash, parameters):
+    key = hashlib.blake2b(digest_size=20)
+    key.update(str(cache_version).encode())
+    key.update(content_hash.encode())
+    key.update(json.dumps(parameters, sort_keys=True, default=str).encode())
+    return key.hexdigest()
+
+def get_size(values):
+    return sum(value.nbytes for value in values.values())
+
+class FeatureCache:
+
+    def __init__(self, directory=None, max_bytes=512*2**20, memory_bytes=64*2**20):
+        self.memory = OrderedDict()
+        self.memory_size = 0
+        self.memory_bytes = memory_bytes
+        self.reset_stats()
+        self.set_directory(directory, max_bytes)
+
+    def set_directory(self, directory, max_bytes=512*2**20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.disk_size = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self.disk_size = sum(os.path.getsize(path) for path in self.get_disk_entries())
+            self.evict_disk()
+
+    def reset_stats(self):
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats["hits"] = stats["memory_hits"] + stats["disk_hits"]
+        stats["memory_entries"] = len(self.memory)
+        stats["memory_bytes"] = self.memory_size
+        stats["disk_bytes"] = self.disk_size
+        return stats
+
+    def get_path(self, key):
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def get_disk_entries(self):
+        return [entry.path for entry in os.scandir(self.directory) if entry.name.endswith(".npz")]
+
+    def remember(self, key, values):
+        for value in values.values():
+            value.flags.writeable = False
+        if key in self.memory:
+            self.memory_size -= get_size(self.memory.pop(key))
+        self.memory[key] = values
+        self.memory_size += get_size(values)
+        while self.memory_size > self.memory_bytes and len(self.memory) > 1:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_size -= get_size(evicted)
+
+    def evict_disk(self):
+        if self.disk_size <= self.max_bytes:
+            return
+        # least recently used first, hits refresh the modification time
+        # other processes may share the directory, so sizes are re-read here
+        entries = []
+        for path in self.get_disk_entries():
+            try:
+                entries.append((os.path.getmtime(path), os.path.getsize(path), path))
+            except OSError:
+                pass
+        entries.sort()
+        self.disk_size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self.disk_size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            self.disk_size -= size
+            self.stats["evictions"] += 1
+
+    def remove_entry(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        self.disk_size -= size
+
+    def get(self, key):
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.stats["memory_hits"] += 1
+            return self.memory[key]
+        if self.directory is not None:
+            path = self.get_path(key)
+            try:
+                with np.load(path) as stored:
+                    values = {name: stored[name] for name in stored.files}
+                os.utime(path)
+            except FileNotFoundError:
+                values = None
+            except (OSError, ValueError, EOFError, zipfile.BadZipFile):
+                # a truncated or corrupt entry is dropped and computed again
+                self.remove_entry(path)
+                values = None
+            if values is not None:
+                self.remember(key, values)
+                self.stats["disk_hits"] += 1
+                return values
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, key, values):
+        self.remember(key, values)
+        if self.directory is None:
+            return
+        path = self.get_path(key)
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as cache_file:
+            np.savez(cache_file, **values)
+        os.replace(temporary_path, path)
+        self.disk_size += os.path.getsize(path)
+        self.evict_disk()
+
+    def get_or_compute(self, file, parameters, compute):
+        key = get_cache_key(file.get_content_hash(), parameters)
+        values = self.get(key)
+        if values is None:
+            values = {name: np.asarray(value) for name, value in compute().items()}
+            self.put(key, values)
+        return values
+
+    def clear(self):
+        self.memory.clear()
+        self.memory_size = 0
+        if self.directory is not None:
+            for path in self.get_disk_entries():
+                os.remove(path)
+            self.disk_size = 0
+
+feature_cache = FeatureCache()
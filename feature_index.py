@@ -0,0 +1,181 @@
+import os
+import shutil
+import numpy as np
+from audio_analysis import iter_data_blocks, get_frame_count, normalize_data, get_data_length, center_samples
+from instrumentation import instrumentation
+
+index_names = ("sums", "squares", "crossings")
+default_index_directory = os.path.join(".feature_cache", "index")
+
+def get_sum_dtype(dtype):
+    # squares of 8 and 16-bit samples sum exactly in int64 for ~10 hours of audio
+    dtype = np.dtype(dtype)
+    return np.dtype(np.int64) if dtype.kind in 'iu' and dtype.itemsize <= 2 else np.dtype(float)
+
+def get_crossing_dtype(length):
+    return np.dtype(np.int32 if length < 2**31 else np.int64)
+
+def get_index_size(channel_count, length, dtype):
+    return channel_count*(length + 1)*(2*get_sum_dtype(dtype).itemsize + get_crossing_dtype(length).itemsize)
+
+def create_index(directory, channel_count, length, dtype):
+    sum_dtype = get_sum_dtype(dtype)
+    for name, name_dtype in zip(index_names, (sum_dtype, sum_dtype, get_crossing_dtype(length))):
+        np.lib.format.open_memmap(os.path.join(directory, f"{name}.npy"), mode="w+", dtype=name_dtype,
+                                  shape=(channel_count, length + 1))
+    np.lib.format.open_memmap(os.path.join(directory, "range.npy"), mode="w+", dtype=float, shape=(channel_count, 2))
+
+def write_index(data, directory, rows=slice(None), block_size=2**18):
+    # block by block into the mapped rows, so only one block of samples is held in memory
+    sums, squares, crossings, value_range = (np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r+")[rows]
+                                             for name in index_names + ("range",))
+    value_range[:, 0], value_range[:, 1] = np.inf, -np.inf
+    previous_signs = None
+    for start, block in iter_data_blocks(data, block_size):
+        block = np.asarray(block)
+        if block.shape[-1] == 0:
+            continue
+        stop = start + block.shape[-1]
+        values = block.astype(sums.dtype)
+        signs = center_samples(block) >= 0
+        changes = np.empty(signs.shape, dtype=crossings.dtype)
+        changes[:, 1:] = signs[:, 1:] != signs[:, :-1]
+        changes[:, 0] = 0 if previous_signs is None else signs[:, 0] != previous_signs
+        previous_signs = signs[:, -1]
+        for target, block_values in ((sums, values), (squares, values*values), (crossings, changes)):
+            np.cumsum(block_values, axis=-1, out=target[:, start + 1:stop + 1])
+            target[:, start + 1:stop + 1] += target[:, start:start + 1]
+        value_range[:, 0] = np.minimum(value_range[:, 0], block.min(axis=-1))
+        value_range[:, 1] = np.maximum(value_range[:, 1], block.max(axis=-1))
+    if get_data_length(data) == 0:
+        value_range[:] = 0
+    for values in (sums, squares, crossings, value_range):
+        values.flush()
+
+def write_channel_index(item, directory):
+    channel, data = item
+    write_index(data, directory, slice(channel, channel + 1))
+
+class FeatureIndex:
+
+    def __init__(self, directory):
+        # prefix sums of x and x^2 and the count of sign changes before every sample,
+        # mapped from disk, so any frame's energy and ZCR is a difference of two entries
+        # and a query reads only the entries at the frame edges
+        self.sums, self.squares, self.crossings, value_range = (
+            np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in index_names + ("range",))
+        self.length = self.sums.shape[-1] - 1
+        self.minimum = value_range[:, :1].copy()
+        self.maximum = value_range[:, 1:].copy()
+
+    @property
+    def channel_count(self):
+        return self.sums.shape[0]
+
+    def get_frame_starts(self, frame_size, hop_size):
+        # the same frames as the framing pipeline, including the one shifted to the end
+        starts = np.arange(get_frame_count(self.length, frame_size, hop_size, tail="drop"))*hop_size
+        if get_frame_count(self.length, frame_size, hop_size) > len(starts):
+            starts = np.append(starts, self.length - frame_size)
+        return starts
+
+    def get_frame_sums(self, values, starts, ends):
+        return np.asarray(values[:, ends]) - np.asarray(values[:, starts])
+
+    def get_raw_energy(self, frame_size, hop_size):
+        starts = self.get_frame_starts(frame_size, hop_size)
+        return self.get_frame_sums(self.squares, starts, starts + frame_size).astype(float)
+
+    def get_energy(self, frame_size, hop_size):
+        # energy of the min/max normalized samples, as get_energy computes it
+        # from get_normalized_data_frame_blocks:
+        # sum((x - m)^2)/r^2 = (sum(x^2) - 2m*sum(x) + n*m^2)/r^2
+        minimum = self.minimum.astype(self.sums.dtype)
+        value_range = self.maximum - self.minimum
+        value_range[value_range == 0] = 1
+        starts = self.get_frame_starts(frame_size, hop_size)
+        squares = self.get_frame_sums(self.squares, starts, starts + frame_size)
+        sums = self.get_frame_sums(self.sums, starts, starts + frame_size)
+        energy = (squares - 2*minimum*sums + frame_size*minimum*minimum)/value_range**2
+        return normalize_data(energy)
+
+    def get_zcr(self, frame_size, hop_size):
+        # sign changes after each frame's first sample
+        starts = self.get_frame_starts(frame_size, hop_size)
+        return self.get_frame_sums(self.crossings, starts + 1, starts + frame_size)/frame_size
+
+class FeatureIndexCache:
+
+    def __init__(self, directory=None, max_bytes=2**32):
+        self.set_directory(directory, max_bytes)
+
+    def set_directory(self, directory, max_bytes=2**32):
+        # without a directory there is nowhere to keep indexes and the framing pipeline is used
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def get_path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get_disk_entries(self):
+        return [entry.path for entry in os.scandir(self.directory)
+                if entry.is_dir() and not entry.name.endswith(".tmp")]
+
+    def get_entry_size(self, path):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+    def evict_disk(self):
+        # least recently used first, as in the feature cache
+        entries = []
+        for path in self.get_disk_entries():
+            try:
+                entries.append((os.path.getmtime(path), self.get_entry_size(path), path))
+            except OSError:
+                pass
+        entries.sort()
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for _, entry_size, path in entries[:-1]:
+            if size <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            size -= entry_size
+
+    def build(self, file, data, path, executor=None):
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        os.makedirs(temporary_path, exist_ok=True)
+        create_index(temporary_path, file.channel_count, file.length, data.dtype)
+        if executor is None or file.channel_count == 1:
+            write_index(data, temporary_path)
+        else:
+            # every worker writes its own channel's rows
+            executor.map(write_channel_index, [(i, file.get_channel_data(i)) for i in range(file.channel_count)],
+                         temporary_path)
+        try:
+            os.replace(temporary_path, path)
+        except OSError:
+            # another process finished the same index first
+            shutil.rmtree(temporary_path, ignore_errors=True)
+
+    def get(self, file, executor=None):
+        if self.directory is None:
+            return None
+        data = file.channels if file.source is None else file.source
+        if get_index_size(file.channel_count, file.length, data.dtype) > self.max_bytes:
+            return None
+        path = self.get_path(file.get_content_hash())
+        if os.path.isdir(path):
+            os.utime(path)
+        else:
+            with instrumentation.stage("index", file.file_name):
+                self.build(file, data, path, executor)
+            self.evict_disk()
+        return FeatureIndex(path)
+
+    def clear(self):
+        if self.directory is not None:
+            for path in self.get_disk_entries():
+                shutil.rmtree(path, ignore_errors=True)
+
+feature_indexes = FeatureIndexCache()
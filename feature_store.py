@@ -0,0 +1,239 @@
+import os
+import sys
+import json
+import struct
+import argparse
+import numpy as np
+
+# every column is a plain .npy file with a fixed-size header, so rows can be
+# appended in place and the header rewritten without moving the data
+column_header_size = 128
+
+def write_column_header(column_file, dtype, length):
+    header = repr({"descr": np.lib.format.dtype_to_descr(np.dtype(dtype)), "fortran_order": False,
+                   "shape": (length,)})
+    header = header.ljust(column_header_size - 11) + "\n"
+    column_file.seek(0)
+    column_file.write(np.lib.format.magic(1, 0) + struct.pack("<H", len(header)) + header.encode("latin1"))
+
+def get_fill_value(dtype):
+    dtype = np.dtype(dtype)
+    if dtype.kind == 'f':
+        return np.nan
+    return "" if dtype.kind == 'U' else 0
+
+def append_column(path, dtype, length, values):
+    # anything past the committed length was left by an interrupted append and is overwritten
+    values = np.ascontiguousarray(values, dtype=dtype)
+    with open(path, "r+b" if os.path.exists(path) else "w+b") as column_file:
+        column_file.truncate(column_header_size + length*np.dtype(dtype).itemsize)
+        column_file.seek(0, os.SEEK_END)
+        column_file.write(values.tobytes())
+        write_column_header(column_file, dtype, length + len(values))
+
+class StoreLock:
+
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        # appends from several processes are serialized where flock exists
+        self.lock_file = open(self.path, "w")
+        try:
+            import fcntl
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        except ImportError:
+            pass
+        return self
+
+    def __exit__(self, *exc_info):
+        self.lock_file.close()
+
+class FeatureStore:
+
+    def __init__(self, directory):
+        # groups of equally long columns: "frames" holds one row per channel and
+        # frame, other groups hold tables such as segments; the manifest records
+        # where each file's rows start
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self.columns = {}
+        self.load_manifest()
+
+    def load_manifest(self):
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as manifest_file:
+                self.manifest = json.load(manifest_file)
+        else:
+            self.manifest = {"version": 1, "groups": {}, "files": []}
+
+    def save_manifest(self):
+        temporary_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w") as manifest_file:
+            json.dump(self.manifest, manifest_file, indent=1)
+        os.replace(temporary_path, self.manifest_path)
+
+    def get_column_path(self, group, name):
+        return os.path.join(self.directory, group, f"{name}.npy")
+
+    def append_rows(self, group, columns):
+        # columns missing on either side are filled, so every column of a group
+        # stays as long as the group
+        group_info = self.manifest["groups"].setdefault(group, {"length": 0, "columns": {}})
+        os.makedirs(os.path.join(self.directory, group), exist_ok=True)
+        length = group_info["length"]
+        row_count = len(next(iter(columns.values())))
+        for name, values in columns.items():
+            if len(values) != row_count:
+                raise ValueError(f"Column '{name}' has {len(values)} rows, expected {row_count}")
+            if name not in group_info["columns"]:
+                dtype = np.asarray(values).dtype
+                group_info["columns"][name] = np.lib.format.dtype_to_descr(dtype)
+                append_column(self.get_column_path(group, name), dtype, 0, np.full(length, get_fill_value(dtype),
+                                                                                    dtype=dtype))
+        for name, descr in group_info["columns"].items():
+            dtype = np.dtype(descr)
+            values = columns[name] if name in columns else np.full(row_count, get_fill_value(dtype), dtype=dtype)
+            append_column(self.get_column_path(group, name), dtype, length, values)
+        group_info["length"] = length + row_count
+        return {"offset": length, "length": row_count, "columns": list(columns)}
+
+    def append(self, file, frame_size, hop_size, frames=None, tables=None):
+        # frames maps names to (channels, frames) arrays, tables maps group names
+        # to structured arrays; both are written before the manifest points at them
+        entry = {
+            "file": file.file_name,
+            "key": file.get_content_hash(),
+            "samplerate": file.samplerate,
+            "channel_count": file.channel_count,
+            "length": file.length,
+            "frame_size": frame_size,
+            "hop_size": hop_size,
+            "frame_count": 0,
+            "groups": {}
+        }
+        with StoreLock(os.path.join(self.directory, "lock")):
+            self.load_manifest()
+            if frames:
+                frames = {name: np.atleast_2d(values) for name, values in frames.items()}
+                shapes = {values.shape for values in frames.values()}
+                if len(shapes) > 1 or next(iter(shapes))[0] != file.channel_count:
+                    raise ValueError(f"Frame columns must share one (channels, frames) shape, got {sorted(shapes)}")
+                entry["frame_count"] = next(iter(shapes))[1]
+                entry["groups"]["frames"] = self.append_rows("frames", {name: values.ravel()
+                                                                        for name, values in frames.items()})
+            for group, table in (tables or {}).items():
+                entry["groups"][group] = self.append_rows(group, {name: table[name] for name in table.dtype.names})
+            self.manifest["files"].append(entry)
+            self.save_manifest()
+        return entry
+
+    def get_entries(self):
+        return self.manifest["files"]
+
+    def find(self, name):
+        # by file name or content hash, the latest entry wins; the manifest is
+        # re-read once in case another process appended the file since
+        for reload in (False, True):
+            if reload:
+                self.load_manifest()
+            for entry in reversed(self.manifest["files"]):
+                if name in (entry["file"], entry["key"]):
+                    return entry
+        raise KeyError(f"'{name}' is not in the feature store")
+
+    def get_column(self, group, name):
+        # mapped once and remapped only when another append made the group longer
+        group_info = self.manifest["groups"][group]
+        length = group_info["length"]
+        if length == 0:
+            return np.zeros(0, dtype=group_info["columns"][name])
+        key = (group, name)
+        if key not in self.columns or len(self.columns[key]) < length:
+            self.columns[key] = np.load(self.get_column_path(group, name), mmap_mode="r")
+        return self.columns[key]
+
+    def get_rows(self, entry, group, name):
+        group_entry = entry["groups"][group]
+        column = self.get_column(group, name)
+        return column[group_entry["offset"]:group_entry["offset"] + group_entry["length"]]
+
+    def get_frames(self, name, start=None, end=None, columns=None, channels=None):
+        # frames starting in [start, end) seconds, as mapped (channels, frames) views
+        # that read only the requested range
+        entry = self.find(name)
+        if "frames" not in entry["groups"]:
+            raise KeyError(f"No frame columns stored for '{entry['file']}'")
+        frame_count, hop_size = entry["frame_count"], entry["hop_size"]
+        samplerate = entry["samplerate"]
+        first = 0 if start is None else min(max(int(np.ceil(start*samplerate/hop_size)), 0), frame_count)
+        stop = frame_count if end is None else min(max(int(np.ceil(end*samplerate/hop_size)), first), frame_count)
+        channels = slice(None) if channels is None else channels
+        frames = np.arange(first, stop)
+        values = {"frame": frames, "time": frames*hop_size/samplerate}
+        for column in entry["groups"]["frames"]["columns"] if columns is None else columns:
+            rows = self.get_rows(entry, "frames", column).reshape(entry["channel_count"], frame_count)
+            values[column] = rows[channels, first:stop]
+        return values
+
+    def get_table(self, name, group):
+        entry = self.find(name)
+        group_entry = entry["groups"][group]
+        columns = {column: self.get_rows(entry, group, column) for column in group_entry["columns"]}
+        table = np.zeros(group_entry["length"], dtype=[(column, values.dtype) for column, values in columns.items()])
+        for column, values in columns.items():
+            table[column] = values
+        return table
+
+def add_files(store, file_paths, frame_size_in_ms=20, features=None, samplerate=None):
+    from file_data import read_file
+    from features import get_feature_table
+    from audio_analysis import get_frame_size, get_hop_size
+    for file_path in file_paths:
+        file = read_file(file_path, samplerate)
+        table = get_feature_table(file, frame_size_in_ms, features, cache=None)
+        frame_size = get_frame_size(frame_size_in_ms, file.samplerate)
+        store.append(file, frame_size, get_hop_size(frame_size),
+                     frames={name: table[name] for name in table.dtype.names[2:]})
+        print(f"{file.file_name}: {table.shape[1]} frames, {len(table.dtype.names) - 2} columns")
+
+def parse_arguments(arguments):
+    parser = argparse.ArgumentParser(description="Store computed features on disk and query them back.")
+    parser.add_argument("directory", help="feature store directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="compute the feature table of WAV files and append it")
+    add.add_argument("paths", nargs="+", help="WAV files or directories containing them")
+    add.add_argument("-f", "--features", nargs="+", default=None, help="feature columns, all by default")
+    add.add_argument("--frame-size", type=int, default=20, help="frame size in ms")
+    add.add_argument("--samplerate", type=int, default=None, help="resample higher-rate files to this rate first")
+    commands.add_parser("list", help="list the stored files")
+    query = commands.add_parser("query", help="print stored frames of one file")
+    query.add_argument("file", help="file name or content hash")
+    query.add_argument("--start", type=float, default=None, help="seconds")
+    query.add_argument("--end", type=float, default=None, help="seconds")
+    query.add_argument("-c", "--columns", nargs="+", default=None)
+    query.add_argument("--channel", type=int, default=0)
+    return parser.parse_args(arguments)
+
+def main(arguments=None):
+    args = parse_arguments(arguments)
+    store = FeatureStore(args.directory)
+    if args.command == "add":
+        from batch import find_files
+        add_files(store, find_files(args.paths), args.frame_size, args.features, args.samplerate)
+    elif args.command == "list":
+        for entry in store.get_entries():
+            groups = ", ".join(f"{group} {info['length']}" for group, info in entry["groups"].items())
+            print(f"{entry['file']:<32} {entry['key'][:12]}  {entry['samplerate']} Hz  {entry['channel_count']} ch"
+                  f"  frame {entry['frame_size']}/{entry['hop_size']}  {groups}")
+    else:
+        values = store.get_frames(args.file, args.start, args.end, args.columns, args.channel)
+        names = [name for name in values if name != "frame"]
+        print(",".join(["frame"] + names))
+        for i, frame in enumerate(values["frame"]):
+            print(",".join([str(frame)] + [f"{values[name][i]:.6g}" for name in names]))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+import sys
+import argparse
+import numpy as np
+from audio_analysis import (calculate_frame_energy, calculate_frame_zero_crossing_rate, get_data_length, get_frame_size,
+                            get_hop_size, iter_frame_blocks, normalize_data, center_samples)
+from stft import get_window, get_bin_frequencies
+from feature_cache import feature_cache
+from instrumentation import instrumentation
+
+feature_labels = {
+    "energy": "Energy",
+    "zcr": "Zero-Crossing Rate",
+    "rms": "RMS",
+    "centroid": "Spectral centroid, Hz",
+    "bandwidth": "Spectral bandwidth, Hz",
+    "rolloff": "Spectral roll-off, Hz",
+    "flatness": "Spectral flatness",
+    "flux": "Spectral flux",
+    "bands": "Band energy"
+}
+
+spectral_features = {"centroid", "bandwidth", "rolloff", "flatness", "flux", "bands"}
+
+default_bands = (0, 250, 500, 1000, 2000, 4000, 8000)
+
+def get_band_edges(samplerate, bands=default_bands):
+    edges = [edge for edge in bands if edge < samplerate/2] + [samplerate/2]
+    return list(zip(edges[:-1], edges[1:]))
+
+def get_columns(features, samplerate, bands=default_bands):
+    columns = []
+    for feature in features:
+        if feature == "bands":
+            columns.extend(f"band_{low:g}_{high:g}" for low, high in get_band_edges(samplerate, bands))
+        else:
+            columns.append(feature)
+    return columns
+
+def get_feature_label(column):
+    return feature_labels["bands"] + f", {column[5:].replace('_', '-')} Hz" if column.startswith("band_") \
+        else feature_labels[column]
+
+class FeatureExtractor:
+
+    def __init__(self, samplerate, frame_size, hop_size, features=None, window="hann", rolloff=0.85,
+                 bands=default_bands):
+        self.features = list(feature_labels) if features is None else list(features)
+        unknown = set(self.features) - set(feature_labels)
+        if unknown:
+            raise ValueError(f"Unknown features: {', '.join(sorted(unknown))}")
+        self.samplerate = samplerate
+        self.frame_size = frame_size
+        self.hop_size = hop_size
+        self.rolloff = rolloff
+        self.columns = get_columns(self.features, samplerate, bands)
+        self.spectral = bool(spectral_features & set(self.features))
+        self.window = get_window(window, frame_size)
+        self.frequencies = get_bin_frequencies(frame_size, samplerate)
+        edges = get_band_edges(samplerate, bands)
+        self.band_starts = np.searchsorted(self.frequencies, [low for low, _ in edges])
+        self.band_ends = np.searchsorted(self.frequencies, [high for _, high in edges[:-1]] + [np.inf])
+        self.previous = None
+
+    def get_spectral_values(self, frames, values):
+        # one rFFT per frame, every spectral column is a reduction over its bins
+        magnitudes = np.abs(np.fft.rfft(frames*self.window))
+        power = magnitudes**2
+        total = power.sum(axis=-1)
+        silent = total == 0
+        total[silent] = 1
+        if "centroid" in self.features or "bandwidth" in self.features:
+            centroid = power @ self.frequencies/total
+            values["centroid"] = centroid
+            if "bandwidth" in self.features:
+                deviation = (self.frequencies - centroid[..., np.newaxis])**2
+                values["bandwidth"] = np.sqrt(np.einsum('...i,...i->...', power, deviation)/total)
+        if "rolloff" in self.features or "bands" in self.features:
+            cumulative = np.zeros(power.shape[:-1] + (power.shape[-1] + 1,))
+            np.cumsum(power, axis=-1, out=cumulative[..., 1:])
+        if "rolloff" in self.features:
+            below = cumulative[..., 1:] < self.rolloff*total[..., np.newaxis]
+            values["rolloff"] = self.frequencies[np.minimum(below.sum(axis=-1), len(self.frequencies) - 1)]
+        if "flatness" in self.features:
+            floor = power + 1e-20
+            values["flatness"] = np.exp(np.log(floor).mean(axis=-1))/floor.mean(axis=-1)
+        if "flux" in self.features:
+            # the last frame of the previous block carries the difference across blocks
+            previous = magnitudes[..., :1, :] if self.previous is None else self.previous
+            shifted = np.concatenate((previous, magnitudes[..., :-1, :]), axis=-2)
+            values["flux"] = np.sqrt(((magnitudes - shifted)**2).sum(axis=-1))
+            self.previous = magnitudes[..., -1:, :]
+        if "bands" in self.features:
+            band_energy = cumulative[..., self.band_ends] - cumulative[..., self.band_starts]
+            for i, column in enumerate(column for column in self.columns if column.startswith("band_")):
+                values[column] = band_energy[..., i]
+        for column in ("centroid", "bandwidth", "rolloff"):
+            if column in values:
+                values[column][silent] = 0
+
+    def process(self, frames):
+        values = {}
+        if "energy" in self.features or "rms" in self.features:
+            squares = calculate_frame_energy(frames)
+            values["squares"] = squares
+            values["sums"] = frames.sum(axis=-1, dtype=float)
+            values["rms"] = np.sqrt(squares/self.frame_size)
+        if "zcr" in self.features:
+            values["zcr"] = calculate_frame_zero_crossing_rate(frames)
+        if self.spectral:
+            self.get_spectral_values(frames, values)
+        return values
+
+def get_table_dtype(columns):
+    return np.dtype([("frame", np.int64), ("time", float)] + [(column, float) for column in columns])
+
+def extract_features(data, samplerate, frame_size, hop_size, features=None, frames_per_block=1024, **parameters):
+    # one pass over the samples: every block is framed once and feeds all columns,
+    # energy is normalized at the end with the range seen on the way
+    extractor = FeatureExtractor(samplerate, frame_size, hop_size, features, **parameters)
+    channel_count = data.shape[0] if isinstance(data, np.ndarray) else data.channel_count
+    value_limits = [np.full((channel_count, 1), np.inf), np.full((channel_count, 1), -np.inf)]
+
+    def track_range(block):
+        block = center_samples(block)
+        if block.shape[-1] > 0:
+            value_limits[0] = np.minimum(value_limits[0], block.min(axis=-1, keepdims=True))
+            value_limits[1] = np.maximum(value_limits[1], block.max(axis=-1, keepdims=True))
+        return block
+
+    parts = []
+    frame_count = 0
+    for frames in iter_frame_blocks(data, frame_size, hop_size, frames_per_block, track_range):
+        if frames.shape[-2] > 0:
+            parts.append(extractor.process(frames))
+            frame_count += frames.shape[-2]
+
+    length = get_data_length(data)
+    table = np.zeros((channel_count, frame_count), dtype=get_table_dtype(extractor.columns))
+    table["frame"] = np.arange(frame_count)
+    # the last frame may be shifted back to end with the signal
+    table["time"] = np.minimum(np.arange(frame_count)*hop_size, max(length - frame_size, 0))/samplerate
+    if frame_count == 0:
+        return table
+    values = {name: np.concatenate([part[name] for part in parts], axis=-1) for name in parts[0]}
+    if "energy" in extractor.columns:
+        minimum, maximum = value_limits
+        value_range = maximum - minimum
+        value_range[value_range == 0] = 1
+        # a file shorter than a frame has zero padding, which adds nothing after normalization
+        sample_count = min(frame_size, length)
+        energy = (values["squares"] - 2*minimum*values["sums"] + sample_count*minimum**2)/value_range**2
+        values["energy"] = normalize_data(energy)
+    for column in extractor.columns:
+        table[column] = values[column]
+    return table
+
+def extract_channel_features(data, samplerate, frame_size, hop_size, features, parameters):
+    return extract_features(data, samplerate, frame_size, hop_size, features, **parameters)
+
+def get_feature_table(file, frame_size_in_ms=20, features=None, cache=feature_cache, executor=None, frame_overlap=0.5,
+                      **parameters):
+    frame_size = get_frame_size(frame_size_in_ms, file.samplerate)
+    hop_size = get_hop_size(frame_size, frame_overlap)
+    features = list(feature_labels) if features is None else list(features)
+
+    def compute():
+        with instrumentation.stage("features", file.file_name, features=features):
+            if executor is None or file.channel_count == 1:
+                data = file.channels if file.source is None else file.source
+                table = extract_features(data, file.samplerate, frame_size, hop_size, features, **parameters)
+            else:
+                # channels are independent, so their tables are stacked in channel order
+                table = np.concatenate(executor.map_channels(
+                    extract_channel_features, file, file.samplerate, frame_size, hop_size, features, parameters))
+        return {"table": table}
+
+    if cache is None:
+        return compute()["table"]
+    cache_parameters = {"values": "features", "features": features, "frame_size": frame_size,
+                        "hop_size": hop_size, **parameters}
+    return cache.get_or_compute(file, cache_parameters, compute)["table"]
+
+def export_feature_table(table, file_path):
+    # one row per channel and frame
+    if file_path.endswith(".npy"):
+        np.save(file_path, table)
+        return
+    channels = np.repeat(np.arange(table.shape[0]), table.shape[1])
+    columns = [channels, table["frame"].ravel()] + [table[name].ravel() for name in table.dtype.names[1:]]
+    formats = ["%d", "%d"] + ["%.6g"]*(len(table.dtype.names) - 1)
+    np.savetxt(file_path, np.column_stack(columns), fmt=formats, delimiter=",",
+               header=",".join(("channel",) + table.dtype.names), comments="")
+
+def parse_arguments(arguments):
+    parser = argparse.ArgumentParser(description="Extract a frame-by-frame feature table from a WAV file.")
+    parser.add_argument("path", help="WAV file")
+    parser.add_argument("-f", "--features", nargs="+", choices=list(feature_labels), default=list(feature_labels))
+    parser.add_argument("--frame-size", type=int, default=20, help="frame size in ms")
+    parser.add_argument("--samplerate", type=int, default=None, help="resample higher-rate files to this rate first")
+    parser.add_argument("-o", "--output", default=None, help="CSV or .npy file, a summary is printed by default")
+    return parser.parse_args(arguments)
+
+def main(arguments=None):
+    from file_data import read_file
+    args = parse_arguments(arguments)
+    file = read_file(args.path, args.samplerate)
+    table = get_feature_table(file, args.frame_size, args.features, cache=None)
+    if args.output is not None:
+        export_feature_table(table, args.output)
+    for column in table.dtype.names[2:]:
+        values = table[column]
+        print(f"{column:<22} mean {values.mean():>14.6g}  min {values.min():>14.6g}  max {values.max():>14.6g}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+import os
+import hashlib
+import numpy as np
+from wav_io import WavSource, ChannelSource
+from audio_analysis import iter_data_blocks
+from resample import resample_data
+from instrumentation import instrumentation
+
+class FileData:
+    __slots__ = ('file_name', 'samplerate', 'bit_depth', 'frame_size_in_ms', 'source', '_samples', '_shared', '_content_hash')
+
+    def __init__(self, file_path, samplerate, data=None, bit_depth=0, source=None):
+        self.file_name = os.path.basename(file_path)
+        self.samplerate = samplerate
+        self.source = source
+        self.frame_size_in_ms = 0
+        self._samples = None
+        self._shared = False
+        self._content_hash = None
+        if data is not None:
+            self.set_samples(data)
+        self.bit_depth = bit_depth if bit_depth > 0 else self.channels.dtype.itemsize * 8
+
+    def set_samples(self, data):
+        data = np.asarray(data)
+        if data.ndim == 1:
+            data = data[np.newaxis]
+        self._samples = np.ascontiguousarray(data)
+        self._shared = False
+        self._content_hash = None
+
+    @property
+    def channels(self):
+        # samples are read from the source only when something needs them; a mapped
+        # source already holds them in their own type, so its channel-major view is
+        # used as it is and copied only when the samples are written. With more than
+        # one channel that view is the transposed interleaved file, so its rows are
+        # strided, not contiguous; it is kept that way rather than copied, since a
+        # copy would load the whole file, and the block readers make each block
+        # contiguous before framing it
+        if self._samples is None:
+            if self.source.is_mapped:
+                self._samples = self.source.get_channels()
+                self._shared = True
+            else:
+                self.set_samples(self.source.get_channels())
+        return self._samples
+
+    @property
+    def data(self):
+        return self.channels[0] if self.channel_count == 1 else self.channels
+
+    @property
+    def channel_count(self):
+        if self._samples is None:
+            return self.source.channel_count
+        return self._samples.shape[0]
+
+    @property
+    def length(self):
+        if self._samples is None:
+            return self.source.length
+        return self._samples.shape[1]
+
+    @property
+    def duration(self):
+        return self.length/self.samplerate
+
+    def set_data(self, data):
+        self.set_samples(data)
+        self.source = None
+
+    def get_writable_data(self):
+        if self._shared or not self.channels.flags.writeable:
+            self.set_samples(self.channels.copy())
+        # the samples are about to differ from the file they were read from
+        self.source = None
+        self._content_hash = None
+        return self.data
+
+    def share(self, samples, source=None):
+        new_file = FileData.__new__(FileData)
+        new_file.file_name = self.file_name
+        new_file.samplerate = self.samplerate
+        new_file.bit_depth = self.bit_depth
+        new_file.frame_size_in_ms = self.frame_size_in_ms
+        new_file.source = source
+        new_file._samples = None
+        new_file._content_hash = None
+        new_file._shared = samples is not None
+        if samples is not None:
+            new_file._samples = samples.view()
+            new_file._samples.flags.writeable = False
+        return new_file
+
+    def clone(self):
+        # copy-on-write: both objects keep a read-only view of the same buffer
+        # until one of them asks for writable data
+        if self._samples is not None:
+            self._samples = self._samples.view()
+            self._samples.flags.writeable = False
+            self._shared = True
+        new_file = self.share(self._samples, self.source)
+        new_file._content_hash = self._content_hash
+        return new_file
+
+    def get_content_hash(self, block_size=2**20):
+        if self._content_hash is None:
+            content = hashlib.blake2b(digest_size=20)
+            data = self.source if self._samples is None else self.channels
+            content.update(f"{self.samplerate}:{data.dtype}:{self.channel_count}:{self.length}".encode())
+            for _, block in iter_data_blocks(data, block_size):
+                content.update(np.ascontiguousarray(block))
+            self._content_hash = content.hexdigest()
+        return self._content_hash
+
+    def get_interval(self, start_index, end_index):
+        # a view of the loaded samples, or of the mapped file when nothing is loaded
+        if self._samples is None:
+            return self.share(self.source.read_block(start_index, end_index))
+        return self.share(self.channels[:, start_index:end_index])
+
+    def get_channel(self, index):
+        return self.share(self.channels[index:index + 1])
+
+    def get_channel_data(self, index):
+        # one channel as a block source, without loading the others
+        if self._samples is None:
+            return ChannelSource(self.source, index)
+        return self.channels[index:index + 1]
+
+    def get_segments(self, table, all_channels=False):
+        # read-only views, straight into the mapped file when nothing is loaded yet
+        segments = []
+        for row in table:
+            if self._samples is None:
+                samples = self.source.read_block(row["start"], row["end"])
+            else:
+                samples = self.channels[:, row["start"]:row["end"]]
+            if not all_channels:
+                samples = samples[row["channel"]:row["channel"] + 1]
+            segments.append(self.share(samples))
+        return segments
+
+    def set_frame_size(self, frame=0):
+        if frame == 0:
+            self.frame_size_in_ms = int(input("Enter frame size in ms.\n> "))
+        else:
+            self.frame_size_in_ms = frame
+
+def read_file(file_path, samplerate=None):
+    # with a lower samplerate the file is resampled block by block as it is read,
+    # and everything downstream works at that rate
+    source = WavSource(file_path)
+    if samplerate is None or samplerate >= source.samplerate:
+        return FileData(file_path, source.samplerate, bit_depth=source.bit_depth, source=source)
+    with instrumentation.stage("resample", source.file_name, samplerate=samplerate):
+        data = resample_data(source, source.samplerate, samplerate)
+    return FileData(file_path, samplerate, data=data, bit_depth=source.bit_depth)
@@ -0,0 +1,50 @@
+from functools import lru_cache
+import numpy as np
+
+filter_kinds = ["lowpass", "highpass", "bandpass", "notch"]
+
+@lru_cache(maxsize=32)
+def design_sos(kind, cutoff, samplerate, order=4, quality=30.0):
+    from scipy import signal
+    if kind == "notch":
+        b, a = signal.iirnotch(cutoff, quality, fs=samplerate)
+        return signal.tf2sos(b, a)
+    return signal.butter(order, cutoff, btype=kind, fs=samplerate, output='sos')
+
+class BlockFilter:
+
+    def __init__(self, sos, channel_count):
+        self.sos = sos
+        # one pair of delay values per section and channel, carried between blocks
+        self.state = np.zeros((sos.shape[0], channel_count, 2))
+
+    def process(self, block):
+        from scipy import signal
+        block = np.atleast_2d(np.asarray(block, dtype=float))
+        output, self.state = signal.sosfilt(self.sos, block, axis=-1, zi=self.state)
+        return output
+
+    def flush(self):
+        return np.zeros((self.state.shape[1], 0))
+
+class FilterDesign:
+
+    def __init__(self, kind, cutoff, order=4, quality=30.0):
+        if kind not in filter_kinds:
+            raise ValueError(f"Unknown filter type '{kind}'")
+        self.kind = kind
+        self.cutoff = tuple(cutoff) if np.ndim(cutoff) else cutoff
+        self.order = order
+        self.quality = quality
+
+    def get_sos(self, samplerate):
+        return design_sos(self.kind, self.cutoff, samplerate, self.order, self.quality)
+
+    def create(self, samplerate, channel_count):
+        return BlockFilter(self.get_sos(samplerate), channel_count)
+
+def filter_blocks(blocks, processors):
+    for block in blocks:
+        for processor in processors:
+            block = processor.process(block)
+        yield block
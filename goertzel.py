@@ -0,0 +1,299 @@
+import sys
+import argparse
+import numpy as np
+from audio_analysis import frame_signal, get_frame_size, get_hop_size, iter_data_blocks, center_samples
+from feature_cache import feature_cache
+from instrumentation import instrumentation
+from wav_io import get_sample_scale
+
+dtmf_low = (697, 770, 852, 941)
+dtmf_high = (1209, 1336, 1477, 1633)
+dtmf_keys = ("123A", "456B", "789C", "*0#D")
+
+class GoertzelBank:
+
+    def __init__(self, frequencies, samplerate, frame_size):
+        # not the Goertzel recursion itself: the bank evaluates the DFT of each frame
+        # directly at its frequencies, as one product of the frames with a cosine/sine
+        # basis. That is the value a Goertzel filter holds after N samples, at the same
+        # O(N) per frequency, but all frames and frequencies go through a single matmul
+        # instead of a per-sample loop in Python
+        self.frequencies = np.asarray(frequencies, dtype=float)
+        self.samplerate = samplerate
+        self.frame_size = frame_size
+        phases = 2*np.pi*np.outer(np.arange(frame_size), self.frequencies/samplerate)
+        self.basis = np.concatenate((np.cos(phases), np.sin(phases)), axis=-1)
+
+    def get_amplitudes(self, frames):
+        # amplitude of a sine at each frequency, in the units of the samples
+        products = np.asarray(frames, dtype=float) @ self.basis
+        count = len(self.frequencies)
+        return 2*np.hypot(products[..., :count], products[..., count:])/self.frame_size
+
+class FrameStream:
+
+    def __init__(self, channel_count, frame_size, hop_size, offset=0.0):
+        # keeps the samples of a frame that is not complete yet, so blocks of any size
+        # give the same frames as framing the whole signal; unsigned samples are
+        # centred on the way in
+        self.frame_size = frame_size
+        self.hop_size = hop_size
+        self.offset = offset
+        self.pending = np.zeros((channel_count, 0))
+        self.frame_index = 0
+
+    def process(self, block):
+        data = np.concatenate((self.pending, np.atleast_2d(block) - self.offset), axis=-1)
+        frames = frame_signal(data, self.frame_size, self.hop_size, tail="drop")
+        frame_count = frames.shape[-2]
+        self.pending = data[:, frame_count*self.hop_size:]
+        first = self.frame_index
+        self.frame_index += frame_count
+        return first, frames
+
+class RunTracker:
+
+    def __init__(self, row_count):
+        # label -1 means nothing detected; a run is a stretch of frames with the same label
+        self.labels = np.full(row_count, -1)
+        self.starts = np.zeros(row_count, dtype=int)
+
+    def process(self, labels, first_frame):
+        # returns the runs that ended inside these frames as (row, label, start, stop)
+        runs = []
+        if labels.shape[-1] == 0:
+            return runs
+        extended = np.concatenate((self.labels[:, np.newaxis], labels), axis=-1)
+        for row, frame in zip(*np.nonzero(np.diff(extended, axis=-1))):
+            frame = first_frame + frame
+            if self.labels[row] >= 0:
+                runs.append((int(row), int(self.labels[row]), int(self.starts[row]), int(frame)))
+            self.labels[row] = labels[row, frame - first_frame]
+            self.starts[row] = frame
+        runs.sort(key=lambda run: (run[2], run[0]))
+        return runs
+
+    def flush(self, frame_count):
+        runs = [(int(row), int(self.labels[row]), int(self.starts[row]), frame_count)
+                for row in np.nonzero(self.labels >= 0)[0]]
+        self.labels[:] = -1
+        return runs
+
+def get_run_event(run, frame_size, hop_size, samplerate):
+    row, label, start, stop = run
+    # a run starts where its first frame starts and ends where its last frame ends
+    end = (stop - 1)*hop_size + frame_size
+    return {"channel": row, "start": start*hop_size/samplerate, "end": end/samplerate,
+            "start_frame": start, "frame_count": stop - start}
+
+def get_minimum_frames(min_duration_in_ms, frame_size, hop_size, samplerate):
+    return max(int(np.ceil((min_duration_in_ms*samplerate/1000 - frame_size)/hop_size)) + 1, 1)
+
+class ToneDetector:
+
+    def __init__(self, frequencies, samplerate, channel_count, frame_size_in_ms=25, frame_overlap=0.5,
+                 min_level=0.01, min_ratio=0.5, min_duration_in_ms=40, dtype=np.int16):
+        self.frame_size = get_frame_size(frame_size_in_ms, samplerate)
+        self.hop_size = get_hop_size(self.frame_size, frame_overlap)
+        self.samplerate = samplerate
+        self.channel_count = channel_count
+        self.bank = GoertzelBank(frequencies, samplerate, self.frame_size)
+        offset, scale = get_sample_scale(dtype)
+        self.frames = FrameStream(channel_count, self.frame_size, self.hop_size, offset)
+        # a tone counts when it is above min_level of full scale and carries at
+        # least min_ratio of the frame's power
+        self.min_amplitude = min_level*scale
+        self.min_ratio = min_ratio
+        self.min_frames = get_minimum_frames(min_duration_in_ms, self.frame_size, self.hop_size, samplerate)
+        self.runs = RunTracker(channel_count*len(self.bank.frequencies))
+
+    def get_power(self, frames):
+        frames = np.asarray(frames, dtype=float)
+        return np.einsum('...i,...i->...', frames, frames)/self.frame_size
+
+    def get_detections(self, frames):
+        amplitudes = self.bank.get_amplitudes(frames)
+        power = self.get_power(frames)[..., np.newaxis]
+        # a sine of amplitude A has a mean square of A^2/2
+        detected = (amplitudes >= self.min_amplitude) & (amplitudes**2/2 >= self.min_ratio*power)
+        return amplitudes, detected
+
+    def get_events(self, runs):
+        events = []
+        frequency_count = len(self.bank.frequencies)
+        for run in runs:
+            if run[3] - run[2] < self.min_frames:
+                continue
+            event = get_run_event(run, self.frame_size, self.hop_size, self.samplerate)
+            event["channel"], frequency = divmod(run[0], frequency_count)
+            event["frequency"] = float(self.bank.frequencies[frequency])
+            events.append(event)
+        return events
+
+    def process(self, block):
+        first, frames = self.frames.process(block)
+        amplitudes, detected = self.get_detections(frames)
+        # rows are (channel, frequency) pairs so each tone has its own runs
+        labels = np.where(detected, 0, -1).transpose(0, 2, 1).reshape(len(self.runs.labels), frames.shape[-2])
+        return {
+            "frames": first + np.arange(frames.shape[-2]),
+            "amplitudes": amplitudes,
+            "events": self.get_events(self.runs.process(labels, first))
+        }
+
+    def flush(self):
+        return self.get_events(self.runs.flush(self.frames.frame_index))
+
+class DTMFDecoder(ToneDetector):
+
+    def __init__(self, samplerate, channel_count, frame_size_in_ms=25, frame_overlap=0.5, min_level=0.01,
+                 min_ratio=0.5, min_duration_in_ms=40, max_twist_in_db=8, dtype=np.int16):
+        super().__init__(dtmf_low + dtmf_high, samplerate, channel_count, frame_size_in_ms, frame_overlap,
+                         min_level, min_ratio, min_duration_in_ms, dtype)
+        self.max_twist = 10**(max_twist_in_db/20)
+        self.runs = RunTracker(channel_count)
+
+    def get_keys(self, frames):
+        # the strongest tone of each group, accepted when both are loud enough,
+        # of similar level and together carry min_ratio of the frame's power
+        amplitudes = self.bank.get_amplitudes(frames)
+        low, high = amplitudes[..., :4], amplitudes[..., 4:]
+        row, column = low.argmax(axis=-1), high.argmax(axis=-1)
+        low, high = low.max(axis=-1), high.max(axis=-1)
+        twist = np.maximum(low, high)/np.maximum(np.minimum(low, high), 1e-12)
+        detected = (np.minimum(low, high) >= self.min_amplitude) & (twist <= self.max_twist) \
+            & ((low**2 + high**2)/2 >= self.min_ratio*self.get_power(frames))
+        return amplitudes, np.where(detected, 4*row + column, -1)
+
+    def get_events(self, runs):
+        events = []
+        for run in runs:
+            if run[3] - run[2] < self.min_frames:
+                continue
+            event = get_run_event(run, self.frame_size, self.hop_size, self.samplerate)
+            event["digit"] = dtmf_keys[run[1]//4][run[1] % 4]
+            events.append(event)
+        return events
+
+    def process(self, block):
+        first, frames = self.frames.process(block)
+        amplitudes, keys = self.get_keys(frames)
+        return {
+            "frames": first + np.arange(frames.shape[-2]),
+            "amplitudes": amplitudes,
+            "events": self.get_events(self.runs.process(keys, first))
+        }
+
+dtmf_event_dtype = np.dtype([
+    ("channel", np.int64),
+    ("digit", "U1"),
+    ("start", float),
+    ("end", float)
+])
+
+def get_dtmf_table(events):
+    table = np.zeros(len(events), dtype=dtmf_event_dtype)
+    for i, event in enumerate(events):
+        table[i] = (event["channel"], event["digit"], event["start"], event["end"])
+    return table
+
+def export_dtmf_table(table, file_path):
+    np.savetxt(file_path, table, fmt=["%d", "%s", "%.4f", "%.4f"], delimiter=",",
+               header=",".join(dtmf_event_dtype.names), comments="")
+
+def detect_blocks(detector, blocks):
+    events = []
+    for block in blocks:
+        events.extend(detector.process(block)["events"])
+    events.extend(detector.flush())
+    return events
+
+def get_source_data(file):
+    return file.channels if file.source is None else file.source
+
+def decode_dtmf(file, block_size=2**16, **parameters):
+    data = get_source_data(file)
+    decoder = DTMFDecoder(file.samplerate, file.channel_count, dtype=data.dtype, **parameters)
+    with instrumentation.stage("dtmf", file.file_name):
+        return detect_blocks(decoder, (block for _, block in iter_data_blocks(data, block_size)))
+
+def detect_tones(file, frequencies, block_size=2**16, **parameters):
+    data = get_source_data(file)
+    detector = ToneDetector(frequencies, file.samplerate, file.channel_count, dtype=data.dtype, **parameters)
+    with instrumentation.stage("tones", file.file_name):
+        return detect_blocks(detector, (block for _, block in iter_data_blocks(data, block_size)))
+
+def get_tone_amplitudes(file, frequencies, frame_size_in_ms=25, frame_overlap=0.5, cache=feature_cache,
+                        frames_per_block=1024):
+    # per-frame amplitudes of only the requested frequencies, (channels, frames, frequencies)
+    frame_size = get_frame_size(frame_size_in_ms, file.samplerate)
+    hop_size = get_hop_size(frame_size, frame_overlap)
+    frequencies = [float(frequency) for frequency in frequencies]
+    data = get_source_data(file)
+    offset = get_sample_scale(data.dtype)[0]
+
+    def compute():
+        bank = GoertzelBank(frequencies, file.samplerate, frame_size)
+        parts = [np.zeros((file.channel_count, 0, len(frequencies)))]
+        with instrumentation.stage("goertzel", file.file_name, frequencies=frequencies):
+            for _, block in iter_data_blocks(data, frames_per_block*hop_size, frame_size - hop_size):
+                block = center_samples(np.ascontiguousarray(block))
+                frames = frame_signal(block, frame_size, hop_size, tail="drop")
+                if frames.shape[-2] > 0:
+                    parts.append(bank.get_amplitudes(frames))
+        return {"amplitudes": np.concatenate(parts, axis=-2)}
+
+    if cache is None:
+        return compute()["amplitudes"]
+    cache_parameters = {"values": "goertzel", "frequencies": frequencies, "frame_size": frame_size,
+                        "hop_size": hop_size, "offset": offset}
+    return cache.get_or_compute(file, cache_parameters, compute)["amplitudes"]
+
+def parse_arguments(arguments):
+    parser = argparse.ArgumentParser(description="Decode DTMF digits or find known tones in a WAV file.")
+    parser.add_argument("path", help="WAV file")
+    parser.add_argument("-t", "--tones", nargs="+", type=float, default=None,
+                        help="frequencies in Hz to look for instead of DTMF digits")
+    parser.add_argument("--frame-size", type=int, default=25, help="frame size in ms")
+    parser.add_argument("--min-level", type=float, default=0.01, help="minimum tone amplitude relative to full scale")
+    parser.add_argument("--min-duration", type=float, default=40, help="minimum tone duration in ms")
+    parser.add_argument("--stream", action="store_true", help="replay the file as a live feed, block by block")
+    parser.add_argument("--block-size", type=int, default=1024, help="samples per block with --stream")
+    parser.add_argument("--realtime", action="store_true", help="deliver blocks at the file's samplerate")
+    return parser.parse_args(arguments)
+
+def print_event(event):
+    name = event["digit"] if "digit" in event else f"{event['frequency']:g} Hz"
+    print(f"{event['start']:>10.3f} - {event['end']:.3f} s  channel {event['channel']}  {name}")
+
+def main(arguments=None):
+    from wav_io import WavSource
+    from streaming import replay_wav
+    args = parse_arguments(arguments)
+    source = WavSource(args.path)
+    parameters = {"frame_size_in_ms": args.frame_size, "min_level": args.min_level,
+                  "min_duration_in_ms": args.min_duration, "dtype": source.dtype}
+    if args.tones is None:
+        detector = DTMFDecoder(source.samplerate, source.channel_count, **parameters)
+    else:
+        detector = ToneDetector(args.tones, source.samplerate, source.channel_count, **parameters)
+    if args.stream:
+        blocks = replay_wav(args.path, args.block_size, args.realtime)
+    else:
+        blocks = (block for _, block in source.iter_blocks(2**16))
+    events = []
+    for block in blocks:
+        # events are printed as soon as a tone ends
+        for event in detector.process(block)["events"]:
+            print_event(event)
+            events.append(event)
+    for event in detector.flush():
+        print_event(event)
+        events.append(event)
+    if args.tones is None:
+        for channel in range(source.channel_count):
+            print(f"channel {channel}: {''.join(event['digit'] for event in events if event['channel'] == channel)}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,30 +1,88 @@
 import numpy as np
-from scipy.io import wavfile
 from plot_data import new_plot
-from audio_effects import get_fade_data
-from audio_analysis import get_energy, get_zcr, get_normalized_data_frames, get_data_frames, find_segments, normalize_data
+from audio_effects import get_fade_data, apply_fade
+from audio_analysis import get_energy, get_normalized_zcr, normalize_data, get_normalized_data_frame_blocks, get_data_frame_blocks
+from audio_analysis import get_frame_size, get_hop_size, get_segment_table, get_segment_frames
+from feature_cache import feature_cache
+from feature_index import feature_indexes
+from features import get_feature_table, get_feature_label
+from instrumentation import instrumentation
+from export import export_file
 from abc import ABC, abstractmethod
 
+def calculate_channel_values(data, get_frames, calculate, samplerate, frame_size_in_ms):
+    return calculate(get_frames(data, samplerate, frame_size_in_ms))
+
 class PlotData(ABC):
 
+    value_name = ""
+    calculate = None
+
+    def __init__(self, frame_size_in_ms=0, cache=feature_cache, executor=None, indexes=feature_indexes):
+        self.frame_size_in_ms = frame_size_in_ms
+        self.cache = cache
+        self.executor = executor
+        self.indexes = indexes
+
     def plot_data(self, file, get_frames, plot):
-        self.set_frame_size(file)
-        self.get_data_frames(file, get_frames)
-        self.set_values(file)
-        self.set_segments(file)
-        self.plot_values(file, plot)
+        with instrumentation.stage(type(self).__name__, file.file_name):
+            self.set_frame_size(file)
+            with instrumentation.stage("values") as stage:
+                self.set_cached_values(file, get_frames)
+                stage.add_array(self.value_name, getattr(self, self.value_name))
+            with instrumentation.stage("segments"):
+                self.set_segments(file)
+            with instrumentation.stage("plot"):
+                self.plot_values(file, plot)
+
+    def get_cache_parameters(self, file, get_frames):
+        return {
+            "values": type(self).__name__,
+            "frames": get_frames.__name__,
+            "frame_size_in_ms": file.frame_size_in_ms,
+            "frame_overlap": 0.5
+        }
+
+    def calculate_from_index(self, index, frame_size, hop_size):
+        return None
+
+    def get_values(self, file, get_frames):
+        # the on-disk index, where a directory is set, answers any frame size without framing the samples again
+        index = None if self.indexes is None else self.indexes.get(file, self.executor)
+        frame_size = get_frame_size(file.frame_size_in_ms, file.samplerate)
+        # a file shorter than one frame is zero-padded, which only framing does
+        if index is not None and file.length >= frame_size:
+            values = self.calculate_from_index(index, frame_size, get_hop_size(frame_size))
+            if values is not None:
+                return values
+        if self.executor is None or file.channel_count == 1:
+            self.get_data_frames(file, get_frames)
+            return self.calculate(self.data_frames)
+        # every channel is framed and normalized on its own, so splitting them
+        # across workers gives the same values
+        return np.concatenate(self.executor.map_channels(
+            calculate_channel_values, file, get_frames, type(self).calculate, file.samplerate, file.frame_size_in_ms))
+
+    def set_cached_values(self, file, get_frames):
+        compute = lambda: {"values": self.get_values(file, get_frames)}
+        if self.cache is None:
+            values = compute()
+        else:
+            values = self.cache.get_or_compute(file, self.get_cache_parameters(file, get_frames), compute)
+        self.set_values(file, np.atleast_2d(values["values"]))
 
     def set_frame_size(self, file):
-        file.set_frame_size()
+        file.set_frame_size(self.frame_size_in_ms)
 
     def get_data_frames(self, file, get_frames):
-        if file.channel_count == 1:
-            self.data_frames = get_frames([file.data], file.samplerate, file.frame_size_in_ms)
+        if file.source is not None:
+            self.data_frames = get_frames(file.source, file.samplerate, file.frame_size_in_ms)
         else:
-            self.data_frames = get_frames(file.data, file.samplerate, file.frame_size_in_ms)
+            self.data_frames = get_frames(file.channels, file.samplerate, file.frame_size_in_ms)
+        self.data_frames = instrumentation.measure_blocks("framing", self.data_frames)
 
     @abstractmethod
-    def set_values(self, file):
+    def set_values(self, file, values):
         pass
 
     @abstractmethod
@@ -36,37 +94,60 @@ class PlotData(ABC):
 
 class PlotEnergy(PlotData):
 
-    def set_values(self, file):
-        self.energy = get_energy(self.data_frames)
-        if file.channel_count == 1:
-            self.energy = self.energy[0]
+    value_name = "energy"
+    calculate = staticmethod(get_energy)
+
+    def calculate_from_index(self, index, frame_size, hop_size):
+        return index.get_energy(frame_size, hop_size)
+
+    def set_values(self, file, values):
+        self.energy = values[0] if file.channel_count == 1 else values
 
     def plot_values(self, file, plot):
         plot(file, self.energy, y_label='Energy')
 
 class PlotZcr(PlotData):
 
-    def set_values(self, file):
-        zcr = get_zcr(self.data_frames)
-        self.normalized_zcr = []
-        for channel in zcr:
-            self.normalized_zcr.append(normalize_data(channel))
-        if file.channel_count == 1:
-            self.normalized_zcr = self.normalized_zcr[0]
+    value_name = "normalized_zcr"
+    calculate = staticmethod(get_normalized_zcr)
+
+    def calculate_from_index(self, index, frame_size, hop_size):
+        return normalize_data(index.get_zcr(frame_size, hop_size))
+
+    def set_values(self, file, values):
+        self.normalized_zcr = values[0] if file.channel_count == 1 else values
 
     def plot_values(self, file, plot):
         plot(file, self.normalized_zcr, y_label='Zero-Crossing Rate')
 
 class PlotSegments(PlotData):
 
-    def set_values(self, file):
-        self.energy = get_energy(self.data_frames)
+    value_name = "energy"
+    calculate = staticmethod(get_energy)
+
+    def __init__(self, frame_size_in_ms=0, step=None, cache=feature_cache, off_step=None,
+                 min_duration_in_ms=0, min_gap_in_ms=0, executor=None, indexes=feature_indexes):
+        super().__init__(frame_size_in_ms, cache, executor, indexes)
+        self.step = step
+        self.off_step = off_step
+        self.min_duration_in_ms = min_duration_in_ms
+        self.min_gap_in_ms = min_gap_in_ms
+
+    def calculate_from_index(self, index, frame_size, hop_size):
+        return index.get_energy(frame_size, hop_size)
+
+    def set_values(self, file, values):
+        self.energy = values
 
     def set_segments(self, file):
-        self.segments = []
-        step = float(input("Enter step size.\n> "))
-        for channel in self.energy:
-            self.segments.append(find_segments(channel, step))
+        step = self.step
+        if step is None:
+            step = float(input("Enter step size.\n> "))
+        frame_size = get_frame_size(file.frame_size_in_ms, file.samplerate)
+        self.segment_table = get_segment_table(
+            self.energy, step, self.off_step, frame_size, get_hop_size(frame_size), file.samplerate,
+            self.min_duration_in_ms/1000, self.min_gap_in_ms/1000, file.length)
+        self.segments = get_segment_frames(self.segment_table, file.channel_count)
         if file.channel_count == 1:
             self.energy = self.energy[0]
             self.segments = self.segments[0]
@@ -74,48 +155,64 @@ class PlotSegments(PlotData):
     def plot_values(self, file, plot):
         plot(file, self.energy, segments=self.segments, y_label='Energy')
 
-def handle_signal(file, plot_type, plot):
+class PlotFeature(PlotData):
+
+    value_name = "values"
+
+    def __init__(self, frame_size_in_ms=0, feature=None, features=None, cache=feature_cache, executor=None):
+        super().__init__(frame_size_in_ms, cache, executor, None)
+        self.feature = feature
+        self.features = features
+
+    def set_cached_values(self, file, get_frames):
+        # every column comes from one cached table, so switching features does not read the file again
+        feature = self.feature
+        if feature is None:
+            feature = input("Enter feature column.\n> ")
+        table = get_feature_table(file, file.frame_size_in_ms, self.features, self.cache, self.executor)
+        if feature not in table.dtype.names[2:]:
+            raise ValueError(f"Unknown feature column '{feature}', expected one of: {', '.join(table.dtype.names[2:])}")
+        self.feature = feature
+        self.set_values(file, np.atleast_2d(table[feature]))
+
+    def set_values(self, file, values):
+        self.values = values[0] if file.channel_count == 1 else values
+
+    def plot_values(self, file, plot):
+        plot(file, self.values, y_label=get_feature_label(self.feature))
+
+plot_types = {
+    "zeroCrossingRatePlot": (PlotZcr, get_data_frame_blocks),
+    "energyPlot": (PlotEnergy, get_normalized_data_frame_blocks),
+    "segmentPlot": (PlotSegments, get_normalized_data_frame_blocks),
+    "featurePlot": (PlotFeature, get_data_frame_blocks)
+}
+
+def handle_signal(file, plot_type, plot, **parameters):
 
     if plot_type == "timePlot":
         plot(file, file.data)
-    
-    elif plot_type == "zeroCrossingRatePlot":
-        new_plot = PlotZcr()
-        new_plot.plot_data(file, get_data_frames, plot)
-        del new_plot
+        return None
 
-    elif plot_type == "energyPlot":
-        new_plot = PlotEnergy()
-        new_plot.plot_data(file, get_normalized_data_frames, plot)
-        del new_plot
+    plot_class, get_frames = plot_types[plot_type]
+    new_plot = plot_class(**parameters)
+    new_plot.plot_data(file, get_frames, plot)
+    return new_plot
 
-    elif plot_type == "segmentPlot":
-        new_plot = PlotSegments()
-        new_plot.plot_data(file, get_normalized_data_frames, plot)
-        del new_plot
+def get_faded_file(file, fade_in_count, fade_out_count, fade_type):
+    new_file = file.clone()
+    new_file.get_writable_data()
+    apply_fade(new_file.channels, fade_in_count, fade_out_count, fade_type)
+    return new_file
 
-def handle_fade(file):
+def handle_fade(file, fade_time=0, fade_type="", output_dir="fade_applied", plot=new_plot.plot_time, fade_out_time=None,
+                **export_options):
 
-    fade_value_count, fade = get_fade_data(file)
-    new_file = file.clone()
+    fade_in_count, fade_out_count, fade_type = get_fade_data(file, fade_time, fade_type, fade_out_time)
+    handle_signal(file, "timePlot", plot)
+
+    new_file = get_faded_file(file, fade_in_count, fade_out_count, fade_type)
+    handle_signal(new_file, "timePlot", plot)
 
-    if file.channel_count == 1:
-        handle_signal(file, "timePlot", new_plot.plot_mono_signal)
-        fade_in_data, fade_out_data = fade(file.data, fade_value_count)
-        new_file_data = (fade_in_data
-                        + list(file.data[fade_value_count:len(file.data)-fade_value_count])
-                        + fade_out_data)
-        new_file.set_data(new_file_data)
-        handle_signal(new_file, "timePlot", new_plot.plot_mono_signal)
-    else:
-        handle_signal(file, "timePlot", new_plot.plot_stereo_signal)
-        for i in range(0, file.channel_count):
-            fade_in_data, fade_out_data = fade(file.data[i], fade_value_count)
-            new_file_data = (fade_in_data
-                            + list(file.data[i][fade_value_count:len(file.data[i])-fade_value_count])
-                            + fade_out_data)
-            new_file.data[i] = new_file_data
-        handle_signal(new_file, "timePlot", new_plot.plot_stereo_signal)
-
-    wavfile.write(f'fade_applied/{file.file_name}', file.samplerate, np.int16(new_file_data))
-    del new_file
+    export_file(new_file, output_dir=output_dir, **export_options)
+    return new_file
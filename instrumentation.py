@@ -0,0 +1,208 @@
+import os
+import json
+import time
+import threading
+import tracemalloc
+import numpy as np
+
+def describe_array(name, array):
+    array = np.asarray(array)
+    return {"name": name, "shape": list(array.shape), "dtype": str(array.dtype), "nbytes": int(array.nbytes)}
+
+class NullStage:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def add_array(self, name, array):
+        pass
+
+null_stage = NullStage()
+
+class Stage:
+
+    def __init__(self, instrumentation, name, file_name, details):
+        self.instrumentation = instrumentation
+        self.record = {"stage": name, "file": file_name, "wall": 0.0, "cpu": 0.0, "allocated_bytes": 0,
+                       "peak_bytes": 0, "calls": 0, "arrays": [], **details}
+        self.peak = 0
+
+    def __enter__(self):
+        self.instrumentation.start_stage(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.instrumentation.stop_stage(self)
+        return False
+
+    def add_array(self, name, array):
+        self.record["arrays"].append(describe_array(name, array))
+
+class Instrumentation:
+
+    def __init__(self):
+        self.enabled = False
+        self.memory = False
+        self.records = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def enable(self, memory=False):
+        # memory tracking goes through tracemalloc, which slows allocations down noticeably
+        self.enabled = True
+        self.memory = memory
+        self.epoch = time.time() - time.perf_counter()
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def disable(self):
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.enabled = False
+        self.memory = False
+
+    def clear(self):
+        with self.lock:
+            self.records = []
+
+    def get_stack(self):
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def stage(self, name, file_name=None, **details):
+        if not self.enabled:
+            return null_stage
+        stack = self.get_stack()
+        if file_name is None and stack:
+            file_name = stack[-1].record["file"]
+        return Stage(self, name, file_name, details)
+
+    def update_peaks(self, stack):
+        # tracemalloc keeps a single peak, so it is folded into every open stage and reset
+        peak = tracemalloc.get_traced_memory()[1]
+        for stage in stack:
+            stage.peak = max(stage.peak, peak)
+        tracemalloc.reset_peak()
+
+    def start_stage(self, stage):
+        stack = self.get_stack()
+        if self.memory:
+            self.update_peaks(stack)
+            stage.memory_start = tracemalloc.get_traced_memory()[0]
+            stage.peak = stage.memory_start
+        stage.parent = stack[-1].record["stage"] if stack else None
+        stage.depth = len(stack)
+        stack.append(stage)
+        stage.wall_start = time.perf_counter()
+        stage.cpu_start = time.thread_time()
+
+    def stop_stage(self, stage):
+        wall = time.perf_counter() - stage.wall_start
+        cpu = time.thread_time() - stage.cpu_start
+        stack = self.get_stack()
+        record = stage.record
+        if self.memory:
+            self.update_peaks(stack)
+            record["allocated_bytes"] += tracemalloc.get_traced_memory()[0] - stage.memory_start
+            record["peak_bytes"] = max(record["peak_bytes"], stage.peak - stage.memory_start)
+        stack.pop()
+        if record["calls"] == 0:
+            record.update(start=self.epoch + stage.wall_start, parent=stage.parent, depth=stage.depth,
+                          pid=os.getpid(), thread=threading.get_ident())
+        record["wall"] += wall
+        record["cpu"] += cpu
+        record["calls"] += 1
+        if not record.get("iterator") and record["calls"] == 1:
+            self.add_record(record)
+
+    def add_record(self, record):
+        with self.lock:
+            self.records.append(record)
+
+    def measure_blocks(self, name, blocks, file_name=None):
+        if not self.enabled:
+            return blocks
+        return self.iter_measured_blocks(name, blocks, file_name)
+
+    def iter_measured_blocks(self, name, blocks, file_name=None):
+        # lazy pipelines do their work inside next(), so every call is timed and
+        # summed into one record, with the block shapes of the first and last block
+        stage = self.stage(name, file_name, iterator=True)
+        iterator = iter(blocks)
+        block_bytes = 0
+        while True:
+            with stage:
+                block = next(iterator, None)
+            if block is None:
+                break
+            block_bytes += getattr(block, "nbytes", 0)
+            if len(stage.record["arrays"]) < 2:
+                stage.add_array("block", block)
+            else:
+                stage.record["arrays"][-1] = describe_array("block", block)
+            yield block
+        stage.record["block_bytes"] = block_bytes
+        if stage.record["calls"]:
+            self.add_record(stage.record)
+
+    def get_records(self):
+        with self.lock:
+            return [dict(record) for record in self.records]
+
+    def get_summary(self, records=None):
+        # self time leaves out nested stages, so the slowest step stands out directly
+        summary = {}
+        records = self.get_records() if records is None else records
+        for record in records:
+            entry = summary.setdefault((record["file"], record["stage"]), {
+                "file": record["file"], "stage": record["stage"], "count": 0, "wall": 0.0, "self_wall": 0.0,
+                "cpu": 0.0, "self_cpu": 0.0, "allocated_bytes": 0, "peak_bytes": 0
+            })
+            entry["count"] += 1
+            entry["wall"] += record["wall"]
+            entry["self_wall"] += record["wall"]
+            entry["cpu"] += record["cpu"]
+            entry["self_cpu"] += record["cpu"]
+            entry["allocated_bytes"] += record["allocated_bytes"]
+            entry["peak_bytes"] = max(entry["peak_bytes"], record["peak_bytes"])
+        for record in records:
+            if record["parent"] is not None and (record["file"], record["parent"]) in summary:
+                parent = summary[(record["file"], record["parent"])]
+                parent["self_wall"] -= record["wall"]
+                parent["self_cpu"] -= record["cpu"]
+        return sorted(summary.values(), key=lambda entry: -entry["self_wall"])
+
+    def write_json_lines(self, file_path, records=None):
+        with open(file_path, "w") as output_file:
+            for record in self.get_records() if records is None else records:
+                output_file.write(json.dumps(record) + "\n")
+
+    def write_trace_events(self, file_path, records=None):
+        # Chrome trace-event format, opens in chrome://tracing and Perfetto
+        events = []
+        for record in self.get_records() if records is None else records:
+            events.append({
+                "name": record["stage"],
+                "cat": record["file"] or "",
+                "ph": "X",
+                "ts": record["start"]*1e6,
+                "dur": record["wall"]*1e6,
+                "pid": record["pid"],
+                "tid": record["thread"],
+                "args": {name: value for name, value in record.items()
+                         if name not in ("stage", "start", "wall", "pid", "thread")}
+            })
+        with open(file_path, "w") as output_file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, output_file)
+
+    def write(self, file_path, output_format="jsonl", records=None):
+        if output_format == "trace":
+            self.write_trace_events(file_path, records)
+        else:
+            self.write_json_lines(file_path, records)
+
+instrumentation = Instrumentation()
@@ -1,51 +1,29 @@
-import os
 import sys
-import copy
-from tkinter import Tk
-from tkinter.filedialog import askopenfilename
-import numpy as np
-from scipy.io import wavfile
+import argparse
+from file_data import read_file
 from handle_data import handle_signal, handle_fade
 from plot_data import new_plot
 from spectrum_analysis import analyze_spectrum
+from export import sample_formats
+from feature_index import feature_indexes, default_index_directory
 from abc import ABC, abstractmethod
 
-class FileData:
-    def __init__(self, file_path, samplerate, data):
-        self.file_name = os.path.basename(file_path)
-        self.samplerate = samplerate
-        self.data = np.array(data, dtype=int)
-        self.bit_depth = data.dtype.itemsize * 8
-        self.duration = len(data)/samplerate
-        self.channel_count = 1 if len(data.shape) < 2 else data.shape[1]
-        self.frame_size_in_ms = 0
-
-    def set_data(self, data):
-        self.data = data
-        self.duration = len(data)/self.samplerate
-
-    def transpose_data(self):
-        if self.channel_count > 1:
-            new_data = np.array(self.data)
-            new_data = np.transpose(new_data)
-            self.data = new_data.tolist()
-
-    def clone(self):
-        return copy.deepcopy(self)
-
-    def set_frame_size(self, frame=0):
-        if frame == 0:
-            self.frame_size_in_ms = int(input("Enter frame size in ms.\n> "))
-        else:
-            self.frame_size_in_ms = frame
-
-root = Tk()
-root.withdraw()
-
-def read_data():
+root = None
+
+def get_root():
+    # Tk is started by the first file dialog, not by importing the menu
+    global root
+    if root is None:
+        from tkinter import Tk
+        root = Tk()
+        root.withdraw()
+    return root
+
+def read_data(samplerate=None):
+    from tkinter.filedialog import askopenfilename
+    get_root()
     file_path = askopenfilename()
-    samplerate, data = wavfile.read(file_path)
-    file = FileData(file_path, samplerate, data)
+    file = read_file(file_path, samplerate)
     root.update()
     return file
 
@@ -53,27 +31,27 @@ class FileProcessing:
 
     _state = None
 
-    def __init__(self, state):
+    def __init__(self, state, export_options=None, samplerate=None):
         self.set_state(state)
         self.file_name = ""
+        self.export_options = export_options or {}
+        self.samplerate = samplerate
     
     def set_state(self, state):
         self._state = state
         self._state.context = self
 
     def init_file(self):
-        file = read_data()
+        file = read_data(self.samplerate)
         self.file = file
         self.file_name = file.file_name
         self.prepare_data()
     
     def prepare_data(self):
         self.plot = new_plot.plot_time
-        if self.file.channel_count > 1:
-            self.file.transpose_data()
     
     def execute_function(self, func):
-        func(self.file)
+        func(self.file, **self.export_options)
 
     def plot_file_data(self, plot_type):
         handle_signal(self.file, plot_type, self.plot)
@@ -141,6 +119,7 @@ class TimeDomainPlotMenu(Dialog):
         "2": "zeroCrossingRatePlot",
         "3": "timePlot",
         "4": "segmentPlot",
+        "5": "featurePlot",
         "0": "fileMenu"
     }
     def print_options(self, file_name):
@@ -149,6 +128,7 @@ class TimeDomainPlotMenu(Dialog):
               "[2] ZCR plot\n",
               "[3] Time plot\n",
               "[4] Segment plot\n",
+              "[5] Feature plot\n",
               "[0] File menu")
 
     def execute_option(self, input):
@@ -158,7 +138,31 @@ class TimeDomainPlotMenu(Dialog):
             self.context.plot_file_data(self.options[input])
         return TimeDomainPlotMenu()
 
+def parse_arguments(arguments):
+    parser = argparse.ArgumentParser(description="Interactive audio analysis menu.")
+    parser.add_argument("--samplerate", type=int, default=None,
+                        help="resample higher-rate files to this rate when they are opened")
+    parser.add_argument("-o", "--output-dir", default=None,
+                        help="directory of exported WAV files, fade_applied/ and spectrum_modified/ by default")
+    parser.add_argument("--export-format", choices=["native"] + list(sample_formats), default="native",
+                        help="sample format of exported WAV files, the source format by default")
+    parser.add_argument("--dither", action="store_true", help="TPDF dither when exporting to fewer bits")
+    parser.add_argument("--no-clip", action="store_true", help="fail on out-of-range samples instead of clipping")
+    parser.add_argument("--index-dir", default=default_index_directory,
+                        help="directory of the energy/ZCR index, so other frame sizes are answered without framing")
+    parser.add_argument("--no-index", action="store_true", help="always frame the samples for energy and ZCR")
+    return parser.parse_args(arguments)
+
+def get_export_options(args):
+    export_options = {"sample_format": args.export_format, "clip": not args.no_clip, "dither": args.dither}
+    if args.output_dir is not None:
+        export_options["output_dir"] = args.output_dir
+    return export_options
+
 if __name__ == "__main__":
-    new_dialog = FileProcessing(MainMenu())
+    args = parse_arguments(sys.argv[1:])
+    if not args.no_index:
+        feature_indexes.set_directory(args.index_dir)
+    new_dialog = FileProcessing(MainMenu(), get_export_options(args), args.samplerate)
     while True:
         new_dialog.choose_option()
@@ -1,15 +1,99 @@
 import os
+import weakref
+from collections import OrderedDict
 from datetime import timedelta
-import matplotlib
-from matplotlib import pyplot as plt
-from matplotlib import patches as mpatches
+from functools import lru_cache
 import numpy as np
+from instrumentation import instrumentation
 
 font = {'size': 11}
-matplotlib.rc('font', **font)
+
+@lru_cache(maxsize=None)
+def load_matplotlib():
+    # matplotlib is imported by the first plot, runs that only analyse never load it
+    import matplotlib
+    matplotlib.rc('font', **font)
+    return matplotlib
+
+def get_pyplot():
+    load_matplotlib()
+    from matplotlib import pyplot
+    return pyplot
+
+class EnvelopePyramid:
+
+    def __init__(self, data, base_size=16, min_length=256):
+        # level k keeps the min and max of every base_size*2**k samples; the samples
+        # themselves are not kept, so the pyramid never pins the buffer it was built from
+        data = np.atleast_2d(data)
+        self.length = data.shape[-1]
+        self.bucket_sizes = [1]
+        self.levels = [None]
+        bucket_count = -(-self.length//base_size)
+        starts = np.arange(bucket_count)*base_size
+        minimum = np.minimum.reduceat(data, starts, axis=-1)
+        maximum = np.maximum.reduceat(data, starts, axis=-1)
+        bucket_size = base_size
+        while True:
+            self.bucket_sizes.append(bucket_size)
+            self.levels.append((minimum, maximum))
+            if minimum.shape[-1] < 2*min_length:
+                break
+            starts = np.arange(0, minimum.shape[-1], 2)
+            minimum = np.minimum.reduceat(minimum, starts, axis=-1)
+            maximum = np.maximum.reduceat(maximum, starts, axis=-1)
+            bucket_size *= 2
+
+    def get_envelope(self, data, columns):
+        # coarsest level that still has a few buckets per output column, the
+        # samples passed in stand for the finest one
+        level = 0
+        for i, bucket_size in enumerate(self.bucket_sizes):
+            if self.length/bucket_size >= 4*columns:
+                level = i
+        bucket_size = self.bucket_sizes[level]
+        if level == 0:
+            data = np.atleast_2d(data)
+            minimum, maximum = data, data
+        else:
+            minimum, maximum = self.levels[level]
+        bounds = np.linspace(0, self.length, columns + 1).astype(int)
+        starts = np.unique(bounds[:-1]//bucket_size)
+        minimum = np.minimum.reduceat(minimum, starts, axis=-1)
+        maximum = np.maximum.reduceat(maximum, starts, axis=-1)
+        sample_bounds = np.append(starts*bucket_size, self.length)
+        return sample_bounds, minimum, maximum
 
 class PlotTools:
 
+    def __init__(self, cached_envelopes=8):
+        self.envelopes = OrderedDict()
+        self.cached_envelopes = cached_envelopes
+
+    def get_envelope_pyramid(self, data):
+        # keyed by the buffer so every view of the same samples shares one pyramid
+        base = data
+        while isinstance(base.base, np.ndarray):
+            base = base.base
+        key = (data.__array_interface__['data'][0], data.shape, data.strides, data.dtype.str)
+        if key in self.envelopes and self.envelopes[key][0]() is base:
+            self.envelopes.move_to_end(key)
+            return self.envelopes[key][1]
+        pyramid = EnvelopePyramid(data)
+
+        def forget(reference):
+            # the buffer is gone, its address may be reused by unrelated samples
+            if key in self.envelopes and self.envelopes[key][0] is reference:
+                del self.envelopes[key]
+
+        self.envelopes[key] = (weakref.ref(base, forget), pyramid)
+        if len(self.envelopes) > self.cached_envelopes:
+            self.envelopes.popitem(last=False)
+        return pyramid
+
+    def get_plot_width(self, figure):
+        return int(figure.get_figwidth()*figure.dpi)
+
     def get_time(self, file, frame_length, start_time=0):
         time = np.linspace(start_time, start_time + file.duration, frame_length)
         return time
@@ -42,15 +126,17 @@ class PlotTools:
         return (mins*60) + secs
 
     def create_legend_patch(self, label):
+        load_matplotlib()
+        from matplotlib import patches as mpatches
         return mpatches.Patch(color='none', label=label)
 
-    def plot_file_property_legend(self, channel_count, samplerate, bit_depth):
+    def plot_file_property_legend(self, axes, channel_count, samplerate, bit_depth):
         channels_label = self.create_legend_patch(
             f'{channel_count} channel{"s" if channel_count > 1 else ""}')
         samplerate_label = self.create_legend_patch(f"{samplerate/1000} kHz")
         bit_depth_label = self.create_legend_patch(f"{bit_depth}-bit")
         handles = [channels_label, samplerate_label, bit_depth_label]
-        leg = plt.legend(
+        leg = axes.legend(
             handles=handles,
             handlelength=0,
             borderpad=0.8,
@@ -58,9 +144,9 @@ class PlotTools:
             loc='upper left',
             borderaxespad=0.
         )
-        plt.gca().add_artist(leg)
+        axes.add_artist(leg)
 
-    def plot_time_legend(self, duration, frame_size_in_ms=0):
+    def plot_time_legend(self, axes, duration, frame_size_in_ms=0):
         time_legend = []
         if frame_size_in_ms > 0:
             frame_size_legend = self.create_legend_patch(f"Interval:\n{frame_size_in_ms} ms")
@@ -68,7 +154,7 @@ class PlotTools:
         audio_time = self.create_legend_patch(
             f"File length:\n{self.convert_time_to_readable_string(duration)}")
         time_legend.append(audio_time)
-        plt.legend(
+        axes.legend(
             handles=time_legend,
             handlelength=0,
             borderpad=0.8,
@@ -76,12 +162,21 @@ class PlotTools:
             loc='lower left',
             borderaxespad=0.)
 
-    def create_subplots(self, rows, file_name, width=12, height=8):
-        figure, _ = plt.subplots(nrows=rows, ncols=1, sharey=True, sharex=True)
+    def create_subplots(self, rows, file_name, width=12, height=8, off_screen=False):
+        # off-screen figures never touch pyplot, so they are safe to render in worker processes
+        if off_screen:
+            load_matplotlib()
+            from matplotlib.figure import Figure
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            figure = Figure()
+            FigureCanvasAgg(figure)
+            axes = figure.subplots(nrows=rows, ncols=1, sharey=True, sharex=True, squeeze=False)
+        else:
+            figure, axes = get_pyplot().subplots(nrows=rows, ncols=1, sharey=True, sharex=True, squeeze=False)
         figure.set_figwidth(width)
         figure.set_figheight(height)
         figure.suptitle(os.path.basename(file_name))
-        return figure
+        return figure, list(axes[:, 0])
 
     def get_values(self, file, data, start_time=0):
         length = len(data) if file.channel_count == 1 else len(data[0])
@@ -90,91 +185,123 @@ class PlotTools:
             x = x/60
         return x, data
 
+    def get_envelope_values(self, file, data, width, start_time=0):
+        sample_bounds, minimum, maximum = self.get_envelope_pyramid(data).get_envelope(data, width)
+        length = data.shape[-1]
+        step = file.duration/(length - 1)
+        x = np.empty(2*(len(sample_bounds) - 1))
+        x[0::2] = start_time + sample_bounds[:-1]*step
+        x[1::2] = start_time + (sample_bounds[1:] - 1)*step
+        y = np.empty(minimum.shape[:-1] + x.shape)
+        y[..., 0::2] = minimum
+        y[..., 1::2] = maximum
+        if file.duration >= 60:
+            x = x/60
+        return x, (y[0] if file.channel_count == 1 else y)
+
     def add_labels(self, xlabel, ylabel, duration, y_label, x_label=""):
         if x_label == "":
             x_label = "Time, min" if duration > 60 else "Time, s"
         xlabel(x_label, fontsize=13)
         ylabel(y_label, fontsize=13)
 
-    def add_figure_legend(self, file):
-        plt.subplot(file.channel_count, 1, 1)
-        self.plot_file_property_legend(file.channel_count, file.samplerate, file.bit_depth)
+    def add_figure_legend(self, axes, file):
+        self.plot_file_property_legend(axes[0], file.channel_count, file.samplerate, file.bit_depth)
 
-    def add_time_legend(self, duration, channel_count, frame_size):
-        if channel_count > 1:
-            plt.subplot(channel_count, 1, channel_count)
+    def add_time_legend(self, axes, duration, frame_size):
         if frame_size > 0:
-            self.plot_time_legend(duration, frame_size_in_ms=frame_size)
+            self.plot_time_legend(axes[-1], duration, frame_size_in_ms=frame_size)
         else:
-            self.plot_time_legend(duration)
+            self.plot_time_legend(axes[-1], duration)
 
-    def plot(self, x, y, file, line_wt=0.5):
+    def plot(self, axes, x, y, file, line_wt=0.5):
         colors = ['#4986CC', '#3F4756', '#A3ACBD', '#C66481', '#8D3150']
         if file.channel_count == 1:
             y = [y]
         for i, channel in enumerate(y):
-            plt.subplot(file.channel_count, 1, i+1)
-            plt.grid(color='#ddd')
-            plt.plot(x, channel, linewidth=line_wt, color=colors[i%len(colors)])
+            axes[i].grid(color='#ddd')
+            axes[i].plot(x, channel, linewidth=line_wt, color=colors[i%len(colors)])
 
-    def add_segments(self, x, segments, duration, channel_count):
+    def add_segments(self, axes, x, segments, duration, channel_count):
         if segments is not None:
             if channel_count == 1:
                 segments = [segments]
             for i, channel in enumerate(segments):
-                plt.subplot(channel_count, 1, i+1)
                 for segment in channel:
-                    plt.axvline(
-                        x=x[segment] if duration < 60 else x[segment]/60,
-                        color='#ff3838',
-                        lw=0.5)
+                    # a segment still open at the end of the signal has no end line
+                    if segment < len(x):
+                        axes[i].axvline(x=x[segment], color='#ff3838', lw=0.5)
 
-    def show_plot(self):
-        plt.tight_layout()
-        plt.show()
+    def show_plot(self, figure, output_file=None):
+        figure.tight_layout()
+        if output_file is None:
+            get_pyplot().show()
+        else:
+            with instrumentation.stage("render"):
+                figure.savefig(output_file)
+            if figure.canvas.manager is not None:
+                get_pyplot().close(figure)
 
 class Plot:
-    def __init__(self, plot_tools):
+    def __init__(self, plot_tools, output_file=None):
         self.plot = plot_tools
+        self.output_file = output_file
+        self.figure_count = 0
+
+    def get_output_file(self):
+        # later figures of the same Plot get a numbered suffix instead of overwriting
+        if self.output_file is None:
+            return None
+        self.figure_count += 1
+        if self.figure_count == 1:
+            return self.output_file
+        name, extension = os.path.splitext(self.output_file)
+        return f"{name}_{self.figure_count}{extension}"
+
+    def create_subplots(self, rows, file_name, width, height):
+        return self.plot.create_subplots(rows, file_name, width, height, off_screen=self.output_file is not None)
 
     def plot_time(self, file, data, segments=None, y_label='', start_time=0, duration=0):
         fig_height = 6
         if file.channel_count == 1:
             fig_height = 4
-        figure = self.plot.create_subplots(file.channel_count, file.file_name, 10, fig_height)
-        x, y = self.plot.get_values(file, data, start_time=start_time)
-        self.plot.add_figure_legend(file)
+        figure, axes = self.create_subplots(file.channel_count, file.file_name, 10, fig_height)
+        length = len(data) if file.channel_count == 1 else len(data[0])
+        width = self.plot.get_plot_width(figure)
+        if segments is None and length > 4*width:
+            x, y = self.plot.get_envelope_values(file, np.asarray(data), width, start_time=start_time)
+        else:
+            x, y = self.plot.get_values(file, data, start_time=start_time)
+        self.plot.add_figure_legend(axes, file)
         if duration == 0:
             duration = file.duration
-        self.plot.add_time_legend(duration, file.channel_count, file.frame_size_in_ms)
-        self.plot.plot(x, y, file)
-        self.plot.add_segments(x, segments, file.duration, file.channel_count)
+        self.plot.add_time_legend(axes, duration, file.frame_size_in_ms)
+        self.plot.plot(axes, x, y, file)
+        self.plot.add_segments(axes, x, segments, file.duration, file.channel_count)
         self.plot.add_labels(figure.supxlabel, figure.supylabel, file.duration, y_label)
-        self.plot.show_plot()
+        self.plot.show_plot(figure, self.get_output_file())
 
     def plot_spectrum(self, file, x, y):
-        figure = self.plot.create_subplots(file.channel_count, file.file_name, 9, 5)
-        self.plot.plot(x, y, file)
+        figure, axes = self.create_subplots(file.channel_count, file.file_name, 9, 5)
+        self.plot.plot(axes, x, y, file)
         self.plot.add_labels(figure.supxlabel, figure.supylabel, file.duration, y_label="", x_label="Frequency, Hz")
-        self.plot.show_plot()
+        self.plot.show_plot(figure, self.get_output_file())
 
     def compare_time_plots(self, file1, file2, start):
         x1, y1 = self.plot.get_values(file1, file1.data, start_time=start)
         x2, y2 = self.plot.get_values(file2, file2.data, start_time=start)
-        figure = self.plot.create_subplots(2, file1.file_name, 10, 6)
+        figure, axes = self.create_subplots(2, file1.file_name, 10, 6)
 
-        plt.subplot(2, 1, 1)
-        plt.grid(color='#ddd')
-        plt.plot(x1, y1, linewidth=0.5)
-        self.plot.plot_file_property_legend(file1.channel_count, file1.samplerate, file1.bit_depth)
+        axes[0].grid(color='#ddd')
+        axes[0].plot(x1, y1, linewidth=0.5)
+        self.plot.plot_file_property_legend(axes[0], file1.channel_count, file1.samplerate, file1.bit_depth)
 
-        plt.subplot(2, 1, 2)
-        plt.grid(color='#ddd')
-        plt.plot(x2, y2, linewidth=0.5)
+        axes[1].grid(color='#ddd')
+        axes[1].plot(x2, y2, linewidth=0.5)
 
-        self.plot.add_time_legend(file1.duration, file1.channel_count, file2.frame_size_in_ms)
+        self.plot.add_time_legend(axes, file1.duration, file2.frame_size_in_ms)
         self.plot.add_labels(figure.supxlabel, figure.supylabel, file1.duration, y_label="")
-        self.plot.show_plot()
+        self.plot.show_plot(figure, self.get_output_file())
 
 plot_tools = PlotTools()
 new_plot = Plot(plot_tools)
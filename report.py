@@ -0,0 +1,88 @@
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from file_data import read_file
+from handle_data import handle_signal
+from spectrum_analysis import get_spectrum
+from plot_data import Plot, plot_tools
+from batch import find_files
+
+figures = {
+    "time": "timePlot",
+    "energy": "energyPlot",
+    "zcr": "zeroCrossingRatePlot",
+    "segments": "segmentPlot",
+    "spectrum": None
+}
+
+def get_output_file(file_path, figure, options):
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    return os.path.join(options["output_dir"], f"{stem}_{figure}.{options['plot_format']}")
+
+def render_figure(file_path, figure, options):
+    # one figure per job, so a single long file does not hold up the others
+    start_time = time.perf_counter()
+    output_file = get_output_file(file_path, figure, options)
+    file = read_file(file_path, options["samplerate"])
+    plot = Plot(plot_tools, output_file)
+    if figure == "spectrum":
+        interval, frequencies, magnitudes = get_spectrum(file)
+        plot.plot_spectrum(interval, frequencies, magnitudes)
+    else:
+        parameters = {} if figure == "time" else {"frame_size_in_ms": options["frame_size"]}
+        if figure == "segments":
+            parameters["step"] = options["step"]
+        handle_signal(file, figures[figure], plot.plot_time, **parameters)
+    return output_file, time.perf_counter() - start_time
+
+def render_report(file_paths, options, workers=None):
+    os.makedirs(options["output_dir"], exist_ok=True)
+    jobs = [(file_path, figure) for file_path in file_paths for figure in options["figures"]]
+    rendered, failed = [], []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(render_figure, file_path, figure, options): (file_path, figure)
+                   for file_path, figure in jobs}
+        for future in as_completed(futures):
+            file_path, figure = futures[future]
+            try:
+                output_file, elapsed = future.result()
+                rendered.append(output_file)
+                print(f"[{len(rendered) + len(failed)}/{len(jobs)}] {output_file} in {elapsed:.2f} s")
+            except Exception as error:
+                failed.append((file_path, figure))
+                print(f"[{len(rendered) + len(failed)}/{len(jobs)}] {os.path.basename(file_path)} {figure}: "
+                      f"FAILED ({type(error).__name__}: {error})")
+    return sorted(rendered), failed
+
+def parse_arguments(arguments):
+    parser = argparse.ArgumentParser(description="Render the standard report plots of WAV files to image files.")
+    parser.add_argument("paths", nargs="+", help="WAV files or directories containing them")
+    parser.add_argument("-f", "--figures", nargs="+", choices=list(figures), default=list(figures))
+    parser.add_argument("-o", "--output-dir", default="plots")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="process count, defaults to CPU count")
+    parser.add_argument("--frame-size", type=int, default=20, help="frame size in ms")
+    parser.add_argument("--samplerate", type=int, default=None,
+                        help="resample higher-rate files to this rate before analysis")
+    parser.add_argument("--step", type=float, default=0.3, help="segmentation threshold")
+    parser.add_argument("--plot-format", choices=["png", "svg"], default="png")
+    return parser.parse_args(arguments)
+
+def main(arguments=None):
+    args = parse_arguments(arguments)
+    options = {
+        "figures": args.figures,
+        "output_dir": args.output_dir,
+        "frame_size": args.frame_size,
+        "samplerate": args.samplerate,
+        "step": args.step,
+        "plot_format": args.plot_format
+    }
+    start_time = time.perf_counter()
+    rendered, failed = render_report(find_files(args.paths), options, args.workers)
+    print(f"{len(rendered)} figures rendered, {len(failed)} failed in {time.perf_counter() - start_time:.2f} s")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+from math import gcd
+from functools import lru_cache
+import numpy as np
+from audio_analysis import iter_data_blocks, get_data_length, read_data_block
+
+def get_resample_factors(samplerate, target_rate):
+    divisor = gcd(int(samplerate), int(target_rate))
+    return int(target_rate)//divisor, int(samplerate)//divisor
+
+@lru_cache(maxsize=16)
+def design_polyphase_filter(up, down, half_length_factor=10, beta=5.0):
+    # the same anti-aliasing filter scipy.signal.resample_poly uses, split into
+    # up phases of equal length so each output sample is one short dot product
+    from scipy import signal
+    half_length = half_length_factor*max(up, down)
+    taps = signal.firwin(2*half_length + 1, 1/max(up, down), window=('kaiser', beta))*up
+    tap_count = -(-len(taps)//up)
+    padded = np.zeros(tap_count*up)
+    padded[:len(taps)] = taps
+    # phases[p, j] multiplies x[n - (tap_count - 1) + j] for the output whose newest input is x[n]
+    phases = padded.reshape(tap_count, up).T[:, ::-1].copy()
+    phases.flags.writeable = False
+    return phases, half_length
+
+class PolyphaseResampler:
+
+    def __init__(self, samplerate, target_rate, channel_count):
+        self.up, self.down = get_resample_factors(samplerate, target_rate)
+        self.phases, self.half_length = design_polyphase_filter(self.up, self.down)
+        self.tap_count = self.phases.shape[1]
+        self.channel_count = channel_count
+        # input history with the absolute index of its first sample; zeros stand in before the start
+        self.buffer = np.zeros((channel_count, self.tap_count))
+        self.buffer_start = -self.tap_count
+        self.input_length = 0
+        self.output_index = 0
+
+    def get_output_length(self):
+        return -(-self.input_length*self.up//self.down)
+
+    def resample_available(self, output_limit=None):
+        # outputs whose newest input sample is already buffered
+        available_end = self.buffer_start + self.buffer.shape[-1]
+        last = (available_end*self.up - 1 - self.half_length)//self.down
+        if output_limit is not None:
+            last = min(last, output_limit - 1)
+        if last < self.output_index:
+            return np.zeros((self.channel_count, 0))
+        count = last + 1 - self.output_index
+        output = np.empty((self.channel_count, count))
+        windows = np.lib.stride_tricks.sliding_window_view(self.buffer, self.tap_count, axis=-1)
+        # every up-th output uses the same phase and starts down samples later,
+        # so each phase is a single product over a strided view of the windows
+        for offset in range(min(self.up, count)):
+            newest, phase = divmod((self.output_index + offset)*self.down + self.half_length, self.up)
+            first = newest - self.tap_count + 1 - self.buffer_start
+            phase_count = len(range(offset, count, self.up))
+            phase_windows = windows[:, first:first + (phase_count - 1)*self.down + 1:self.down]
+            output[:, offset::self.up] = phase_windows @ self.phases[phase]
+        self.output_index = last + 1
+        oldest = (self.output_index*self.down + self.half_length)//self.up - self.tap_count + 1
+        if oldest > self.buffer_start:
+            self.buffer = self.buffer[:, oldest - self.buffer_start:]
+            self.buffer_start = oldest
+        return output
+
+    def process(self, block):
+        block = np.atleast_2d(np.asarray(block, dtype=float))
+        self.buffer = np.concatenate((self.buffer, block), axis=-1)
+        self.input_length += block.shape[-1]
+        return self.resample_available()
+
+    def flush(self):
+        # zeros after the end let the last outputs see the whole filter
+        output_length = self.get_output_length()
+        newest = ((output_length - 1)*self.down + self.half_length)//self.up
+        padding = max(newest + 1 - (self.buffer_start + self.buffer.shape[-1]), 0)
+        self.buffer = np.concatenate((self.buffer, np.zeros((self.channel_count, padding))), axis=-1)
+        return self.resample_available(output_length)
+
+def store_resampled(target, values):
+    if np.issubdtype(target.dtype, np.integer):
+        limits = np.iinfo(target.dtype)
+        values = np.clip(np.rint(values), limits.min, limits.max)
+    target[...] = values
+
+def resample_data(data, samplerate, target_rate, dtype=None, block_size=2**16):
+    # block by block from an array or a mapped source, into an array of the target length
+    if get_resample_factors(samplerate, target_rate) == (1, 1):
+        # nothing to filter, like resample_poly the samples are only copied
+        return np.array(read_data_block(data, 0, get_data_length(data)), dtype=dtype or data.dtype)
+    channel_count = data.shape[0] if isinstance(data, np.ndarray) else data.channel_count
+    resampler = PolyphaseResampler(samplerate, target_rate, channel_count)
+    length = data.shape[-1] if isinstance(data, np.ndarray) else data.length
+    output = np.empty((channel_count, -(-length*resampler.up//resampler.down)), dtype=dtype or data.dtype)
+    position = 0
+    for _, block in iter_data_blocks(data, block_size):
+        values = resampler.process(block)
+        store_resampled(output[:, position:position + values.shape[-1]], values)
+        position += values.shape[-1]
+    values = resampler.flush()
+    store_resampled(output[:, position:position + values.shape[-1]], values)
+    return output
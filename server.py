@@ -0,0 +1,437 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import http.client
+import socket
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+from file_data import read_file
+from batch import analyses, run_analyses, get_options, set_cache_directories, parse_arguments as parse_batch_arguments
+from feature_index import default_index_directory
+from audio_effects import fade_curves
+from export import sample_formats
+
+job_parameters = ["analyses", "frame_size", "samplerate", "step", "off_step", "min_segment", "min_gap", "interval", "fade_time",
+                  "fade_type", "fade_out_time", "export", "plots", "plot_format", "save", "arrays"]
+
+# accepted JSON types of each job parameter; bool is never taken for a number
+number = (int, float)
+parameter_types = {
+    "path": (str,),
+    "analyses": (str, list),
+    "frame_size": (int,),
+    "samplerate": (int, type(None)),
+    "step": number,
+    "off_step": number + (type(None),),
+    "min_segment": number,
+    "min_gap": number,
+    "interval": (list,),
+    "fade_time": number,
+    "fade_type": (str,),
+    "fade_out_time": number + (type(None),),
+    "export": (dict,),
+    "plots": (bool,),
+    "plot_format": (str,),
+    "save": (bool,),
+    "arrays": (bool,)
+}
+export_types = {"sample_format": (str,), "clip": (bool,), "dither": (bool,), "file_name": (str,)}
+parameter_choices = {"fade_type": list(fade_curves), "plot_format": ["png", "svg"]}
+
+reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+           500: "Internal Server Error", 503: "Service Unavailable"}
+
+def encode_array(values):
+    values = np.asarray(values)
+    if values.dtype.names is not None:
+        # structured tables go row by row with their field types, whatever their shape
+        return {"fields": [[name, values.dtype[name].str] for name in values.dtype.names],
+                "shape": list(values.shape), "data": values.ravel().tolist()}
+    return {"dtype": str(values.dtype), "shape": list(values.shape), "data": values.tolist()}
+
+def decode_array(values):
+    if "fields" in values:
+        dtype = np.dtype([(name, field_type) for name, field_type in values["fields"]])
+        return np.array([tuple(row) for row in values["data"]], dtype=dtype).reshape(values["shape"])
+    return np.array(values["data"], dtype=values["dtype"]).reshape(values["shape"])
+
+def get_type_name(types):
+    return " or ".join("null" if value_type is type(None) else value_type.__name__ for value_type in types)
+
+def check_type(name, value, types):
+    if (isinstance(value, bool) and bool not in types) or not isinstance(value, types):
+        raise ValueError(f"'{name}' must be {get_type_name(types)}, got {get_type_name([type(value)])}")
+
+def check_parameters(request):
+    for name, value in request.items():
+        check_type(name, value, parameter_types[name])
+        if name in parameter_choices and value not in parameter_choices[name]:
+            raise ValueError(f"'{name}' must be one of {', '.join(parameter_choices[name])}")
+    for name in ("frame_size", "samplerate"):
+        if request.get(name) is not None and request[name] <= 0:
+            raise ValueError(f"'{name}' must be positive")
+    if "interval" in request:
+        if len(request["interval"]) != 2:
+            raise ValueError("'interval' must be [start, end]")
+        for value in request["interval"]:
+            check_type("interval", value, number)
+    if "analyses" in request:
+        names = [request["analyses"]] if isinstance(request["analyses"], str) else request["analyses"]
+        if not all(isinstance(name, str) for name in names) or not set(names) <= set(analyses):
+            raise ValueError(f"analyses must be among {', '.join(analyses)}")
+    if "export" in request:
+        check_export_options(request["export"])
+
+def check_export_options(export):
+    # the export options reach export_file, so only its format options and a bare
+    # file name inside the server's output directory are let through
+    unknown = set(export) - set(export_types)
+    if unknown:
+        raise ValueError(f"unknown export parameters: {', '.join(sorted(unknown))}")
+    for name, value in export.items():
+        check_type(f"export.{name}", value, export_types[name])
+    if export.get("sample_format", "native") not in ["native"] + list(sample_formats):
+        raise ValueError(f"'export.sample_format' must be one of native, {', '.join(sample_formats)}")
+    file_name = export.get("file_name")
+    if file_name is not None and (file_name in ("", ".", "..") or os.path.isabs(file_name)
+                                  or any(separator in file_name for separator in ("/", "\\", os.sep))):
+        raise ValueError("'export.file_name' must be a file name without a directory")
+
+def run_job(options):
+    # runs in a pool process and returns the encoded response, so the event loop
+    # only has to send bytes and coalesced requests share them as they are
+    start_time = time.perf_counter()
+    os.makedirs(options["output_dir"], exist_ok=True)
+    set_cache_directories(options)
+    file = read_file(options["path"], options["samplerate"])
+    results = run_analyses(file, options)
+    stem = os.path.splitext(file.file_name)[0]
+    files = []
+    if "segments" in options["analyses"]:
+        files.append(os.path.join(options["output_dir"], f"{stem}_segments.csv"))
+    if "features" in options["analyses"]:
+        files.append(os.path.join(options["output_dir"], f"{stem}_features.csv"))
+    if "dtmf" in options["analyses"]:
+        files.append(os.path.join(options["output_dir"], f"{stem}_dtmf.csv"))
+    if "fade" in options["analyses"]:
+        files.append(os.path.join(options["output_dir"], file.file_name))
+    if options["save"]:
+        files.append(os.path.join(options["output_dir"], f"{stem}.npz"))
+        np.savez_compressed(files[-1], **results)
+    response = {
+        "status": "ok",
+        "file": options["path"],
+        "samplerate": file.samplerate,
+        "channels": file.channel_count,
+        "duration": file.duration,
+        "outputs": sorted(results),
+        "files": files,
+        "elapsed": time.perf_counter() - start_time
+    }
+    if options["arrays"]:
+        response["results"] = {name: encode_array(values) for name, values in results.items()}
+    return json.dumps(response).encode()
+
+class JobServer:
+
+    def __init__(self, workers=None, max_queue=64, output_dir="server_output", max_results=64, max_body=2**20,
+                 pool="process", index_dir=default_index_directory):
+        self.workers = workers or os.cpu_count()
+        self.index_dir = index_dir
+        self.max_queue = max_queue
+        self.output_dir = output_dir
+        self.max_results = max_results
+        self.max_body = max_body
+        self.pool_type = ProcessPoolExecutor if pool == "process" else ThreadPoolExecutor
+        self.pool = None
+        self.queue = None
+        self.tasks = []
+        self.pending = {}
+        self.results = OrderedDict()
+        self.latencies = deque(maxlen=1000)
+        self.completions = deque()
+        self.counters = {name: 0 for name in ("requests", "accepted", "rejected", "coalesced", "reused",
+                                              "completed", "failed")}
+        self.running = 0
+        self.start_time = time.perf_counter()
+
+    def get_job_options(self, request):
+        if not isinstance(request, dict) or "path" not in request:
+            raise ValueError("request needs a 'path'")
+        unknown = set(request) - set(job_parameters) - {"path"}
+        if unknown:
+            raise ValueError(f"unknown parameters: {', '.join(sorted(unknown))}")
+        check_parameters(request)
+        path = os.path.abspath(request["path"])
+        if not os.path.isfile(path):
+            raise ValueError(f"no such file: {request['path']}")
+        options = get_options(parse_batch_arguments([path, "--no-plots"]))
+        options.update(path=path, output_dir=self.output_dir, save=False, arrays=True, index_dir=self.index_dir)
+        for name in job_parameters:
+            if name in request:
+                options[name] = request[name]
+        options["export"] = dict(get_options(parse_batch_arguments([path]))["export"], **options["export"])
+        options["interval"] = tuple(options["interval"])
+        if isinstance(options["analyses"], str):
+            options["analyses"] = [options["analyses"]]
+        return options
+
+    def get_key(self, options):
+        # a rewritten file gets a new key, identical requests for the same content share one
+        status = os.stat(options["path"])
+        return json.dumps([options, status.st_size, status.st_mtime_ns], sort_keys=True)
+
+    async def submit(self, request):
+        self.counters["requests"] += 1
+        options = self.get_job_options(request)
+        key = self.get_key(options)
+        if key in self.results:
+            self.counters["reused"] += 1
+            self.results.move_to_end(key)
+            return self.results[key]
+        if key in self.pending:
+            self.counters["coalesced"] += 1
+            return await asyncio.shield(self.pending[key])
+        if self.queue.full():
+            self.counters["rejected"] += 1
+            return None
+        self.counters["accepted"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self.pending[key] = future
+        self.queue.put_nowait((key, options, future))
+        return await asyncio.shield(future)
+
+    def remember(self, key, body):
+        self.results[key] = body
+        while len(self.results) > self.max_results:
+            self.results.popitem(last=False)
+
+    async def work(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            key, options, future = await self.queue.get()
+            self.running += 1
+            try:
+                body = await loop.run_in_executor(self.pool, run_job, options)
+                self.remember(key, body)
+                self.counters["completed"] += 1
+                self.completions.append(time.perf_counter())
+                future.set_result(body)
+            except Exception as error:
+                self.counters["failed"] += 1
+                future.set_exception(error)
+            finally:
+                self.running -= 1
+                del self.pending[key]
+                self.queue.task_done()
+
+    def get_metrics(self):
+        now = time.perf_counter()
+        uptime = now - self.start_time
+        while self.completions and self.completions[0] < now - 60:
+            self.completions.popleft()
+        metrics = {
+            "queue_depth": self.queue.qsize(),
+            "running": self.running,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "uptime": uptime,
+            **self.counters,
+            "throughput": {
+                "total_per_second": self.counters["completed"]/max(uptime, 1e-9),
+                "last_minute_per_second": len(self.completions)/max(min(uptime, 60), 1e-9)
+            }
+        }
+        if self.latencies:
+            latencies = np.array(self.latencies)
+            metrics["latency"] = {
+                "count": len(latencies),
+                "p50": float(np.percentile(latencies, 50)),
+                "p95": float(np.percentile(latencies, 95)),
+                "p99": float(np.percentile(latencies, 99)),
+                "max": float(latencies.max())
+            }
+        return metrics
+
+    async def route(self, method, target, body):
+        if target == "/health":
+            return 200, json.dumps({"status": "ok"}).encode()
+        if target == "/metrics":
+            return 200, json.dumps(self.get_metrics()).encode()
+        if target != "/jobs":
+            return 404, json.dumps({"status": "error", "error": f"no route {target}"}).encode()
+        if method != "POST":
+            return 405, json.dumps({"status": "error", "error": "jobs are submitted with POST"}).encode()
+        start_time = time.perf_counter()
+        try:
+            response = await self.submit(json.loads(body or b"null"))
+        except ValueError as error:
+            return 400, json.dumps({"status": "error", "error": str(error)}).encode()
+        except Exception as error:
+            return 500, json.dumps({"status": "error", "error": f"{type(error).__name__}: {error}"}).encode()
+        if response is None:
+            return 503, json.dumps({"status": "error", "error": "queue full, retry later",
+                                    "queue_depth": self.queue.qsize()}).encode()
+        self.latencies.append(time.perf_counter() - start_time)
+        return 200, response
+
+    async def handle_connection(self, reader, writer):
+        # one request per connection, which is all a local client needs
+        try:
+            method, target, _ = (await reader.readline()).decode().split()
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, value = line.decode().split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get("content-length", 0))
+            if length > self.max_body:
+                status, response = 413, json.dumps({"status": "error", "error": "request too large"}).encode()
+            else:
+                status, response = await self.route(method, target, await reader.readexactly(length))
+        except (ValueError, UnicodeDecodeError, asyncio.IncompleteReadError):
+            status, response = 400, json.dumps({"status": "error", "error": "malformed request"}).encode()
+        headers = [f"HTTP/1.1 {status} {reasons[status]}", "Content-Type: application/json",
+                   f"Content-Length: {len(response)}", "Connection: close"]
+        if status == 503:
+            headers.append("Retry-After: 1")
+        try:
+            writer.write(("\r\n".join(headers) + "\r\n\r\n").encode() + response)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host="127.0.0.1", port=8765, socket_path=None):
+        self.queue = asyncio.Queue(self.max_queue)
+        self.pool = self.pool_type(max_workers=self.workers)
+        self.tasks = [asyncio.create_task(self.work()) for _ in range(self.workers)]
+        if socket_path is not None:
+            return await asyncio.start_unix_server(self.handle_connection, socket_path)
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.pool.shutdown()
+
+    async def serve(self, host="127.0.0.1", port=8765, socket_path=None):
+        server = await self.start(host, port, socket_path)
+        address = socket_path or f"http://{host}:{server.sockets[0].getsockname()[1]}"
+        print(f"serving on {address} with {self.workers} workers, queue limit {self.max_queue}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.stop()
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+
+    def __init__(self, socket_path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+class AnalysisClient:
+
+    def __init__(self, host="127.0.0.1", port=8765, socket_path=None, timeout=None):
+        self.host = host
+        self.port = port
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    def get_connection(self):
+        if self.socket_path is not None:
+            return UnixHTTPConnection(self.socket_path, self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def request(self, method, target, payload=None):
+        connection = self.get_connection()
+        try:
+            body = None if payload is None else json.dumps(payload)
+            connection.request(method, target, body, {"Content-Type": "application/json"})
+            response = connection.getresponse()
+            return response.status, json.loads(response.read())
+        finally:
+            connection.close()
+
+    def submit(self, file_path, **parameters):
+        # returns the response with its feature arrays decoded, or the error response
+        status, response = self.request("POST", "/jobs", {"path": os.path.abspath(file_path), **parameters})
+        response["http_status"] = status
+        if "results" in response:
+            response["results"] = {name: decode_array(values) for name, values in response["results"].items()}
+        return response
+
+    def get_metrics(self):
+        return self.request("GET", "/metrics")[1]
+
+def run_load(client, file_paths, requests, concurrency, parameters):
+    with ThreadPoolExecutor(concurrency) as executor:
+        futures = [executor.submit(client.submit, file_paths[i % len(file_paths)], **parameters)
+                   for i in range(requests)]
+        responses = [future.result() for future in futures]
+    statuses = {}
+    for response in responses:
+        statuses[response["http_status"]] = statuses.get(response["http_status"], 0) + 1
+    return statuses
+
+def parse_arguments(arguments):
+    parser = argparse.ArgumentParser(description="Local analysis job server and its client.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--socket", default=None, help="Unix socket path instead of TCP")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="run the server")
+    serve.add_argument("-j", "--workers", type=int, default=None, help="pool processes, defaults to CPU count")
+    serve.add_argument("--max-queue", type=int, default=64, help="queued jobs before requests are refused")
+    serve.add_argument("--max-results", type=int, default=64, help="finished responses kept for reuse")
+    serve.add_argument("-o", "--output-dir", default="server_output", help="directory of file outputs")
+    serve.add_argument("--index-dir", default=default_index_directory, help="directory of the energy/ZCR index")
+    submit = commands.add_parser("submit", help="send analysis requests and wait for them")
+    submit.add_argument("paths", nargs="+", help="WAV files")
+    submit.add_argument("-a", "--analyses", nargs="+", default=["energy", "zcr"])
+    submit.add_argument("--frame-size", type=int, default=20, help="frame size in ms")
+    submit.add_argument("--samplerate", type=int, default=None, help="resample higher-rate files to this rate")
+    submit.add_argument("--step", type=float, default=0.3, help="segmentation threshold")
+    submit.add_argument("--save", action="store_true", help="also write an .npz file on the server")
+    submit.add_argument("-n", "--requests", type=int, default=None, help="total requests, one per path by default")
+    submit.add_argument("-c", "--concurrency", type=int, default=1, help="requests in flight at once")
+    commands.add_parser("metrics", help="print the server metrics")
+    return parser.parse_args(arguments)
+
+def main(arguments=None):
+    args = parse_arguments(arguments)
+    if args.command == "serve":
+        server = JobServer(args.workers, args.max_queue, args.output_dir, args.max_results,
+                           index_dir=args.index_dir)
+        try:
+            asyncio.run(server.serve(args.host, args.port, args.socket))
+        except KeyboardInterrupt:
+            pass
+        return 0
+    client = AnalysisClient(args.host, args.port, args.socket)
+    if args.command == "metrics":
+        print(json.dumps(client.get_metrics(), indent=2))
+        return 0
+    parameters = {"analyses": args.analyses, "frame_size": args.frame_size, "samplerate": args.samplerate,
+                  "step": args.step, "save": args.save, "arrays": False}
+    statuses = run_load(client, args.paths, args.requests or len(args.paths), args.concurrency, parameters)
+    print(", ".join(f"{count} x HTTP {status}" for status, count in sorted(statuses.items())))
+    print(json.dumps(client.get_metrics(), indent=2))
+    return 0 if set(statuses) == {200} else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,13 @@
+from functools import lru_cache
 import numpy as np
-from scipy.io import wavfile
 from plot_data import plot_tools, new_plot
+from feature_cache import feature_cache
+from audio_analysis import get_frame_size
+from stft import get_bin_frequencies, StftProcessor
+from filters import FilterDesign
+from wav_io import get_sample_scale
+from export import export_file
+from instrumentation import instrumentation
 
 def choose_interval(duration):
     start_time = plot_tools.get_time_input(duration, "start")
@@ -13,120 +20,263 @@ def choose_interval(duration):
 def get_file_interval(file, start, end):
     start_index = int(start*file.samplerate)
     end_index = int(end*file.samplerate)
-    file_interval = file.clone()
-    new_data = file.data[start_index:end_index]
-    file_interval.set_data(new_data)
+    file_interval = file.get_interval(start_index, end_index)
     file_interval.set_frame_size(round((end-start)*1000))
     return file_interval
 
+@lru_cache(maxsize=64)
+def get_hamming_window(length):
+    window = np.hamming(length)
+    window.flags.writeable = False
+    return window
+
 def apply_window_function(interval):
-    window = np.hamming(len(interval))
-    interval = interval * window
-    return interval
+    return interval*get_hamming_window(interval.shape[-1])
 
 def apply_dft(interval):
     complex_dft = np.fft.fft(interval)
     return complex_dft
 
 def scale_dft(dft, n):
-    if n % 2 == 0:
-        length = len(dft)-1
-    else:
-        length = len(dft)
-    for i in range(1, length):
-        dft[i] = 2*dft[i]
+    # every bin but DC, and Nyquist for even n, stands for two conjugate bins
+    length = dft.shape[-1] - 1 if n % 2 == 0 else dft.shape[-1]
+    dft[..., 1:length] *= 2
     return dft
 
 def get_simplified_dft(complex_dft):
-    simplified_dft = np.abs(complex_dft)
-    n = len(simplified_dft)
-    if n % 2 == 0:
-        simplified_dft = simplified_dft[0:int((len(simplified_dft)/2)+1)]
-    else:
-        simplified_dft = simplified_dft[0:int((len(simplified_dft)+1)/2)]
-    simplified_dft = scale_dft(simplified_dft, n)
-    return simplified_dft
+    n = complex_dft.shape[-1]
+    simplified_dft = np.abs(complex_dft[..., :n//2 + 1])
+    return scale_dft(simplified_dft, n)
 
 def get_frequencies(interval, samplerate):
-    step = 1/len(interval)
-    frequencies = []
-    for i in range(0, len(interval)):
-        frequencies.append((samplerate/2)*step*(i+1))
-    return frequencies
-
-def inverse_dft(interval):
-    modified_signal = np.fft.ifft(interval).real
-    return modified_signal
-
-def inverse_window_function(interval):
-    window = 1 / np.hamming(len(interval))
-    interval = interval * window
-    return interval
-
-def modify_spectrum(signal, complex_dft, modify):
-    complex_dft = modify(complex_dft, signal.samplerate)
-    return complex_dft
+    length = np.shape(interval)[-1]
+    return np.arange(1, length + 1)*(samplerate/2/length)
+
+def get_shared_fft_size(length):
+    # intervals are zero-padded to the next power of two, so intervals of
+    # similar length share one FFT size and are transformed together
+    return 1 << max(int(length) - 1, 0).bit_length()
+
+def get_interval_indices(file, intervals):
+    indices = []
+    for start, end in intervals:
+        start_index = min(max(int(start*file.samplerate), 0), file.length)
+        indices.append((start_index, min(max(int(end*file.samplerate), start_index), file.length)))
+    return indices
+
+def get_interval_spectra(file, intervals, shared_sizes=True, max_batch_bytes=64*2**20, workers=-1):
+    # intervals are (start, end) in seconds; every interval is a view into the file
+    # and each group of equal FFT size goes through a single rfft call, which
+    # scipy.fft spreads over `workers` threads and plans once per size in its cache
+    from scipy import fft
+    data = file.channels if file.source is None else file.source
+    indices = get_interval_indices(file, intervals)
+    groups = {}
+    for i, (start_index, end_index) in enumerate(indices):
+        length = end_index - start_index
+        fft_size = get_shared_fft_size(length) if shared_sizes else max(length, 1)
+        groups.setdefault(fft_size, []).append(i)
+
+    spectra = [None]*len(indices)
+    with instrumentation.stage("interval_spectra", file.file_name, intervals=len(indices)):
+        for fft_size, members in groups.items():
+            frequencies = get_bin_frequencies(fft_size, file.samplerate)
+            batch_size = max(max_batch_bytes//(8*file.channel_count*fft_size), 1)
+            for batch_start in range(0, len(members), batch_size):
+                batch = members[batch_start:batch_start + batch_size]
+                frames = np.zeros((len(batch), file.channel_count, fft_size))
+                for row, i in enumerate(batch):
+                    start_index, end_index = indices[i]
+                    samples = data[:, start_index:end_index] if file.source is None \
+                        else data.read_block(start_index, end_index)
+                    frames[row, :, :end_index - start_index] = apply_window_function(samples)
+                magnitudes = scale_dft(np.abs(fft.rfft(frames, workers=workers)), fft_size)
+                for row, i in enumerate(batch):
+                    spectra[i] = {
+                        "start": indices[i][0]/file.samplerate,
+                        "end": indices[i][1]/file.samplerate,
+                        "frequencies": frequencies,
+                        "magnitudes": magnitudes[row]
+                    }
+    return spectra
+
+def get_segment_spectra(file, table, shared_sizes=True):
+    # one spectrum per segment table row, of the channel the segment was found in
+    intervals = zip(table["start"]/file.samplerate, table["end"]/file.samplerate)
+    spectra = get_interval_spectra(file, intervals, shared_sizes)
+    for spectrum, channel in zip(spectra, table["channel"]):
+        spectrum["magnitudes"] = spectrum["magnitudes"][channel]
+    return spectra
+
+def export_signal(signal, blocks=None, output_dir="spectrum_modified", **export_options):
+    return export_file(signal, blocks, output_dir, **export_options)
+
+def get_interval_magnitudes(interval):
+    with instrumentation.stage("fft", interval.file_name) as stage:
+        stage.add_array("interval", interval.channels)
+        n = interval.length
+        magnitudes = scale_dft(np.abs(np.fft.rfft(apply_window_function(interval.channels))), n)
+        frequencies = get_frequencies(magnitudes[0], interval.samplerate)
+    return {"frequencies": frequencies, "magnitudes": magnitudes}
+
+def show_spectrum(interval):
+    spectrum = get_interval_magnitudes(interval)
+    magnitudes = spectrum["magnitudes"][0] if interval.channel_count == 1 else spectrum["magnitudes"]
+    new_plot.plot_spectrum(interval, spectrum["frequencies"], magnitudes)
+
+def get_spectrum(file, start=0, end=0, cache=feature_cache):
+    if end <= start:
+        end = file.duration
+    interval = get_file_interval(file, start, end)
+    compute = lambda: get_interval_magnitudes(interval)
 
-def export_signal(signal):
-    wavfile.write(f'spectrum_modified/{signal.file_name}', signal.samplerate, np.int16(signal.data))
+    if cache is None:
+        spectrum = compute()
+    else:
+        parameters = {"values": "spectrum", "window": "hamming", "start": start, "end": end}
+        spectrum = cache.get_or_compute(file, parameters, compute)
+    magnitudes = np.asarray(spectrum["magnitudes"])
+    if interval.channel_count == 1:
+        magnitudes = magnitudes[0]
+    return interval, np.asarray(spectrum["frequencies"]), magnitudes
 
-def show_spectrum(signal, complex_dft):
-    simplified_dft = get_simplified_dft(complex_dft)
-    frequencies = get_frequencies(simplified_dft, signal.samplerate)
-    new_plot.plot_spectrum(signal, frequencies, simplified_dft)
+def choose_filter(kind):
+    if kind == "bandpass":
+        low = float(input("Enter lower cutoff frequency in Hz.\n> "))
+        high = float(input("Enter upper cutoff frequency in Hz.\n> "))
+        return FilterDesign(kind, (low, high))
+    cutoff = float(input(f"Enter {'notch' if kind == 'notch' else 'cutoff'} frequency in Hz.\n> "))
+    return FilterDesign(kind, cutoff)
 
 def choose_modification():
-    option = input("Choose how to modify:\n [1] remove frequencies\n [2] add frequencies\n [3] move frequencies right\n> ")
+    option = input("Choose how to modify:\n [1] remove frequencies\n [2] add frequencies\n [3] move frequencies right\n"
+                   " [4] low-pass filter\n [5] high-pass filter\n [6] band-pass filter\n [7] notch filter\n> ")
     options = {
         1: remove_frequencies,
         2: add_frequencies,
         3: move_frequencies
     }
+    filters = {
+        4: "lowpass",
+        5: "highpass",
+        6: "bandpass",
+        7: "notch"
+    }
+    if int(option) in filters:
+        return choose_filter(filters[int(option)])
     return options[int(option)]
 
-def add_frequencies(interval, samplerate):
-    frequencies = np.fft.fftfreq(len(interval), 1/samplerate)
+def choose_scope():
+    option = input("Apply modification to:\n [1] selected interval\n [2] whole signal\n> ")
+    return option == "1"
+
+def add_frequencies(spectra, samplerate, fft_size, frame_starts):
+    frequencies = get_bin_frequencies(fft_size, samplerate)
     freq_to_add = 4000
-    amplitude = 1e7/2
+    # the old whole-interval FFT added 1e7/2 to one bin, a tone of 1e7/2/N for an
+    # N-sample interval, so its level depended on the interval's length. Each frame
+    # now gets amplitude*fft_size/4, the peak of a Hann-windowed sinusoid of that
+    # amplitude; without the sinusoid's side bins the overlap-add at a quarter-frame
+    # hop gives a steady tone of 2/3*amplitude, about 667 in sample units
+    amplitude = 1000
     index = np.argmax(frequencies >= freq_to_add)
-    modified_fft = interval
-    modified_fft[index] += amplitude
-    return modified_fft
-
-def remove_frequencies(interval, samplerate):
-    frequencies = np.fft.fftfreq(len(interval), 1/samplerate)
-    mask = (frequencies < -2000) | (frequencies > 2000)
-    modified_fft = interval
-    modified_fft[mask] *= 0
-    return modified_fft
-
-def move_frequencies(interval, samplerate):
+    # keep the tone's phase continuous from one frame to the next
+    phase = np.exp(2j*np.pi*index*frame_starts/fft_size)
+    spectra[..., index] += amplitude*fft_size/4*phase
+    return spectra
+
+def remove_frequencies(spectra, samplerate, fft_size, frame_starts):
+    frequencies = get_bin_frequencies(fft_size, samplerate)
+    spectra[..., frequencies > 2000] = 0
+    return spectra
+
+def move_frequencies(spectra, samplerate, fft_size, frame_starts):
     '''not implemented yet'''
-    frequencies = np.fft.fftfreq(len(interval), 1/samplerate)
-    mask = (frequencies < -1000) | (frequencies > 1000)
-    modified_fft = interval
-    modified_fft[mask] *= 0
-    return modified_fft
+    frequencies = get_bin_frequencies(fft_size, samplerate)
+    spectra[..., frequencies > 1000] = 0
+    return spectra
 
-def analyze_spectrum(full_signal):
+def store_samples(target, values):
+    if np.issubdtype(target.dtype, np.integer):
+        limits = np.iinfo(target.dtype)
+        values = np.clip(np.rint(values), limits.min, limits.max)
+    target[...] = values
 
-    start, end = choose_interval(full_signal.duration)
-    original_interval = get_file_interval(full_signal, start, end)
-    new_plot.plot_time(original_interval, original_interval.data, start_time=start, duration=full_signal.duration)
+def get_processor(modification, file, frame_size_in_ms=50, window="hann"):
+    if isinstance(modification, FilterDesign):
+        return modification.create(file.samplerate, file.channel_count)
+    frame_size = get_frame_size(frame_size_in_ms, file.samplerate)
+    return StftProcessor(modification, file.samplerate, file.channel_count, frame_size, frame_size//4, window)
 
-    signal_copy = full_signal.clone()
-    signal_copy.set_data(apply_window_function(signal_copy.data))
+def iter_range_blocks(data, start, end, block_size):
+    for block_start in range(start, end, block_size):
+        block_end = min(block_start + block_size, end)
+        if hasattr(data, 'read_block'):
+            yield data.read_block(block_start, block_end)
+        else:
+            yield data[:, block_start:block_end]
 
-    complex_dft = apply_dft(signal_copy.data)
-    show_spectrum(signal_copy, complex_dft)
+def iter_modified_blocks(file, processor, start_index=0, end_index=None, block_size=2**16):
+    # samples outside [start_index, end_index) pass through untouched; unsigned samples
+    # are processed around zero and get their offset back before they are stored
+    data = file.channels if file.source is None else file.source
+    offset = get_sample_scale(data.dtype)[0]
+    end_index = file.length if end_index is None else end_index
+    yield from iter_range_blocks(data, 0, start_index, block_size)
+    for block in iter_range_blocks(data, start_index, end_index, block_size):
+        yield processor.process(np.asarray(block, dtype=float) - offset) + offset
+    yield processor.flush() + offset
+    yield from iter_range_blocks(data, end_index, file.length, block_size)
 
-    mod_option = choose_modification()
-    complex_dft = modify_spectrum(signal_copy, complex_dft, mod_option)
-    show_spectrum(signal_copy, complex_dft)
+def capture_interval(blocks, interval_data, start_index):
+    position = 0
+    for block in blocks:
+        first = max(start_index - position, 0)
+        last = min(block.shape[-1], start_index + interval_data.shape[-1] - position)
+        if last > first:
+            store_samples(interval_data[:, position + first - start_index:position + last - start_index],
+                          block[:, first:last])
+        position += block.shape[-1]
+        yield block
 
-    signal_copy.set_data(inverse_window_function(inverse_dft(complex_dft)))
+def modify_signal(file, modification, start=0, end=0, frame_size_in_ms=50, window="hann"):
+    start_index = int(start*file.samplerate)
+    end_index = int(end*file.samplerate) if end > start else file.length
+    processor = get_processor(modification, file, frame_size_in_ms, window)
+
+    modified_file = file.clone()
+    modified_file.get_writable_data()
+    channels = modified_file.channels
+    position = 0
+    for block in iter_modified_blocks(file, processor, start_index, end_index):
+        store_samples(channels[:, position:position + block.shape[-1]], block)
+        position += block.shape[-1]
+    return modified_file
+
+def analyze_spectrum(full_signal, output_dir="spectrum_modified", **export_options):
+
+    start, end = choose_interval(full_signal.duration)
+    with instrumentation.stage("original_spectrum", full_signal.file_name):
+        original_interval = get_file_interval(full_signal, start, end)
+        new_plot.plot_time(original_interval, original_interval.data, start_time=start, duration=full_signal.duration)
+        show_spectrum(original_interval)
+
+    modification = choose_modification()
+    processor = get_processor(modification, full_signal)
+    start_index = int(start*full_signal.samplerate)
+    end_index = start_index + original_interval.length
+    if choose_scope():
+        blocks = iter_modified_blocks(full_signal, processor, start_index, end_index)
+    else:
+        blocks = iter_modified_blocks(full_signal, processor)
 
-    modified_interval = get_file_interval(signal_copy, start, end)
-    new_plot.plot_time(modified_interval, modified_interval.data, start_time=start, duration=full_signal.duration)
+    # only the selected interval is kept in memory, the rest goes straight to the file
+    modified_interval = original_interval.clone()
+    modified_interval.get_writable_data()
+    blocks = capture_interval(blocks, modified_interval.channels, start_index)
+    export_signal(full_signal, instrumentation.measure_blocks("modify", blocks, full_signal.file_name), output_dir,
+                  **export_options)
 
-    export_signal(signal_copy)
+    with instrumentation.stage("modified_spectrum", full_signal.file_name):
+        show_spectrum(modified_interval)
+        new_plot.plot_time(modified_interval, modified_interval.data, start_time=start, duration=full_signal.duration)
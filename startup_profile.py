@@ -0,0 +1,107 @@
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import time
+
+heavy_modules = ["tkinter", "matplotlib", "matplotlib.pyplot", "scipy", "scipy.signal", "scipy.io"]
+
+scenarios = {
+    "menu": "import main",
+    "analysis": (
+        "from file_data import read_file\n"
+        "from handle_data import handle_signal\n"
+        "file = read_file(sample_path)\n"
+        "handle_signal(file, 'energyPlot', lambda *args, **kwargs: None, frame_size_in_ms=20, cache=None)\n"
+        "handle_signal(file, 'zeroCrossingRatePlot', lambda *args, **kwargs: None, frame_size_in_ms=20, cache=None)"
+    ),
+    "batch": "import batch",
+    "report": "import report"
+}
+
+# modules a scenario must not load, the menu and analysis runs in particular never need a GUI
+forbidden = {
+    "menu": ["tkinter", "matplotlib", "scipy"],
+    "analysis": ["tkinter", "matplotlib", "scipy"],
+    "batch": ["tkinter", "matplotlib", "scipy"],
+    "report": ["tkinter", "matplotlib.pyplot"]
+}
+
+child_code = """
+import sys, json, time, resource
+start = time.perf_counter()
+sample_path = {sample_path!r}
+{code}
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "elapsed": elapsed,
+    "modules": len(sys.modules),
+    "max_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*1024,
+    "heavy": [name for name in {heavy!r} if name in sys.modules]
+}}))
+"""
+
+def run_scenario(name, sample_path, repeat):
+    code = child_code.format(sample_path=sample_path, code=scenarios[name], heavy=heavy_modules)
+    directory = os.path.dirname(os.path.abspath(__file__))
+    runs = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", code], cwd=directory, capture_output=True,
+                                text=True, check=True).stdout
+        result = json.loads(output.splitlines()[-1])
+        result["wall"] = time.perf_counter() - start_time
+        runs.append(result)
+    loaded = runs[0]["heavy"]
+    return {
+        "wall_median": statistics.median(run["wall"] for run in runs),
+        "wall_min": min(run["wall"] for run in runs),
+        "import_median": statistics.median(run["elapsed"] for run in runs),
+        "modules": runs[0]["modules"],
+        "max_rss": max(run["max_rss"] for run in runs),
+        "heavy": loaded,
+        "forbidden": [name for name in forbidden[name] if name in loaded]
+    }
+
+def check_results(results, max_time=None):
+    problems = []
+    for name, result in results.items():
+        if result["forbidden"]:
+            problems.append(f"{name}: loads {', '.join(result['forbidden'])}")
+        if max_time is not None and result["wall_median"] > max_time:
+            problems.append(f"{name}: {result['wall_median']:.3f} s exceeds {max_time:.3f} s")
+    return problems
+
+def print_results(results):
+    print(f"{'scenario':<10} {'wall, s':>8} {'min, s':>8} {'modules':>8} {'RSS, MB':>8}  heavy modules")
+    for name, result in results.items():
+        print(f"{name:<10} {result['wall_median']:>8.3f} {result['wall_min']:>8.3f} {result['modules']:>8}"
+              f" {result['max_rss']/2**20:>8.1f}  {', '.join(result['heavy']) or '-'}")
+
+def parse_arguments(arguments):
+    parser = argparse.ArgumentParser(description="Measure cold-start time and import footprint of the entry points.")
+    parser.add_argument("-s", "--scenarios", nargs="+", choices=list(scenarios), default=list(scenarios))
+    parser.add_argument("-n", "--repeat", type=int, default=5, help="interpreter starts per scenario")
+    parser.add_argument("--sample", default=os.path.join("Sounds", "Elephant.wav"),
+                        help="WAV file used by the analysis scenario")
+    parser.add_argument("--max-time", type=float, default=None, help="fail when a median start takes longer, in s")
+    parser.add_argument("--output", default=None, help="write the results to a JSON file")
+    return parser.parse_args(arguments)
+
+def main(arguments=None):
+    args = parse_arguments(arguments)
+    sample_path = os.path.abspath(args.sample)
+    results = {name: run_scenario(name, sample_path, args.repeat) for name in args.scenarios}
+    print_results(results)
+    if args.output is not None:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+    problems = check_results(results, args.max_time)
+    for problem in problems:
+        print(f"FAILED {problem}")
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+from functools import lru_cache
+import numpy as np
+from audio_analysis import frame_signal, iter_data_blocks
+
+window_functions = {
+    "hann": lambda n: 0.5 - 0.5*np.cos(2*np.pi*n),
+    "hamming": lambda n: 0.54 - 0.46*np.cos(2*np.pi*n),
+    "blackman": lambda n: 0.42 - 0.5*np.cos(2*np.pi*n) + 0.08*np.cos(4*np.pi*n),
+    "rectangular": lambda n: np.ones_like(n)
+}
+
+@lru_cache(maxsize=32)
+def get_window(window, frame_size):
+    # periodic windows, so hop sizes that divide the frame size overlap-add evenly
+    values = window_functions[window](np.arange(frame_size)/frame_size)
+    values.flags.writeable = False
+    return values
+
+@lru_cache(maxsize=32)
+def get_window_norm(window, frame_size, hop_size):
+    # sum of squared analysis*synthesis windows seen by every output sample
+    squared = get_window(window, frame_size)**2
+    padded = np.zeros(-(-frame_size//hop_size)*hop_size)
+    padded[:frame_size] = squared
+    norm = padded.reshape(-1, hop_size).sum(axis=0)
+    norm[norm < 1e-10] = 1
+    norm.flags.writeable = False
+    return norm
+
+@lru_cache(maxsize=32)
+def get_bin_frequencies(fft_size, samplerate):
+    frequencies = np.fft.rfftfreq(fft_size, 1/samplerate)
+    frequencies.flags.writeable = False
+    return frequencies
+
+def stft(data, frame_size, hop_size, window="hann", fft_size=None):
+    fft_size = fft_size or frame_size
+    frames = frame_signal(data, frame_size, hop_size, tail="pad")
+    return np.fft.rfft(frames*get_window(window, frame_size), n=fft_size)
+
+def overlap_add(frames, hop_size):
+    frame_count, frame_size = frames.shape[-2:]
+    # every group of frames taken `stride` apart is non-overlapping and can be
+    # laid out end to end with a single reshape
+    stride = -(-frame_size//hop_size)
+    span = stride*hop_size
+    output = np.zeros(frames.shape[:-2] + ((frame_count - 1)*hop_size + frame_size,))
+    for i in range(min(stride, frame_count)):
+        group = frames[..., i::stride, :]
+        padded = np.zeros(group.shape[:-1] + (span,))
+        padded[..., :frame_size] = group
+        flat = padded.reshape(group.shape[:-2] + (-1,))
+        start = i*hop_size
+        length = min(flat.shape[-1], output.shape[-1] - start)
+        output[..., start:start + length] += flat[..., :length]
+    return output
+
+def istft(spectra, frame_size, hop_size, length, window="hann", fft_size=None):
+    fft_size = fft_size or frame_size
+    frames = np.fft.irfft(spectra, n=fft_size)[..., :frame_size]*get_window(window, frame_size)
+    output = overlap_add(frames, hop_size)
+    norm = np.resize(get_window_norm(window, frame_size, hop_size), output.shape[-1])
+    return (output/norm)[..., :length]
+
+class StftProcessor:
+
+    def __init__(self, modify, samplerate, channel_count, frame_size, hop_size, window="hann", fft_size=None):
+        self.modify = modify
+        self.samplerate = samplerate
+        self.frame_size = frame_size
+        self.hop_size = hop_size
+        self.window = get_window(window, frame_size)
+        self.norm = get_window_norm(window, frame_size, hop_size)
+        self.fft_size = fft_size or frame_size
+        # leading zeros give the first samples the same overlap as the rest
+        self.delay = frame_size - hop_size
+        self.pending = np.zeros((channel_count, self.delay))
+        self.overlap = np.zeros((channel_count, self.delay))
+        self.frame_start = -self.delay
+        self.input_length = 0
+        self.output_length = 0
+
+    def process_frames(self):
+        if self.pending.shape[-1] < self.frame_size:
+            return np.zeros((self.pending.shape[0], 0))
+
+        frames = frame_signal(self.pending, self.frame_size, self.hop_size, tail="drop")
+        frame_count = frames.shape[-2]
+        spectra = np.fft.rfft(frames*self.window, n=self.fft_size)
+        frame_starts = self.frame_start + np.arange(frame_count)*self.hop_size
+        spectra = self.modify(spectra, self.samplerate, self.fft_size, frame_starts)
+        frames = np.fft.irfft(spectra, n=self.fft_size)[..., :self.frame_size]*self.window
+
+        output = overlap_add(frames, self.hop_size)
+        output[:, :self.delay] += self.overlap
+        emitted = frame_count*self.hop_size
+        self.overlap = output[:, emitted:]
+        self.pending = self.pending[:, emitted:]
+        self.frame_start += emitted
+        return output[:, :emitted]/np.tile(self.norm, frame_count)
+
+    def trim(self, output):
+        # drop the output of the leading zeros and anything past the input
+        start = self.output_length
+        self.output_length += output.shape[-1]
+        first = max(self.delay - start, 0)
+        last = min(output.shape[-1], self.delay + self.input_length - start)
+        return output[:, first:max(last, first)]
+
+    def process(self, block):
+        block = np.atleast_2d(np.asarray(block, dtype=float))
+        self.input_length += block.shape[-1]
+        self.pending = np.concatenate((self.pending, block), axis=-1)
+        return self.trim(self.process_frames())
+
+    def flush(self):
+        padding = self.frame_size + self.hop_size - self.pending.shape[-1] % self.hop_size
+        self.pending = np.concatenate((self.pending, np.zeros((self.pending.shape[0], padding))), axis=-1)
+        return self.trim(self.process_frames())
+
+def process_signal(data, modify, samplerate, frame_size, hop_size, window="hann", fft_size=None, block_size=2**16):
+    data = np.atleast_2d(data)
+    processor = StftProcessor(modify, samplerate, data.shape[0], frame_size, hop_size, window, fft_size)
+    for _, block in iter_data_blocks(data, block_size):
+        yield processor.process(block)
+    yield processor.flush()
@@ -0,0 +1,186 @@
+import sys
+import time
+import argparse
+import numpy as np
+from wav_io import WavSource, get_sample_scale
+from audio_analysis import (calculate_frame_energy, calculate_frame_zero_crossing_rate, frame_signal,
+                            get_frame_size, get_hop_size, get_hysteresis_mask, center_samples)
+
+def replay_wav(file_path, block_size=1024, realtime=False):
+    # stands in for a live feed: channel-major blocks, optionally paced at the samplerate
+    source = WavSource(file_path)
+    start_time = time.perf_counter()
+    for start, block in source.iter_blocks(block_size):
+        if realtime:
+            delay = start/source.samplerate - (time.perf_counter() - start_time)
+            if delay > 0:
+                time.sleep(delay)
+        yield np.array(block)
+
+class RingBuffer:
+
+    def __init__(self, channel_count, capacity, dtype=float):
+        # every sample is stored twice, capacity apart, so any window of up to
+        # capacity samples is a contiguous slice and can be framed without a copy
+        self.buffer = np.zeros((channel_count, 2*capacity), dtype=dtype)
+        self.capacity = capacity
+        self.start = 0
+        self.end = 0
+
+    @property
+    def size(self):
+        return self.end - self.start
+
+    def write(self, block):
+        length = block.shape[-1]
+        if self.size + length > self.capacity:
+            raise ValueError(f"Ring buffer overflow: {self.size + length} > {self.capacity} samples")
+        offset = self.end % self.capacity
+        first = min(length, self.capacity - offset)
+        for position in (offset, offset + self.capacity):
+            self.buffer[:, position:position + first] = block[:, :first]
+        self.buffer[:, :length - first] = block[:, first:]
+        self.buffer[:, self.capacity:self.capacity + length - first] = block[:, first:]
+        self.end += length
+
+    def get(self, start, stop):
+        offset = start % self.capacity
+        return self.buffer[:, offset:offset + stop - start]
+
+    def discard(self, until):
+        self.start = min(max(until, self.start), self.end)
+
+class StreamingAnalyzer:
+
+    def __init__(self, samplerate, channel_count, frame_size_in_ms=20, frame_overlap=0.5, on_threshold=0.01,
+                 off_threshold=None, dtype=np.int16, max_block_size=2**16):
+        self.samplerate = samplerate
+        self.channel_count = channel_count
+        self.frame_size = get_frame_size(frame_size_in_ms, samplerate)
+        self.hop_size = get_hop_size(self.frame_size, frame_overlap)
+        self.on_threshold = on_threshold
+        self.off_threshold = on_threshold if off_threshold is None else off_threshold
+        # segment thresholds apply to the mean square relative to full scale;
+        # unsigned samples are centred first so their offset is not counted as energy
+        self.dtype = np.dtype(dtype)
+        self.offset, scale = get_sample_scale(dtype)
+        self.reference = self.frame_size*scale**2
+        self.chunk_size = max_block_size
+        self.ring = RingBuffer(channel_count, self.frame_size + max_block_size, float if self.offset else dtype)
+        self.next_frame = 0
+        self.frame_index = 0
+        self.active = np.zeros(channel_count, dtype=bool)
+        self.latencies = []
+
+    @property
+    def latency(self):
+        # a frame is reported as soon as its last sample arrives
+        return self.frame_size/self.samplerate
+
+    def process_chunk(self, chunk):
+        self.ring.write(chunk)
+        available = self.ring.end - self.next_frame
+        if available < self.frame_size:
+            return np.zeros((self.channel_count, 0)), np.zeros((self.channel_count, 0))
+        frame_count = (available - self.frame_size)//self.hop_size + 1
+        window_end = self.next_frame + (frame_count - 1)*self.hop_size + self.frame_size
+        frames = frame_signal(self.ring.get(self.next_frame, window_end), self.frame_size, self.hop_size, tail="drop")
+        self.next_frame += frame_count*self.hop_size
+        self.ring.discard(self.next_frame)
+        return calculate_frame_energy(frames), calculate_frame_zero_crossing_rate(frames)
+
+    def get_events(self, level):
+        # the previous state goes in front as an already decided frame, so the
+        # hysteresis continues across blocks exactly as it does offline
+        previous = np.where(self.active, np.inf, -np.inf)[:, np.newaxis]
+        mask = get_hysteresis_mask(np.concatenate((previous, level), axis=-1),
+                                   self.on_threshold, self.off_threshold)
+        self.active = mask[:, -1]
+        changes = np.diff(mask.astype(np.int8), axis=-1)
+        events = []
+        for channel, frame in zip(*np.nonzero(changes)):
+            frame_index = self.frame_index + frame
+            # a segment ends where its last frame ends, like the offline segment table
+            sample = frame_index*self.hop_size
+            if changes[channel, frame] < 0:
+                sample = (frame_index - 1)*self.hop_size + self.frame_size
+            events.append({
+                "type": "start" if changes[channel, frame] > 0 else "end",
+                "channel": int(channel),
+                "frame": int(frame_index),
+                "sample": int(sample),
+                "time": sample/self.samplerate
+            })
+        events.sort(key=lambda event: (event["frame"], event["channel"]))
+        return events
+
+    def process(self, block):
+        start_time = time.perf_counter()
+        block = np.atleast_2d(block)
+        block = center_samples(block, self.dtype)
+        energy, zcr = [], []
+        for start in range(0, block.shape[-1], self.chunk_size):
+            chunk_energy, chunk_zcr = self.process_chunk(block[:, start:start + self.chunk_size])
+            energy.append(chunk_energy)
+            zcr.append(chunk_zcr)
+        energy = np.concatenate(energy, axis=-1)
+        zcr = np.concatenate(zcr, axis=-1)
+        frames = self.frame_index + np.arange(energy.shape[-1])
+        events = self.get_events(energy/self.reference)
+        self.frame_index += energy.shape[-1]
+        self.latencies.append(time.perf_counter() - start_time)
+        return {
+            "frames": frames,
+            "time": frames*self.hop_size/self.samplerate,
+            "energy": energy,
+            "zcr": zcr,
+            "events": events,
+            "latency": self.latencies[-1]
+        }
+
+    def get_latency_stats(self):
+        latencies = np.array(self.latencies)
+        if latencies.size == 0:
+            return {"blocks": 0}
+        return {
+            "blocks": len(latencies),
+            "mean": float(latencies.mean()),
+            "p95": float(np.percentile(latencies, 95)),
+            "max": float(latencies.max()),
+            "frame_latency": self.latency
+        }
+
+def stream_analysis(blocks, samplerate, channel_count, **parameters):
+    analyzer = StreamingAnalyzer(samplerate, channel_count, **parameters)
+    for block in blocks:
+        yield analyzer.process(block)
+
+def parse_arguments(arguments):
+    parser = argparse.ArgumentParser(description="Replay a WAV file as a live feed and print segment events.")
+    parser.add_argument("path", help="WAV file to replay")
+    parser.add_argument("--block-size", type=int, default=1024, help="samples per incoming block")
+    parser.add_argument("--frame-size", type=int, default=20, help="frame size in ms")
+    parser.add_argument("--on", type=float, default=0.01, help="level that starts a segment, relative to full scale")
+    parser.add_argument("--off", type=float, default=None, help="level that ends a segment, --on by default")
+    parser.add_argument("--realtime", action="store_true", help="deliver blocks at the file's samplerate")
+    return parser.parse_args(arguments)
+
+def main(arguments=None):
+    args = parse_arguments(arguments)
+    source = WavSource(args.path)
+    analyzer = StreamingAnalyzer(source.samplerate, source.channel_count, args.frame_size, on_threshold=args.on,
+                                 off_threshold=args.off, dtype=source.dtype)
+    frame_count = 0
+    for block in replay_wav(args.path, args.block_size, args.realtime):
+        result = analyzer.process(block)
+        frame_count += len(result["frames"])
+        for event in result["events"]:
+            print(f"{event['time']:>10.3f} s  channel {event['channel']}  segment {event['type']}")
+    stats = analyzer.get_latency_stats()
+    print(f"{frame_count} frames in {stats['blocks']} blocks, block processing mean {stats['mean']*1000:.3f} ms,"
+          f" p95 {stats['p95']*1000:.3f} ms, max {stats['max']*1000:.3f} ms;"
+          f" frame latency {stats['frame_latency']*1000:.1f} ms")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,29 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from wav_io import WavWriter
+
+def get_signal(dtype, channel_count, length=4000, seed=0):
+    # noise with a slow offset, so frames differ in energy and sign changes
+    random = np.random.default_rng(seed)
+    values = random.normal(0, 0.2, (channel_count, length)) + 0.3*np.sin(np.arange(length)/300)
+    dtype = np.dtype(dtype)
+    if dtype.kind in 'iu':
+        offset = 128 if dtype.kind == 'u' else 0
+        limits = np.iinfo(dtype)
+        return np.clip(np.rint(values*(limits.max + 1 - offset)) + offset, limits.min, limits.max).astype(dtype)
+    return values.astype(dtype)
+
+@pytest.fixture
+def write_wav(tmp_path):
+    def write(samples, samplerate=8000, name="test.wav", **options):
+        samples = np.atleast_2d(samples)
+        path = str(tmp_path / name)
+        with WavWriter(path, samplerate, samples.shape[0], dtype=samples.dtype, **options) as writer:
+            writer.write(samples)
+        return path
+    return write
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+from conftest import get_signal
+from audio_analysis import (calculate_energy, calculate_zero_crossing_rate, calculate_frame_energy,
+                            calculate_frame_zero_crossing_rate, normalize_data, frame_signal)
+
+signals = pytest.mark.parametrize("dtype, channel_count", [
+    (np.int16, 1), (np.int16, 3), (np.float32, 1), (np.float64, 2)
+])
+
+def normalize_reference(values):
+    min_val, max_val = min(values), max(values)
+    return [(value - min_val)/(max_val - min_val) for value in values]
+
+@signals
+def test_frame_energy_matches_reference(dtype, channel_count):
+    frames = frame_signal(get_signal(dtype, channel_count), 64, 32)
+    energy = calculate_frame_energy(frames)
+    assert energy.shape == frames.shape[:-1]
+    for channel in range(channel_count):
+        # python numbers, so the reference neither overflows nor rounds to float32
+        expected = calculate_energy(frames[channel].tolist())
+        np.testing.assert_allclose(energy[channel], expected, rtol=1e-6)
+
+@signals
+def test_frame_zero_crossing_rate_matches_reference(dtype, channel_count):
+    frames = frame_signal(get_signal(dtype, channel_count), 64, 32)
+    zcr = calculate_frame_zero_crossing_rate(frames)
+    for channel in range(channel_count):
+        np.testing.assert_allclose(zcr[channel], calculate_zero_crossing_rate(frames[channel].tolist()))
+
+@signals
+def test_normalize_data_matches_reference(dtype, channel_count):
+    data = get_signal(dtype, channel_count)
+    normalized = normalize_data(data)
+    for channel in range(channel_count):
+        np.testing.assert_allclose(normalized[channel], normalize_reference(data[channel].tolist()), atol=1e-12)
+
+def test_normalize_data_of_constant_data():
+    np.testing.assert_array_equal(normalize_data(np.full((2, 5), 7)), np.zeros((2, 5)))
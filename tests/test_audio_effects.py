@@ -0,0 +1,53 @@
+import math
+import numpy as np
+import pytest
+from conftest import get_signal
+from audio_effects import apply_fade, get_fade_curve
+
+def linear_fade_reference(data, fade_value_count):
+    fade_factor = 1/fade_value_count
+    fade_in = [round(data[i]*fade_factor*(i + 1)) for i in range(fade_value_count)]
+    start = len(data) - fade_value_count
+    fade_out = [round(data[i]*(1 - fade_factor*(i - start + 1))) for i in range(start, len(data))]
+    return fade_in, fade_out
+
+def log_fade_reference(data, fade_value_count):
+    fade_factor = (math.e**2)/fade_value_count
+    fade_in = [round(data[i]*(1 - math.exp(-fade_factor*(i + 1)))) for i in range(fade_value_count)]
+    start = len(data) - fade_value_count
+    fade_out = [round(data[i]*(1 - math.exp(-fade_factor*(fade_value_count - (i - start + 1)))))
+                for i in range(start, len(data))]
+    return fade_in, fade_out
+
+@pytest.mark.parametrize("fade_type, reference", [("linear", linear_fade_reference), ("log", log_fade_reference)])
+@pytest.mark.parametrize("count", [1, 7, 400])
+def test_fades_match_the_old_formulas(fade_type, reference, count):
+    data = get_signal(np.int16, 2, 1000)
+    faded = apply_fade(data.copy(), count, fade_type=fade_type)
+    for channel in range(2):
+        fade_in, fade_out = reference(data[channel].tolist(), count)
+        # (i + 1)/n and (1/n)*(i + 1) can round to different sides of .5, one step apart
+        np.testing.assert_allclose(faded[channel, :count], fade_in, atol=1)
+        np.testing.assert_allclose(faded[channel, 1000 - count:], fade_out, atol=1)
+        np.testing.assert_array_equal(faded[channel, count:1000 - count], data[channel, count:1000 - count])
+
+@pytest.mark.parametrize("fade_type", ["linear", "log", "equal_power", "s_curve"])
+def test_curves_rise_to_one(fade_type):
+    fade_in = get_fade_curve(100, fade_type, "in")
+    fade_out = get_fade_curve(100, fade_type, "out")
+    assert np.all(np.diff(fade_in) > 0) and np.all(np.diff(fade_out) < 0)
+    assert fade_in[-1] == pytest.approx(1, abs=1e-3) and fade_out[-1] == pytest.approx(0, abs=1e-12)
+
+def test_fade_in_and_out_lengths_differ():
+    data = np.ones((1, 100))
+    apply_fade(data, 10, 30, "linear")
+    np.testing.assert_allclose(data[0, :10], np.arange(1, 11)/10)
+    np.testing.assert_allclose(data[0, 70:], np.arange(29, -1, -1)/30)
+    assert np.all(data[0, 10:70] == 1)
+
+def test_unsigned_samples_fade_towards_their_offset():
+    data = np.full((2, 200), 200, dtype=np.uint8)
+    apply_fade(data, 50, 50, "linear")
+    assert data[:, 0].tolist() == [129, 129] and data[:, -1].tolist() == [128, 128]
+    np.testing.assert_array_equal(data[:, :50], np.rint(72*np.arange(1, 51)/50 + 128)[np.newaxis].repeat(2, 0))
+    assert np.all(data[:, 50:150] == 200)
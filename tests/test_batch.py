@@ -0,0 +1,33 @@
+import os
+import json
+import numpy as np
+from conftest import get_signal
+from batch import main
+
+def test_failed_files_do_not_stop_the_batch(tmp_path, write_wav):
+    write_wav(get_signal(np.int16, 1, 8000), name="mono.wav")
+    write_wav(get_signal(np.int16, 2, 6000), name="stereo.wav")
+    with open(tmp_path / "broken.wav", "wb") as broken:
+        broken.write(b"RIFF\0\0\0\0WAVEjunk")
+    output_dir = str(tmp_path / "output")
+    assert main([str(tmp_path), "-o", output_dir, "--no-plots", "-j", "2", "-a", "energy", "zcr", "segments"]) == 1
+
+    with open(os.path.join(output_dir, "summary.json")) as summary_file:
+        report = json.load(summary_file)
+    assert (report["succeeded"], report["failed"]) == (2, 1)
+    files = {os.path.basename(summary["file"]): summary for summary in report["files"]}
+    assert list(files) == ["broken.wav", "mono.wav", "stereo.wav"]
+    assert files["broken.wav"]["status"] == "error"
+    assert files["broken.wav"]["error"].startswith("WavFormatError")
+    assert "Traceback" in files["broken.wav"]["traceback"]
+    for name, channel_count in (("mono", 1), ("stereo", 2)):
+        summary = files[f"{name}.wav"]
+        assert summary["status"] == "ok" and summary["channels"] == channel_count
+        with np.load(os.path.join(output_dir, f"{name}.npz")) as results:
+            assert sorted(results.files) == summary["outputs"]
+            assert results["energy"].shape[0] == channel_count
+    assert report["options"]["analyses"] == ["energy", "zcr", "segments"]
+
+def test_batch_of_good_files_succeeds(tmp_path, write_wav):
+    path = write_wav(get_signal(np.uint8, 1, 4000))
+    assert main([path, "-o", str(tmp_path / "output"), "--no-plots", "-j", "1"]) == 0
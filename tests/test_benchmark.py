@@ -0,0 +1,42 @@
+import json
+import numpy as np
+import pytest
+from conftest import get_signal
+from benchmark import compare_results, parse_duration, main
+
+def get_results(**stages):
+    return {"results": {key: {"seconds": seconds, "peak_bytes": peak} for key, (seconds, peak) in stages.items()}}
+
+def test_slack_hides_noise_on_fast_stages():
+    baseline = get_results(fast=(0.0002, 1000), slow=(1.0, 2**20))
+    # 3x slower, but by less than the 1 ms time slack and the 1 MB memory slack
+    regressions, improvements = compare_results(get_results(fast=(0.0006, 2**19), slow=(1.1, 2**20)), baseline)
+    assert regressions == [] and improvements == []
+
+def test_regressions_and_improvements_past_the_threshold():
+    baseline = get_results(energy=(0.1, 2**20), zcr=(0.1, 2**20), load=(0.1, 2**20), new=(0.1, 0))
+    results = get_results(energy=(0.2, 2**20), zcr=(0.05, 2**20), load=(0.1, 10*2**20), other=(5.0, 0))
+    regressions, improvements = compare_results(results, baseline)
+    assert [line.split(":")[0] for line in regressions] == ["energy", "load"]
+    assert "peak memory" in regressions[1]
+    assert [line.split(":")[0] for line in improvements] == ["zcr"]
+    # within the threshold nothing is reported, stages missing from the baseline are skipped
+    assert compare_results(results, baseline, threshold=10) == ([], [])
+
+def test_parse_duration():
+    assert [parse_duration(value) for value in ("30", "30s", "2m", "1.5h")] == [30, 30, 120, 5400]
+
+def test_saved_baseline_compares_against_itself(tmp_path, write_wav):
+    path = write_wav(get_signal(np.int16, 2, 8000))
+    baseline = str(tmp_path / "baseline.json")
+    assert main([path, "-s", "energy", "zcr", "-d", "-n", "1", "--save", baseline]) == 0
+    with open(baseline) as baseline_file:
+        saved = json.load(baseline_file)
+    assert sorted(saved["results"]) == ["test.wav/energy", "test.wav/zcr"]
+    # a baseline ten times slower leaves room for any timer noise
+    for result in saved["results"].values():
+        result["seconds"] *= 10
+        result["peak_bytes"] *= 10
+    with open(baseline, "w") as baseline_file:
+        json.dump(saved, baseline_file)
+    assert main([path, "-s", "energy", "zcr", "-d", "-n", "1", "--compare", baseline]) == 0
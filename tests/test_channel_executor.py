@@ -0,0 +1,45 @@
+import time
+import numpy as np
+import pytest
+from conftest import get_signal
+from file_data import read_file
+from channel_executor import ChannelExecutor
+from handle_data import handle_signal
+from features import get_feature_table
+
+def sleep_and_return(item, scale):
+    # later items finish first
+    time.sleep(0.01*(5 - item))
+    return item*scale
+
+def get_channel_sums(data):
+    return np.asarray(data.read_block(0, data.length) if hasattr(data, "read_block") else data).sum(dtype=np.int64)
+
+@pytest.mark.parametrize("kind", ["thread", "process"])
+def test_results_come_back_in_order(kind):
+    with ChannelExecutor(4, kind) as executor:
+        assert executor.map(sleep_and_return, range(5), 10) == [0, 10, 20, 30, 40]
+
+@pytest.mark.parametrize("kind", ["thread", "process"])
+def test_channels_come_back_in_channel_order(write_wav, kind):
+    data = get_signal(np.int16, 5, 3000)
+    file = read_file(write_wav(data))
+    with ChannelExecutor(3, kind) as executor:
+        assert executor.map_channels(get_channel_sums, file) == data.sum(axis=-1, dtype=np.int64).tolist()
+
+def test_unknown_executor_type():
+    with pytest.raises(ValueError):
+        ChannelExecutor(2, "fiber")
+
+@pytest.mark.parametrize("kind", ["thread", "process"])
+def test_parallel_analysis_matches_serial(write_wav, kind):
+    file = read_file(write_wav(get_signal(np.int16, 4, 20000)))
+    with ChannelExecutor(4, kind) as executor:
+        for plot_type, value_name in (("energyPlot", "energy"), ("zeroCrossingRatePlot", "normalized_zcr")):
+            parallel = handle_signal(file, plot_type, lambda *args, **kwargs: None, frame_size_in_ms=20, cache=None,
+                                     indexes=None, executor=executor)
+            serial = handle_signal(file, plot_type, lambda *args, **kwargs: None, frame_size_in_ms=20, cache=None,
+                                   indexes=None)
+            np.testing.assert_array_equal(getattr(parallel, value_name), getattr(serial, value_name))
+        table = get_feature_table(file, 20, ["rms", "zcr", "centroid"], cache=None, executor=executor)
+        np.testing.assert_array_equal(table, get_feature_table(file, 20, ["rms", "zcr", "centroid"], cache=None))
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+from conftest import get_signal
+from wav_io import WavSource
+from file_data import read_file
+from export import export_file
+from batch import get_options, parse_arguments
+
+def get_export_options(*arguments):
+    # the export options as the batch command line gives them
+    return get_options(parse_arguments(["Sounds", *arguments]))["export"]
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.int16, np.float32])
+def test_native_export_keeps_the_samples(tmp_path, write_wav, dtype):
+    data = get_signal(dtype, 2, 70000)
+    file = read_file(write_wav(data))
+    path = export_file(file, output_dir=str(tmp_path / "exported"), **get_export_options())
+    source = WavSource(path)
+    assert (source.dtype, source.bit_depth) == (np.dtype(dtype), np.dtype(dtype).itemsize*8)
+    np.testing.assert_array_equal(source.get_channels(), data)
+
+def test_export_converts_the_sample_format(tmp_path, write_wav):
+    data = get_signal(np.int16, 1, 1000)
+    file = read_file(write_wav(data))
+    options = get_export_options("--export-format", "pcm24")
+    source = WavSource(export_file(file, output_dir=str(tmp_path), file_name="out.wav", **options))
+    assert source.bit_depth == 24
+    np.testing.assert_array_equal(source.get_channels(), data.astype(np.int32) << 16)
+
+def test_modified_blocks_are_clipped_or_refused(tmp_path, write_wav):
+    file = read_file(write_wav(get_signal(np.int16, 1, 1000)))
+    blocks = [np.array([[0.0, 40000.0, -40000.0]])]
+    source = WavSource(export_file(file, blocks, str(tmp_path), **get_export_options()))
+    np.testing.assert_array_equal(source.get_channels(), [[0, 32767, -32768]])
+    with pytest.raises(OverflowError):
+        export_file(file, blocks, str(tmp_path), **get_export_options("--no-clip"))
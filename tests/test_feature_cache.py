@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+from conftest import get_signal
+from file_data import read_file
+import feature_cache
+from feature_cache import FeatureCache, get_cache_key
+
+def test_cache_key_includes_the_version(monkeypatch):
+    key = get_cache_key("hash", {"frame_size": 20})
+    monkeypatch.setattr(feature_cache, "cache_version", feature_cache.cache_version + 1)
+    assert get_cache_key("hash", {"frame_size": 20}) != key
+
+def test_entries_are_reused_from_disk(tmp_path, write_wav):
+    file = read_file(write_wav(get_signal(np.int16, 1, 1000)))
+    compute = lambda: {"values": np.arange(10)}
+    FeatureCache(str(tmp_path)).get_or_compute(file, {"a": 1}, compute)
+    cache = FeatureCache(str(tmp_path))
+    values = cache.get_or_compute(file, {"a": 1}, lambda: pytest.fail("computed again"))
+    np.testing.assert_array_equal(values["values"], np.arange(10))
+    assert cache.get_stats()["disk_hits"] == 1
+
+@pytest.mark.parametrize("content", [b"", b"not a zip file", b"PK\x03\x04broken"])
+def test_corrupt_entries_are_computed_again(tmp_path, write_wav, content):
+    file = read_file(write_wav(get_signal(np.int16, 1, 1000)))
+    cache = FeatureCache(str(tmp_path))
+    cache.get_or_compute(file, {"a": 1}, lambda: {"values": np.arange(10)})
+    [path] = cache.get_disk_entries()
+    with open(path, "wb") as entry:
+        entry.write(content)
+    cache = FeatureCache(str(tmp_path))
+    values = cache.get_or_compute(file, {"a": 1}, lambda: {"values": np.arange(5)})
+    np.testing.assert_array_equal(values["values"], np.arange(5))
+    assert cache.get_stats()["misses"] == 1
+    assert FeatureCache(str(tmp_path)).get_or_compute(file, {"a": 1}, lambda: pytest.fail("computed again"))
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from conftest import get_signal
+from file_data import read_file
+from feature_index import FeatureIndexCache
+from channel_executor import ChannelExecutor
+from audio_analysis import (frame_signal, normalize_data, center_samples, calculate_block_features, calculate_frame_energy,
+                            calculate_frame_zero_crossing_rate)
+
+frame_sizes = [(80, 40), (128, 64), (441, 220), (1000, 500), (3000, 1500)]
+
+@pytest.mark.parametrize("dtype, channel_count, length", [
+    (np.int16, 1, 20000), (np.int16, 3, 12345), (np.uint8, 1, 9999), (np.float32, 2, 7777),
+    (np.int16, 1, 100)
+])
+@pytest.mark.parametrize("workers", [1, 3])
+def test_index_matches_framing(tmp_path, write_wav, dtype, channel_count, length, workers):
+    data = get_signal(dtype, channel_count, length)
+    file = read_file(write_wav(data))
+    with ChannelExecutor(workers) as executor:
+        index = FeatureIndexCache(str(tmp_path / "index")).get(file, executor)
+    for frame_size, hop_size in frame_sizes:
+        if frame_size > length:
+            continue
+        frames = frame_signal(center_samples(data), frame_size, hop_size)
+        normalized_frames = frame_signal(normalize_data(data), frame_size, hop_size)
+        expected = normalize_data(calculate_block_features(normalized_frames, calculate_frame_energy))
+        np.testing.assert_allclose(index.get_energy(frame_size, hop_size), expected, atol=1e-9)
+        np.testing.assert_allclose(index.get_zcr(frame_size, hop_size),
+                                   calculate_block_features(frames, calculate_frame_zero_crossing_rate))
+
+def test_index_is_reused_from_disk(tmp_path, write_wav):
+    file = read_file(write_wav(get_signal(np.int16, 2, 5000)))
+    indexes = FeatureIndexCache(str(tmp_path / "index"))
+    first = indexes.get(file)
+    second = FeatureIndexCache(str(tmp_path / "index")).get(read_file(write_wav(file.channels, name="copy.wav")))
+    assert len(indexes.get_disk_entries()) == 1
+    np.testing.assert_array_equal(first.get_energy(400, 200), second.get_energy(400, 200))
+
+def test_index_needs_a_directory(write_wav):
+    assert FeatureIndexCache().get(read_file(write_wav(get_signal(np.int16, 1, 1000)))) is None
+
+def test_plot_values_match_with_and_without_index(tmp_path, write_wav):
+    from handle_data import PlotEnergy, PlotZcr
+    from audio_analysis import get_data_frame_blocks, get_normalized_data_frame_blocks
+    file = read_file(write_wav(get_signal(np.int16, 2, 30000)))
+    file.set_frame_size(35)
+    indexes = FeatureIndexCache(str(tmp_path / "index"))
+    for plot, get_frames in ((PlotEnergy, get_normalized_data_frame_blocks), (PlotZcr, get_data_frame_blocks)):
+        indexed = plot(35, cache=None, indexes=indexes).get_values(file, get_frames)
+        framed = plot(35, cache=None, indexes=None).get_values(file, get_frames)
+        np.testing.assert_allclose(indexed, framed, atol=1e-9)
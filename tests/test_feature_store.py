@@ -0,0 +1,111 @@
+import os
+import multiprocessing
+import numpy as np
+import pytest
+from conftest import get_signal
+from file_data import read_file
+from feature_store import FeatureStore, column_header_size
+
+def get_frames(seed, channel_count=2, frame_count=50):
+    random = np.random.default_rng(seed)
+    return {"rms": random.random((channel_count, frame_count)),
+            "zcr": random.random((channel_count, frame_count)).astype(np.float32)}
+
+def get_segments(seed):
+    table = np.zeros(3, dtype=[("channel", np.int64), ("start", np.int64), ("end", np.int64)])
+    table["start"] = np.arange(3)*100 + seed
+    table["end"] = table["start"] + 50
+    return table
+
+def test_appended_rows_are_read_back_after_reopening(tmp_path, write_wav):
+    files = [read_file(write_wav(get_signal(np.int16, 2, 8000, seed), name=f"{seed}.wav")) for seed in range(3)]
+    store = FeatureStore(str(tmp_path / "store"))
+    for seed, file in enumerate(files):
+        store.append(file, 160, 80, frames=get_frames(seed), tables={"segments": get_segments(seed)})
+    store = FeatureStore(str(tmp_path / "store"))
+    assert [entry["file"] for entry in store.get_entries()] == ["0.wav", "1.wav", "2.wav"]
+    for seed, file in enumerate(files):
+        for name in (file.file_name, file.get_content_hash()):
+            values = store.get_frames(name)
+            for column, expected in get_frames(seed).items():
+                assert values[column].dtype == expected.dtype
+                np.testing.assert_array_equal(values[column], expected)
+            np.testing.assert_array_equal(store.get_table(name, "segments"), get_segments(seed))
+
+def test_column_header_is_rewritten_in_place(tmp_path, write_wav):
+    file = read_file(write_wav(get_signal(np.int16, 2, 8000)))
+    store = FeatureStore(str(tmp_path))
+    store.append(file, 160, 80, frames=get_frames(0))
+    path = store.get_column_path("frames", "rms")
+    with open(path, "rb") as column_file:
+        first = column_file.read()
+    store.append(file, 160, 80, frames=get_frames(1))
+    with open(path, "rb") as column_file:
+        second = column_file.read()
+    # the data of the first append stays where it was, only the header's shape changes
+    assert len(first) == column_header_size + 100*8 and len(second) == column_header_size + 200*8
+    assert second[column_header_size:len(first)] == first[column_header_size:]
+    assert second[:column_header_size] != first[:column_header_size]
+    with open(path, "rb") as column_file:
+        np.lib.format.read_magic(column_file)
+        assert np.lib.format.read_array_header_1_0(column_file)[0] == (200,)
+        assert column_file.tell() == column_header_size
+    np.testing.assert_array_equal(np.load(path), np.concatenate([get_frames(0)["rms"].ravel(),
+                                                                 get_frames(1)["rms"].ravel()]))
+
+def test_frame_ranges(tmp_path, write_wav):
+    file = read_file(write_wav(get_signal(np.int16, 2, 8000)))
+    store = FeatureStore(str(tmp_path))
+    store.append(file, 160, 80, frames=get_frames(0))
+    expected = get_frames(0)["rms"]
+    # frames starting in [start, end) seconds, 100 frames a second
+    values = store.get_frames(file.file_name, 0.1, 0.255)
+    np.testing.assert_array_equal(values["frame"], np.arange(10, 26))
+    np.testing.assert_allclose(values["time"], np.arange(10, 26)/100)
+    np.testing.assert_array_equal(values["rms"], expected[:, 10:26])
+    values = store.get_frames(file.file_name, 0.4, 10, columns=["rms"], channels=1)
+    assert set(values) == {"frame", "time", "rms"}
+    np.testing.assert_array_equal(values["rms"], expected[1, 40:])
+    assert store.get_frames(file.file_name, 0.3, 0.2)["rms"].shape == (2, 0)
+    with pytest.raises(KeyError):
+        store.get_frames("missing.wav")
+
+def append_entries(directory, path, seed, count):
+    store = FeatureStore(directory)
+    file = read_file(path)
+    for i in range(count):
+        store.append(file, 160, 80, frames=get_frames(seed*100 + i, frame_count=20 + i),
+                     tables={"segments": get_segments(seed*100 + i)})
+
+def test_concurrent_appends_do_not_corrupt_the_store(tmp_path, write_wav):
+    directory = str(tmp_path / "store")
+    paths = [write_wav(get_signal(np.int16, 2, 4000, seed), name=f"{seed}.wav") for seed in range(4)]
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=append_entries, args=(directory, path, seed, 5))
+                 for seed, path in enumerate(paths)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+        assert process.exitcode == 0
+
+    store = FeatureStore(directory)
+    entries = store.get_entries()
+    assert len(entries) == 20
+    assert store.manifest["groups"]["frames"]["length"] == sum(2*(20 + i) for i in range(5))*4
+    for column in ("rms", "zcr"):
+        assert len(np.load(store.get_column_path("frames", column), mmap_mode="r")) == \
+            store.manifest["groups"]["frames"]["length"]
+    counts = {}
+    for entry in entries:
+        seed = int(entry["file"][0])
+        i = counts.get(seed, 0)
+        counts[seed] = i + 1
+        group = entry["groups"]["frames"]
+        for column, expected in get_frames(seed*100 + i, frame_count=20 + i).items():
+            rows = store.get_column("frames", column)[group["offset"]:group["offset"] + group["length"]]
+            np.testing.assert_array_equal(rows.reshape(2, -1), expected)
+        segments = entry["groups"]["segments"]
+        np.testing.assert_array_equal(store.get_column("segments", "start")[segments["offset"]:segments["offset"] + 3],
+                                      get_segments(seed*100 + i)["start"])
+    assert counts == {seed: 5 for seed in range(4)}
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from conftest import get_signal
+from audio_analysis import calculate_zero_crossing_rate, center_samples
+from features import extract_features, get_band_edges, default_bands
+
+def get_frame_starts(length, frame_size, hop_size):
+    starts = list(range(0, length - frame_size + 1, hop_size))
+    if starts[-1] + frame_size < length:
+        starts.append(length - frame_size)
+    return starts
+
+def get_reference(channel, samplerate, frame_size, hop_size):
+    # one frame at a time, straight from the definitions
+    window = 0.5 - 0.5*np.cos(2*np.pi*np.arange(frame_size)/frame_size)
+    frequencies = np.arange(frame_size//2 + 1)*samplerate/frame_size
+    minimum, value_range = channel.min(), channel.max() - channel.min()
+    rows, previous = [], None
+    for start in get_frame_starts(len(channel), frame_size, hop_size):
+        frame = channel[start:start + frame_size]
+        magnitudes = np.abs(np.fft.rfft(frame*window))
+        power = magnitudes**2
+        centroid = np.sum(frequencies*power)/np.sum(power)
+        row = {
+            "energy": np.sum(((frame - minimum)/value_range)**2),
+            "rms": np.sqrt(np.mean(frame**2)),
+            "zcr": calculate_zero_crossing_rate([frame.tolist()])[0],
+            "centroid": centroid,
+            "bandwidth": np.sqrt(np.sum(power*(frequencies - centroid)**2)/np.sum(power)),
+            "rolloff": frequencies[np.argmax(np.cumsum(power) >= 0.85*np.sum(power))],
+            "flatness": np.exp(np.mean(np.log(power + 1e-20)))/np.mean(power + 1e-20),
+            "flux": 0.0 if previous is None else np.linalg.norm(magnitudes - previous)
+        }
+        for low, high in get_band_edges(samplerate, default_bands):
+            row[f"band_{low:g}_{high:g}"] = np.sum(power[(frequencies >= low) & (frequencies < high)]) \
+                if high < samplerate/2 else np.sum(power[frequencies >= low])
+        previous = magnitudes
+        rows.append(row)
+    columns = {name: np.array([row[name] for row in rows]) for name in rows[0]}
+    columns["energy"] = (columns["energy"] - columns["energy"].min())/np.ptp(columns["energy"])
+    return columns
+
+@pytest.mark.parametrize("dtype", [np.int16, np.uint8, np.float32])
+@pytest.mark.parametrize("frames_per_block", [3, 1024])
+def test_features_match_per_frame_numpy(dtype, frames_per_block):
+    data = get_signal(dtype, 2, 3011)
+    table = extract_features(data, 16000, 160, 80, frames_per_block=frames_per_block)
+    centred = center_samples(data).astype(float)
+    starts = get_frame_starts(3011, 160, 80)
+    assert table.shape == (2, len(starts))
+    np.testing.assert_allclose(table["time"][0], np.array(starts)/16000)
+    for channel in range(2):
+        reference = get_reference(centred[channel], 16000, 160, 80)
+        for name, expected in reference.items():
+            np.testing.assert_allclose(table[name][channel], expected, rtol=1e-6, atol=1e-6, err_msg=name)
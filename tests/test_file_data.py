@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from conftest import get_signal
+from file_data import FileData, read_file
+
+@pytest.mark.parametrize("dtype", [np.int16, np.uint8, np.float32])
+def test_samples_keep_their_type_channel_major(write_wav, dtype):
+    data = get_signal(dtype, 3, 1000)
+    file = read_file(write_wav(data))
+    assert file.channels.dtype == dtype and file.channels.shape == (3, 1000)
+    np.testing.assert_array_equal(file.channels, data)
+
+def test_clone_copies_on_write():
+    file = FileData("a.wav", 8000, get_signal(np.int16, 2, 1000))
+    original = file.channels.copy()
+    clone = file.clone()
+    assert np.shares_memory(clone.channels, file.channels)
+    assert not file.channels.flags.writeable and not clone.channels.flags.writeable
+    clone.get_writable_data()[0, :10] = 0
+    # only the clone that asked for writable data got its own copy
+    assert not np.shares_memory(clone.channels, file.channels)
+    np.testing.assert_array_equal(file.channels, original)
+    assert np.all(clone.channels[0, :10] == 0)
+    file.get_writable_data()[1, :10] = 1
+    assert np.all(clone.channels[1, :10] == original[1, :10])
+
+def test_mapped_file_is_copied_only_when_written(write_wav):
+    data = get_signal(np.int16, 2, 1000)
+    path = write_wav(data)
+    file = read_file(path)
+    content_hash = file.get_content_hash()
+    assert isinstance(file.channels, np.memmap)
+    with pytest.raises(ValueError):
+        file.channels[0, 0] = 1
+    modified = file.clone()
+    modified.get_writable_data()[0, 0] += 1
+    assert modified.source is None and modified.get_content_hash() != content_hash
+    # the file on disk and the original object are unchanged
+    np.testing.assert_array_equal(read_file(path).channels, data)
+    np.testing.assert_array_equal(file.channels, data)
+    assert file.get_content_hash() == content_hash
+
+def test_intervals_are_views(write_wav):
+    file = FileData("a.wav", 8000, get_signal(np.int16, 2, 1000))
+    interval = file.get_interval(100, 300)
+    assert interval.length == 200 and np.shares_memory(interval.channels, file.channels)
+    interval.get_writable_data()[:] = 0
+    assert np.any(file.channels[:, 100:300] != 0)
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+from scipy import signal
+from conftest import get_signal
+from wav_io import get_sample_scale
+from file_data import read_file
+from filters import FilterDesign
+from spectrum_analysis import modify_signal
+
+@pytest.mark.parametrize("dtype", [np.int16, np.uint8])
+def test_filtered_file_matches_sosfilt(write_wav, dtype):
+    data = get_signal(dtype, 2, 50000)
+    file = read_file(write_wav(data))
+    design = FilterDesign("lowpass", 1000)
+    offset = get_sample_scale(dtype)[0]
+    expected = signal.sosfilt(design.get_sos(8000), data.astype(float) - offset, axis=-1) + offset
+    limits = np.iinfo(dtype)
+    expected = np.clip(np.rint(expected), limits.min, limits.max)
+    np.testing.assert_array_equal(modify_signal(file, design).channels, expected)
+
+def test_filtered_uint8_silence_stays_at_the_offset(write_wav):
+    file = read_file(write_wav(np.full((1, 20000), 128, dtype=np.uint8)))
+    for design in (FilterDesign("highpass", 300), FilterDesign("bandpass", (300, 1000))):
+        assert np.all(modify_signal(file, design).channels == 128)
+
+def test_spectral_modification_keeps_the_uint8_offset(write_wav):
+    file = read_file(write_wav(np.full((1, 20000), 128, dtype=np.uint8)))
+
+    def remove_low(spectra, samplerate, fft_size, frame_starts):
+        spectra[..., :4] = 0
+        return spectra
+
+    assert np.all(modify_signal(file, remove_low).channels == 128)
@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+from conftest import get_signal
+from audio_analysis import (frame_signal, normalize_data, get_energy, get_zcr, get_normalized_data_frame_blocks,
+                            get_data_frame_blocks)
+
+@pytest.mark.parametrize("dtype, channel_count", [(np.int16, 1), (np.int16, 3), (np.float32, 1), (np.float64, 2)])
+@pytest.mark.parametrize("tail", ["drop", "pad", "shift"])
+def test_frame_blocks_match_whole_signal(dtype, channel_count, tail):
+    data = get_signal(dtype, channel_count, 4010)
+    frames = frame_signal(normalize_data(data), 80, 40, tail)
+    blocks = get_normalized_data_frame_blocks(data, 8000, 10, frames_per_block=7, tail=tail)
+    np.testing.assert_allclose(get_energy(blocks), get_energy(frames), atol=1e-6)
+    blocks = get_data_frame_blocks(data, 8000, 10, frames_per_block=7, tail=tail)
+    np.testing.assert_array_equal(get_zcr(blocks), get_zcr(frame_signal(data, 80, 40, tail)))
+
+def test_shift_ends_with_the_last_samples():
+    data = np.arange(100)
+    frames, last_frame = frame_signal(data, 30, 15)
+    # neither block is a copy of the signal
+    assert frames.shape == (5, 30) and np.shares_memory(frames, data)
+    assert last_frame.shape == (1, 30) and np.shares_memory(last_frame, data)
+    np.testing.assert_array_equal(last_frame[0], data[-30:])
+    np.testing.assert_array_equal(frames, frame_signal(data, 30, 15, "drop"))
+    assert frame_signal(data, 30, 10).shape == (8, 30)
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from wav_io import get_sample_scale
+from audio_analysis import frame_signal
+from file_data import read_file
+from goertzel import (GoertzelBank, DTMFDecoder, ToneDetector, detect_blocks, decode_dtmf, get_tone_amplitudes,
+                      dtmf_low, dtmf_high, dtmf_keys)
+
+digits = "159#0D"
+
+def get_dtmf_signal(dtype=np.int16, samplerate=8000, channel_count=1):
+    # 100 ms tones with 60 ms of silence between them
+    times = np.arange(int(0.1*samplerate))/samplerate
+    parts = []
+    for digit in digits:
+        row = next(i for i, keys in enumerate(dtmf_keys) if digit in keys)
+        column = dtmf_keys[row].index(digit)
+        tone = 0.3*np.sin(2*np.pi*dtmf_low[row]*times) + 0.3*np.sin(2*np.pi*dtmf_high[column]*times)
+        parts.extend((np.zeros(int(0.06*samplerate)), tone))
+    parts.append(np.zeros(int(0.06*samplerate)))
+    data = np.tile(np.concatenate(parts), (channel_count, 1))
+    offset, scale = get_sample_scale(dtype)
+    if np.dtype(dtype).kind == 'f':
+        return data.astype(dtype)
+    return np.rint(data*(scale - 1) + offset).astype(dtype)
+
+def get_blocks(data, block_size):
+    return [data[:, start:start + block_size] for start in range(0, data.shape[-1], block_size)]
+
+def test_bank_matches_the_dft():
+    frames = np.random.default_rng(0).normal(size=(3, 200))
+    frequencies = [8000*k/200 for k in (10, 27, 61)]
+    amplitudes = GoertzelBank(frequencies, 8000, 200).get_amplitudes(frames)
+    spectra = np.abs(np.fft.rfft(frames))[:, [10, 27, 61]]*2/200
+    np.testing.assert_allclose(amplitudes, spectra, atol=1e-12)
+
+@pytest.mark.parametrize("dtype", [np.int16, np.uint8, np.float32])
+def test_dtmf_digits(dtype):
+    data = get_dtmf_signal(dtype, channel_count=2)
+    events = detect_blocks(DTMFDecoder(8000, 2, dtype=dtype), get_blocks(data, 4096))
+    for channel in range(2):
+        assert "".join(event["digit"] for event in events if event["channel"] == channel) == digits
+
+@pytest.mark.parametrize("block_size", [1, 37, 200, 1000, 2**16])
+def test_dtmf_events_do_not_depend_on_block_size(block_size):
+    data = get_dtmf_signal()
+    expected = detect_blocks(DTMFDecoder(8000, 1), [data])
+    assert detect_blocks(DTMFDecoder(8000, 1), get_blocks(data, block_size)) == expected
+
+@pytest.mark.parametrize("block_size", [1, 150, 2**16])
+def test_tone_events_do_not_depend_on_block_size(block_size):
+    data = get_dtmf_signal(channel_count=2)
+    frequencies = dtmf_low + dtmf_high
+    # each of the two tones carries half of the power
+    expected = detect_blocks(ToneDetector(frequencies, 8000, 2, min_ratio=0.3), [data])
+    assert len(expected) == 2*2*len(digits)
+    assert detect_blocks(ToneDetector(frequencies, 8000, 2, min_ratio=0.3), get_blocks(data, block_size)) == expected
+
+@pytest.mark.parametrize("dtype", [np.int16, np.uint8])
+def test_file_decoding_matches_whole_signal(write_wav, dtype):
+    data = get_dtmf_signal(dtype)
+    file = read_file(write_wav(data))
+    assert decode_dtmf(file, block_size=333) == detect_blocks(DTMFDecoder(8000, 1, dtype=dtype), [data])
+    amplitudes = get_tone_amplitudes(file, dtmf_low, cache=None, frames_per_block=7)
+    offset = get_sample_scale(dtype)[0]
+    frames = frame_signal(data.astype(float) - offset, 200, 100, tail="drop")
+    np.testing.assert_allclose(amplitudes, GoertzelBank(dtmf_low, 8000, 200).get_amplitudes(frames), atol=1e-9)
@@ -0,0 +1,68 @@
+import json
+import time
+import numpy as np
+import pytest
+from instrumentation import Instrumentation, null_stage
+
+@pytest.fixture
+def instrumentation():
+    instrumentation = Instrumentation()
+    instrumentation.enable()
+    yield instrumentation
+    instrumentation.disable()
+
+def sleep_stage(instrumentation, name, seconds):
+    with instrumentation.stage(name):
+        time.sleep(seconds)
+
+def test_self_time_leaves_out_nested_stages(instrumentation):
+    with instrumentation.stage("file", "a.wav"):
+        time.sleep(0.02)
+        sleep_stage(instrumentation, "load", 0.05)
+        for _ in range(2):
+            sleep_stage(instrumentation, "energy", 0.03)
+    summary = {entry["stage"]: entry for entry in instrumentation.get_summary()}
+    assert summary["energy"]["count"] == 2 and summary["energy"]["file"] == "a.wav"
+    assert summary["file"]["wall"] >= 0.13
+    assert summary["file"]["self_wall"] == pytest.approx(
+        summary["file"]["wall"] - summary["load"]["wall"] - summary["energy"]["wall"])
+    assert 0.02 <= summary["file"]["self_wall"] < summary["load"]["wall"]
+    assert summary["load"]["self_wall"] == summary["load"]["wall"]
+    # the slowest step by self time comes first
+    assert [entry["stage"] for entry in instrumentation.get_summary()] == ["energy", "load", "file"]
+
+def test_records_keep_their_parent(instrumentation):
+    with instrumentation.stage("file", "a.wav"):
+        with instrumentation.stage("load"):
+            pass
+    records = {record["stage"]: record for record in instrumentation.get_records()}
+    assert (records["load"]["parent"], records["load"]["depth"]) == ("file", 1)
+    assert (records["file"]["parent"], records["file"]["depth"]) == (None, 0)
+
+def test_block_pipelines_are_timed_inside_next(instrumentation):
+    def blocks():
+        for _ in range(3):
+            time.sleep(0.01)
+            yield np.zeros((2, 100))
+
+    with instrumentation.stage("file", "a.wav"):
+        assert len(list(instrumentation.measure_blocks("framing", blocks()))) == 3
+    summary = {entry["stage"]: entry for entry in instrumentation.get_summary()}
+    framing = [record for record in instrumentation.get_records() if record["stage"] == "framing"][0]
+    assert framing["calls"] == 4 and framing["block_bytes"] == 3*1600 and framing["parent"] == "file"
+    assert summary["framing"]["wall"] >= 0.03
+    assert summary["file"]["self_wall"] == pytest.approx(summary["file"]["wall"] - summary["framing"]["wall"])
+
+def test_disabled_instrumentation_records_nothing():
+    instrumentation = Instrumentation()
+    assert instrumentation.stage("load") is null_stage
+    blocks = [np.zeros(3)]
+    assert instrumentation.measure_blocks("framing", blocks) is blocks
+    assert instrumentation.get_records() == []
+
+def test_trace_events(tmp_path, instrumentation):
+    sleep_stage(instrumentation, "load", 0.01)
+    instrumentation.write(str(tmp_path / "trace.json"), "trace")
+    with open(tmp_path / "trace.json") as trace_file:
+        [event] = json.load(trace_file)["traceEvents"]
+    assert event["name"] == "load" and event["ph"] == "X" and event["dur"] >= 1e4
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+from conftest import get_signal
+from plot_data import EnvelopePyramid, PlotTools
+
+@pytest.mark.parametrize("length", [100003, 4096, 300])
+@pytest.mark.parametrize("columns", [7, 500, 3000])
+def test_envelope_matches_the_raw_samples(length, columns):
+    data = get_signal(np.int16, 2, length)
+    sample_bounds, minimum, maximum = EnvelopePyramid(data).get_envelope(data, columns)
+    assert sample_bounds[0] == 0 and sample_bounds[-1] == length
+    assert np.all(np.diff(sample_bounds) > 0) and len(sample_bounds) - 1 <= columns
+    assert minimum.shape == maximum.shape == (2, len(sample_bounds) - 1)
+    for i, (start, end) in enumerate(zip(sample_bounds[:-1], sample_bounds[1:])):
+        np.testing.assert_array_equal(minimum[:, i], data[:, start:end].min(axis=-1))
+        np.testing.assert_array_equal(maximum[:, i], data[:, start:end].max(axis=-1))
+
+def test_levels_halve_the_buckets():
+    data = get_signal(np.float32, 1, 2**16)
+    pyramid = EnvelopePyramid(data, base_size=16, min_length=256)
+    assert pyramid.bucket_sizes == [1, 16, 32, 64, 128, 256]
+    for bucket_size, (minimum, maximum) in zip(pyramid.bucket_sizes[1:], pyramid.levels[1:]):
+        buckets = data.reshape(-1, bucket_size)
+        np.testing.assert_array_equal(minimum[0], buckets.min(axis=-1))
+        np.testing.assert_array_equal(maximum[0], buckets.max(axis=-1))
+
+def test_views_of_one_buffer_share_a_pyramid():
+    tools = PlotTools()
+    data = get_signal(np.int16, 2, 10000)
+    pyramid = tools.get_envelope_pyramid(data)
+    assert tools.get_envelope_pyramid(data.view()) is pyramid
+    assert tools.get_envelope_pyramid(data.copy()) is not pyramid
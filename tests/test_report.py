@@ -0,0 +1,26 @@
+import os
+import numpy as np
+from conftest import get_signal
+from plot_data import Plot, plot_tools
+from file_data import read_file
+from report import main
+
+def test_report_figures_are_named_after_the_file(tmp_path, write_wav):
+    write_wav(get_signal(np.int16, 2, 8000), name="stereo.wav")
+    write_wav(get_signal(np.int16, 1, 4000), name="mono.wav")
+    output_dir = tmp_path / "plots"
+    assert main([str(tmp_path), "-o", str(output_dir), "-j", "2", "-f", "time", "energy", "segments"]) == 0
+    assert sorted(os.listdir(output_dir)) == [f"{stem}_{figure}.png" for stem in ("mono", "stereo")
+                                              for figure in ("energy", "segments", "time")]
+    for name in os.listdir(output_dir):
+        with open(output_dir / name, "rb") as image:
+            assert image.read(8) == b"\x89PNG\r\n\x1a\n"
+
+def test_later_figures_of_a_plot_are_numbered(tmp_path, write_wav):
+    file = read_file(write_wav(get_signal(np.int16, 1, 4000)))
+    plot = Plot(plot_tools, str(tmp_path / "figure.svg"))
+    for _ in range(3):
+        plot.plot_time(file, file.data)
+    assert sorted(os.listdir(tmp_path)) == ["figure.svg", "figure_2.svg", "figure_3.svg", "test.wav"]
+    with open(tmp_path / "figure_3.svg") as image:
+        assert "<svg" in image.read()
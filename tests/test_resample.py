@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+from scipy import signal
+from conftest import get_signal
+from wav_io import WavSource
+from resample import resample_data, get_resample_factors
+
+@pytest.mark.parametrize("samplerate, target_rate", [(44100, 16000), (48000, 16000), (16000, 44100), (22050, 8000),
+                                                     (8000, 16000)])
+@pytest.mark.parametrize("block_size", [500, 2**16])
+def test_resample_matches_resample_poly(samplerate, target_rate, block_size):
+    data = get_signal(np.float64, 2, 12000)
+    up, down = get_resample_factors(samplerate, target_rate)
+    expected = signal.resample_poly(data, up, down, axis=-1)
+    np.testing.assert_allclose(resample_data(data, samplerate, target_rate, block_size=block_size), expected,
+                               atol=1e-10)
+
+def test_resample_of_a_mapped_source(write_wav):
+    data = get_signal(np.int16, 2, 10000)
+    source = WavSource(write_wav(data, samplerate=44100))
+    expected = signal.resample_poly(data.astype(float), 160, 441, axis=-1)
+    output = resample_data(source, 44100, 16000, block_size=777)
+    assert output.dtype == np.int16
+    np.testing.assert_array_equal(output, np.clip(np.rint(expected), -32768, 32767))
+
+def test_equal_rates_copy_the_samples():
+    data = get_signal(np.int16, 2, 1000)
+    output = resample_data(data, 16000, 16000)
+    assert output is not data
+    np.testing.assert_array_equal(output, data)
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+from audio_analysis import find_segments, get_hysteresis_mask, get_segment_table, get_segment_frames
+
+@pytest.mark.parametrize("seed", range(5))
+def test_equal_thresholds_reproduce_find_segments(seed):
+    # few distinct values, so many of them sit exactly on the threshold
+    data = np.random.default_rng(seed).integers(0, 5, (3, 500)).astype(float)/4
+    table = get_segment_table(data, 0.5)
+    for channel, frames in enumerate(get_segment_frames(table, 3)):
+        expected = find_segments(data[channel].tolist(), 0.5)
+        if len(expected) % 2:
+            # a segment still open at the end ends with the last frame
+            expected.append(data.shape[-1])
+        np.testing.assert_array_equal(frames, expected)
+
+def test_hysteresis_keeps_the_state_between_thresholds():
+    energy = np.array([0, 0.5, 1, 0.5, 0.3, 0.5, 0.1, 0.5, 1, 0.2])
+    mask = get_hysteresis_mask(energy, 0.8, 0.3)
+    np.testing.assert_array_equal(mask[0], [0, 0, 1, 1, 1, 1, 0, 0, 1, 0])
+
+def test_short_gaps_are_joined_and_short_segments_dropped():
+    # frames of 10 samples at a hop of 10 and 100 samples a second, so a frame is 0.1 s
+    energy = np.zeros(40)
+    energy[[2, 3, 4, 6, 7, 20, 30, 31, 32, 33]] = 1
+    segments = lambda **limits: [(row["start"], row["end"]) for row in
+                                 get_segment_table(energy, 0.5, frame_size=10, hop_size=10, samplerate=100, **limits)]
+    assert segments() == [(20, 50), (60, 80), (200, 210), (300, 340)]
+    # the gap of one frame is shorter than 0.15 s, the gaps of 12 and 9 frames are not
+    assert segments(min_gap=0.15) == [(20, 80), (200, 210), (300, 340)]
+    assert segments(min_duration=0.2) == [(20, 50), (60, 80), (300, 340)]
+    assert segments(min_gap=0.15, min_duration=0.35) == [(20, 80), (300, 340)]
+
+def test_table_rows_carry_their_channel():
+    energy = np.zeros((3, 20))
+    energy[0, 2:5] = 1
+    energy[2, 0:3] = 2
+    energy[2, 10:12] = [1, 3]
+    table = get_segment_table(energy, 0.5, frame_size=4, hop_size=2, samplerate=10)
+    assert table["channel"].tolist() == [0, 2, 2]
+    assert table[["start_frame", "end_frame"]].tolist() == [(2, 5), (0, 3), (10, 12)]
+    assert table[["start", "end"]].tolist() == [(4, 12), (0, 8), (20, 26)]
+    assert table["peak_energy"].tolist() == [1, 2, 3]
+    assert table["mean_energy"].tolist() == [1, 2, 2]
+    frames = get_segment_frames(table, 3)
+    assert [list(channel) for channel in frames] == [[2, 5], [], [0, 3, 10, 12]]
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+from conftest import get_signal
+from server import JobServer
+
+@pytest.fixture
+def server(tmp_path):
+    return JobServer(output_dir=str(tmp_path / "output"), index_dir=None)
+
+@pytest.fixture
+def path(write_wav):
+    return write_wav(get_signal(np.int16, 1, 2000))
+
+def test_valid_request(server, path):
+    options = server.get_job_options({"path": path, "frame_size": 30, "interval": [0, 0.1], "analyses": "fade",
+                                      "export": {"sample_format": "float32", "file_name": "out.wav"}})
+    assert options["frame_size"] == 30
+    assert options["interval"] == (0, 0.1)
+    assert options["analyses"] == ["fade"]
+    assert options["export"]["file_name"] == "out.wav"
+    assert options["export"]["clip"] is True
+
+@pytest.mark.parametrize("request_", [
+    {"frame_size": "20"}, {"frame_size": 20.5}, {"frame_size": True}, {"frame_size": 0}, {"step": None},
+    {"interval": [0]}, {"interval": [0, "1"]}, {"fade_type": "cubic"}, {"plot_format": "pdf"}, {"plots": 1},
+    {"analyses": ["energy", "volume"]}, {"analyses": [1]}, {"export": []}, {"export": {"output_dir": "/tmp"}},
+    {"export": {"clip": "no"}}, {"export": {"sample_format": "int12"}}, {"export": {"file_name": "/tmp/out.wav"}},
+    {"export": {"file_name": "../out.wav"}}, {"export": {"file_name": "a\\b.wav"}}, {"export": {"file_name": ".."}},
+    {"volume": 1}
+])
+def test_bad_requests_are_rejected(server, path, request_):
+    with pytest.raises(ValueError):
+        server.get_job_options(dict(request_, path=path))
+
+def test_path_must_be_a_string(server):
+    with pytest.raises(ValueError):
+        server.get_job_options({"path": ["a.wav"]})
@@ -0,0 +1,19 @@
+import numpy as np
+import pytest
+from conftest import get_signal
+from file_data import read_file
+from spectrum_analysis import get_interval_spectra, get_shared_fft_size, scale_dft
+
+@pytest.mark.parametrize("workers", [1, -1])
+@pytest.mark.parametrize("shared_sizes", [True, False])
+def test_interval_spectra_match_one_fft_per_interval(write_wav, workers, shared_sizes):
+    data = get_signal(np.int16, 2, 20000)
+    file = read_file(write_wav(data))
+    intervals = [(0, 0.1), (0.5, 0.6), (1.0, 1.37), (2.0, 2.0), (2.4, 3.0)]
+    spectra = get_interval_spectra(file, intervals, shared_sizes, max_batch_bytes=2**14, workers=workers)
+    for (start, end), spectrum in zip(intervals, spectra):
+        samples = data[:, int(start*8000):int(end*8000)]
+        fft_size = get_shared_fft_size(samples.shape[-1]) if shared_sizes else max(samples.shape[-1], 1)
+        expected = scale_dft(np.abs(np.fft.rfft(samples*np.hamming(samples.shape[-1]), n=fft_size)), fft_size)
+        np.testing.assert_allclose(spectrum["magnitudes"], expected, rtol=1e-9, atol=1e-6)
+        assert spectrum["frequencies"].shape[-1] == expected.shape[-1]
@@ -0,0 +1,32 @@
+import os
+import sys
+import json
+import subprocess
+import numpy as np
+import pytest
+from conftest import get_signal
+from startup_profile import scenarios, forbidden, run_scenario
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def get_loaded_modules(code):
+    # a fresh interpreter, so modules loaded by other tests do not count
+    code += "\nimport sys, json\nprint(json.dumps(sorted(sys.modules)))"
+    output = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True).stdout
+    return set(json.loads(output.splitlines()[-1]))
+
+@pytest.mark.parametrize("module", ["main", "batch", "report", "server", "streaming", "feature_store", "benchmark"])
+def test_imports_do_not_load_the_gui_or_scipy(module):
+    loaded = get_loaded_modules(f"import {module}")
+    assert not {"tkinter", "matplotlib", "scipy"} & {name.split(".")[0] for name in loaded}
+
+def test_analysis_without_plots_stays_light(write_wav):
+    path = write_wav(get_signal(np.int16, 2, 20000))
+    loaded = get_loaded_modules(f"sample_path = {path!r}\n" + scenarios["analysis"])
+    assert "handle_data" in loaded
+    assert not {"tkinter", "matplotlib", "scipy"} & {name.split(".")[0] for name in loaded}
+
+@pytest.mark.parametrize("name", list(scenarios))
+def test_startup_scenarios_load_no_forbidden_modules(write_wav, name):
+    result = run_scenario(name, write_wav(get_signal(np.int16, 1, 8000)), 1)
+    assert result["forbidden"] == [], forbidden[name]
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+from conftest import get_signal
+from stft import stft, istft, process_signal
+
+def keep_spectra(spectra, samplerate, fft_size, frame_starts):
+    return spectra
+
+@pytest.mark.parametrize("window", ["hann", "hamming", "blackman"])
+@pytest.mark.parametrize("frame_size, hop_size", [(256, 128), (256, 64), (400, 100)])
+def test_istft_restores_the_signal(window, frame_size, hop_size):
+    data = get_signal(np.float64, 2, 5000)
+    output = istft(stft(data, frame_size, hop_size, window), frame_size, hop_size, data.shape[-1], window)
+    # the samples at either end are seen only by the edge of a window
+    inner = slice(frame_size, -frame_size)
+    np.testing.assert_allclose(output[..., inner], data[..., inner], atol=1e-10)
+
+@pytest.mark.parametrize("block_size", [100, 999, 2**16])
+def test_streaming_processor_restores_the_signal(block_size):
+    data = get_signal(np.float64, 2, 5000)
+    output = np.concatenate(list(process_signal(data, keep_spectra, 8000, 256, 64, block_size=block_size)), axis=-1)
+    assert output.shape == data.shape
+    np.testing.assert_allclose(output, data, atol=1e-10)
+
+@pytest.mark.parametrize("block_size", [333, 2**16])
+def test_streaming_processor_matches_offline_filtering(block_size):
+    data = get_signal(np.float64, 2, 6000)
+
+    def remove_high(spectra, samplerate, fft_size, frame_starts):
+        spectra = spectra.copy()
+        spectra[..., fft_size//8:] = 0
+        return spectra
+
+    # the processor starts frame_size - hop_size samples before the signal and
+    # pads the end, so the whole signal is transformed the same way here
+    delay = 256 - 64
+    padded = np.pad(data, ((0, 0), (delay, 256)))
+    spectra = remove_high(stft(padded, 256, 64), 8000, 256, None)
+    offline = istft(spectra, 256, 64, padded.shape[-1])[..., delay:delay + data.shape[-1]]
+    blocks = np.concatenate(list(process_signal(data, remove_high, 8000, 256, 64, block_size=block_size)), axis=-1)
+    assert np.abs(offline - data).max() > 0.1
+    np.testing.assert_allclose(blocks, offline, atol=1e-12)
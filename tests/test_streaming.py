@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from conftest import get_signal
+from wav_io import get_sample_scale
+from audio_analysis import (calculate_frame_energy, calculate_frame_zero_crossing_rate, frame_signal,
+                            get_frame_size, get_hop_size, get_segment_table, get_zcr, get_data_frame_blocks)
+from streaming import StreamingAnalyzer, stream_analysis
+
+def get_blocks(data, block_size):
+    return [data[:, start:start + block_size] for start in range(0, data.shape[-1], block_size)]
+
+def get_bursts(dtype, channel_count, length=16000):
+    # quiet noise with louder bursts, so there are segments to find
+    data = get_signal(np.float64, channel_count, length)*0.05
+    for start in range(1000, length, 4000):
+        data[:, start:start + 1500] *= 15
+    offset, scale = get_sample_scale(dtype)
+    limits = np.iinfo(dtype)
+    return np.clip(np.rint(data*scale + offset), limits.min, limits.max).astype(dtype)
+
+@pytest.mark.parametrize("dtype, channel_count", [(np.int16, 1), (np.int16, 2), (np.uint8, 1)])
+@pytest.mark.parametrize("block_size", [1, 97, 1024, 20000])
+def test_streaming_matches_offline(dtype, channel_count, block_size):
+    data = get_bursts(dtype, channel_count)
+    offset, scale = get_sample_scale(dtype)
+    frame_size = get_frame_size(20, 8000)
+    hop_size = get_hop_size(frame_size)
+    results = list(stream_analysis(get_blocks(data, block_size), 8000, channel_count, on_threshold=0.01,
+                                   off_threshold=0.005, dtype=dtype))
+
+    frames = frame_signal(data.astype(float) - offset, frame_size, hop_size, tail="drop")
+    energy = np.concatenate([result["energy"] for result in results], axis=-1)
+    np.testing.assert_allclose(energy, calculate_frame_energy(frames))
+    zcr = np.concatenate([result["zcr"] for result in results], axis=-1)
+    np.testing.assert_array_equal(zcr, calculate_frame_zero_crossing_rate(frames))
+
+    table = get_segment_table(energy/(frame_size*scale**2), 0.01, 0.005, frame_size, hop_size, 8000)
+    assert len(table) > 0
+    events = [event for result in results for event in result["events"]]
+    starts = [(event["channel"], event["sample"]) for event in events if event["type"] == "start"]
+    ends = [(event["channel"], event["sample"]) for event in events if event["type"] == "end"]
+    assert starts == sorted(zip(table["channel"].tolist(), table["start"].tolist()), key=lambda row: row[1])
+    # a segment still open at the end of the stream has no end event
+    closed = table[table["end_frame"] < energy.shape[-1]]
+    assert ends == sorted(zip(closed["channel"].tolist(), closed["end"].tolist()), key=lambda row: row[1])
+
+def test_block_larger_than_the_ring_buffer():
+    data = get_bursts(np.int16, 1)
+    analyzer = StreamingAnalyzer(8000, 1, max_block_size=512)
+    energy = analyzer.process(data)["energy"]
+    frames = frame_signal(data.astype(float), analyzer.frame_size, analyzer.hop_size, tail="drop")
+    np.testing.assert_allclose(energy, calculate_frame_energy(frames))
+
+@pytest.mark.parametrize("dtype", [np.int16, np.uint8])
+def test_streaming_zcr_matches_the_offline_pipeline(dtype):
+    data = get_bursts(dtype, 2)
+    results = stream_analysis(get_blocks(data, 1000), 8000, 2, dtype=dtype)
+    zcr = np.concatenate([result["zcr"] for result in results], axis=-1)
+    offline = get_zcr(get_data_frame_blocks(data, 8000, 20, frames_per_block=7, tail="drop"))
+    assert offline.mean() > 0.1
+    np.testing.assert_array_equal(zcr, offline)
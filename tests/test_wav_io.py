@@ -0,0 +1,87 @@
+import os
+import numpy as np
+import pytest
+from scipy.io import wavfile
+from conftest import get_signal
+from wav_io import WavSource, WavWriter
+
+@pytest.mark.parametrize("dtype, bit_depth", [(np.uint8, 8), (np.int16, 16), (np.int32, 24), (np.float32, 32)])
+@pytest.mark.parametrize("channel_count", [1, 3])
+def test_source_blocks_match_scipy(write_wav, dtype, bit_depth, channel_count):
+    data = get_signal(np.int16 if bit_depth == 24 else dtype, channel_count, 5000)
+    if bit_depth == 24:
+        data = data.astype(np.int32) << 16
+    path = write_wav(data, bit_depth=bit_depth)
+    source = WavSource(path)
+    expected = np.atleast_2d(wavfile.read(path)[1].T)
+    assert (source.bit_depth, source.length, source.channel_count) == (bit_depth, 5000, channel_count)
+    assert source.is_mapped == (bit_depth != 24)
+    np.testing.assert_array_equal(source.get_channels(), expected)
+    # overlapping blocks cover the file with the overlap repeated at every block edge
+    blocks = list(source.iter_blocks(777, overlap=100))
+    assert [start for start, _ in blocks] == list(range(0, 4900, 777))
+    for start, block in blocks:
+        np.testing.assert_array_equal(block, expected[:, start:start + 877])
+
+def test_truncated_data_chunk(write_wav):
+    path = write_wav(get_signal(np.int16, 2, 1000))
+    with open(path, "r+b") as file:
+        file.truncate(file.seek(0, 2) - 10)
+    source = WavSource(path)
+    assert source.length == 1000 - 3
+    np.testing.assert_array_equal(source.get_channels(), get_signal(np.int16, 2, 1000)[:, :997])
+
+@pytest.mark.parametrize("dtype, bit_depth", [(np.int16, 16), (np.int32, 24), (np.float32, 32), (np.uint8, 8)])
+def test_writer_round_trip(tmp_path, dtype, bit_depth):
+    data = get_signal(np.int16 if bit_depth == 24 else dtype, 2, 3001)
+    if bit_depth == 24:
+        data = data.astype(np.int32) << 16 | 0x100
+    path = str(tmp_path / "out.wav")
+    with WavWriter(path, 8000, 2, dtype, bit_depth, block_size=1000) as writer:
+        writer.write(data[:, :1234])
+        writer.write(data[:, 1234:])
+    # 3 bytes a sample for 24-bit files, and the odd data chunk is padded
+    assert os.path.getsize(path) == 44 + 3001*2*bit_depth//8 + 3001*2*bit_depth//8 % 2
+    source = WavSource(path)
+    assert (source.dtype, source.bit_depth, source.length) == (np.dtype(dtype), bit_depth, 3001)
+    np.testing.assert_array_equal(source.get_channels(), data)
+
+def test_24_bit_samples_are_packed_little_endian(tmp_path):
+    path = str(tmp_path / "out.wav")
+    with WavWriter(path, 8000, 1, np.int32, 24) as writer:
+        writer.write(np.array([[0x12345600, -256]], dtype=np.int32))
+    with open(path, "rb") as file:
+        assert file.read()[44:] == bytes([0x56, 0x34, 0x12, 0xff, 0xff, 0xff])
+
+@pytest.mark.parametrize("dtype", [np.int16, np.uint8, np.int32])
+def test_out_of_range_samples_saturate(tmp_path, dtype):
+    path = str(tmp_path / "out.wav")
+    with WavWriter(path, 8000, 1, dtype, input_dtype=np.float64) as writer:
+        writer.write(np.array([[-3.0, -1.0, 0.0, 0.5, 2.0]]))
+    assert writer.clipped == 2
+    limits = np.iinfo(dtype)
+    samples = WavSource(path).get_channels()[0]
+    assert samples[0] == samples[1] == limits.min
+    assert samples[-1] == limits.max
+
+def test_out_of_range_samples_raise_without_clipping(tmp_path):
+    with WavWriter(str(tmp_path / "out.wav"), 8000, 1, np.int16, input_dtype=np.float64, clip=False) as writer:
+        writer.write(np.array([[0.0, 0.99]]))
+        with pytest.raises(OverflowError):
+            writer.write(np.array([[0.5, 1.5]]))
+
+def test_dither_changes_only_the_lowest_bit(tmp_path):
+    # 24-bit samples written as 16-bit: dither may move a sample by one 16-bit step,
+    # and samples already on the 16-bit grid are left alone
+    data = (get_signal(np.int16, 2, 5000).astype(np.int32) << 16) + np.random.default_rng(1).integers(0, 2**16, (2, 5000))
+    data[:, ::7] &= ~0xffff
+    paths = {}
+    for dither in (False, True):
+        paths[dither] = str(tmp_path / f"dither_{dither}.wav")
+        with WavWriter(paths[dither], 8000, 2, np.int16, input_dtype=np.int32, dither=dither, seed=0) as writer:
+            writer.write(data)
+    rounded = WavSource(paths[False]).get_channels().astype(int)
+    dithered = WavSource(paths[True]).get_channels().astype(int)
+    assert np.abs(dithered - rounded).max() == 1
+    assert np.count_nonzero(dithered != rounded) > 1000
+    np.testing.assert_array_equal(dithered[:, ::7], data[:, ::7] >> 16)
@@ -0,0 +1,252 @@
+import os
+import mmap
+import struct
+import numpy as np
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+class WavFormatError(ValueError):
+    pass
+
+def get_sample_dtype(format_tag, bit_depth):
+    if format_tag == WAVE_FORMAT_IEEE_FLOAT and bit_depth in (32, 64):
+        return np.dtype(f'<f{bit_depth//8}')
+    if format_tag == WAVE_FORMAT_PCM:
+        if bit_depth == 8:
+            return np.dtype('u1')
+        if bit_depth in (16, 32, 64):
+            return np.dtype(f'<i{bit_depth//8}')
+        if bit_depth == 24:
+            return np.dtype('<i4')
+    raise WavFormatError(f"Unsupported sample format {format_tag:#06x} with {bit_depth}-bit samples")
+
+def read_chunks(file):
+    riff, _, wave = struct.unpack('<4sI4s', file.read(12))
+    if riff != b'RIFF' or wave != b'WAVE':
+        raise WavFormatError("Not a RIFF WAVE file")
+    while True:
+        header = file.read(8)
+        if len(header) < 8:
+            return
+        chunk_id, chunk_size = struct.unpack('<4sI', header)
+        offset = file.tell()
+        yield chunk_id, chunk_size, offset
+        file.seek(offset + chunk_size + chunk_size % 2)
+
+def unpack_24_bit(raw):
+    # left-justified int32, the same layout scipy.io.wavfile returns
+    samples = np.zeros(raw.shape[:-1] + (4,), dtype=np.uint8)
+    samples[..., 1:] = raw
+    return samples.view('<i4')[..., 0]
+
+class WavSource:
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.file_name = os.path.basename(file_path)
+        self.read_header()
+        self.open_map()
+
+    def read_header(self):
+        fmt, data_offset, data_size = None, None, 0
+        with open(self.file_path, 'rb') as file:
+            for chunk_id, chunk_size, offset in read_chunks(file):
+                if chunk_id == b'fmt ':
+                    file.seek(offset)
+                    fmt = file.read(chunk_size)
+                elif chunk_id == b'data':
+                    data_offset, data_size = offset, chunk_size
+                    break
+            file_size = file.seek(0, os.SEEK_END)
+        if fmt is None or data_offset is None:
+            raise WavFormatError(f"'{self.file_name}' has no fmt or data chunk")
+
+        format_tag, channels, samplerate, _, block_align, bit_depth = struct.unpack('<HHIIHH', fmt[:16])
+        if format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+            format_tag = struct.unpack('<H', fmt[24:26])[0]
+        self.samplerate = samplerate
+        self.channel_count = channels
+        self.bit_depth = bit_depth
+        self.block_align = block_align
+        self.sample_width = block_align // channels
+        self.dtype = get_sample_dtype(format_tag, bit_depth)
+        self.data_offset = data_offset
+        data_size = min(data_size, file_size - data_offset)
+        self.length = data_size // block_align
+
+    def open_map(self):
+        if self.length == 0:
+            shape = (0, self.channel_count, 3) if self.bit_depth == 24 else (0, self.channel_count)
+            self.raw = np.zeros(shape, dtype=np.uint8 if self.bit_depth == 24 else self.dtype)
+        elif self.bit_depth == 24:
+            self.raw = np.memmap(self.file_path, dtype=np.uint8, mode='r', offset=self.data_offset,
+                                 shape=(self.length, self.channel_count, 3))
+        else:
+            self.raw = np.memmap(self.file_path, dtype=self.dtype, mode='r', offset=self.data_offset,
+                                 shape=(self.length, self.channel_count))
+
+    def __getstate__(self):
+        return {'file_path': self.file_path}
+
+    def __setstate__(self, state):
+        self.__init__(state['file_path'])
+
+    @property
+    def duration(self):
+        return self.length/self.samplerate
+
+    @property
+    def is_mapped(self):
+        return self.bit_depth != 24
+
+    def read_block(self, start, stop):
+        # channel-major block; a view into the map unless samples are 24-bit
+        block = self.raw[start:stop]
+        if self.bit_depth == 24:
+            block = unpack_24_bit(block)
+        return block.T
+
+    def get_channels(self):
+        return self.read_block(0, self.length)
+
+    def release_pages(self, start, stop):
+        # drop already consumed pages so a full pass keeps resident memory flat
+        if not isinstance(self.raw, np.memmap) or not hasattr(self.raw._mmap, 'madvise'):
+            return
+        map_offset = self.data_offset % mmap.ALLOCATIONGRANULARITY
+        first_byte = map_offset + start*self.block_align
+        first_byte -= first_byte % mmap.PAGESIZE
+        last_byte = map_offset + stop*self.block_align
+        last_byte -= last_byte % mmap.PAGESIZE
+        if last_byte > first_byte:
+            self.raw._mmap.madvise(mmap.MADV_DONTNEED, first_byte, last_byte - first_byte)
+
+    def iter_blocks(self, block_size, overlap=0):
+        for start in range(0, max(self.length - overlap, 1), block_size):
+            yield start, self.read_block(start, min(start + block_size + overlap, self.length))
+            self.release_pages(start, start + block_size)
+
+class ChannelSource:
+
+    def __init__(self, source, index):
+        self.source = source
+        self.index = index
+        self.samplerate = source.samplerate
+        self.channel_count = 1
+        self.dtype = source.dtype
+        self.length = source.length
+
+    def read_block(self, start, stop):
+        return self.source.read_block(start, stop)[self.index:self.index + 1]
+
+    def get_channels(self):
+        return self.read_block(0, self.length)
+
+    def iter_blocks(self, block_size, overlap=0):
+        for start, block in self.source.iter_blocks(block_size, overlap):
+            yield start, block[self.index:self.index + 1]
+
+def get_sample_scale(dtype):
+    # offset and full scale of a sample type; 24-bit samples are left-justified int32
+    dtype = np.dtype(dtype)
+    if dtype.kind == 'u':
+        return 2.0**(dtype.itemsize*8 - 1), 2.0**(dtype.itemsize*8 - 1)
+    if dtype.kind == 'i':
+        return 0.0, 2.0**(dtype.itemsize*8 - 1)
+    return 0.0, 1.0
+
+def pack_24_bit(samples):
+    samples = np.ascontiguousarray(samples, dtype='<i4')
+    return samples.view(np.uint8).reshape(samples.shape + (4,))[..., :3]
+
+class WavWriter:
+
+    def __init__(self, file_path, samplerate, channel_count, dtype=np.int16, bit_depth=None, input_dtype=None,
+                 clip=True, dither=False, block_size=2**16, seed=None):
+        # blocks are taken in the scale of input_dtype (the output type by default)
+        # and converted a block_size slice at a time
+        self.file_path = file_path
+        self.samplerate = samplerate
+        self.channel_count = channel_count
+        self.dtype = np.dtype(dtype).newbyteorder('<')
+        self.bit_depth = self.dtype.itemsize*8 if bit_depth is None else bit_depth
+        if self.bit_depth == 24 and self.dtype != np.dtype('<i4'):
+            raise WavFormatError("24-bit samples are written from int32")
+        self.input_dtype = self.dtype if input_dtype is None else np.dtype(input_dtype)
+        self.clip = clip
+        self.dither = dither
+        self.block_size = block_size
+        self.random = np.random.default_rng(seed)
+        self.clipped = 0
+        self.length = 0
+        self.file = open(file_path, 'wb')
+        self.write_header()
+
+    @property
+    def sample_width(self):
+        return self.bit_depth//8
+
+    def write_header(self):
+        format_tag = WAVE_FORMAT_IEEE_FLOAT if self.dtype.kind == 'f' else WAVE_FORMAT_PCM
+        block_align = self.channel_count*self.sample_width
+        data_size = self.length*block_align
+        self.file.seek(0)
+        self.file.write(struct.pack('<4sI4s', b'RIFF', 36 + data_size + data_size % 2, b'WAVE'))
+        self.file.write(struct.pack('<4sIHHIIHH', b'fmt ', 16, format_tag, self.channel_count, self.samplerate,
+                                    self.samplerate*block_align, block_align, self.bit_depth))
+        self.file.write(struct.pack('<4sI', b'data', data_size))
+        self.file.seek(0, os.SEEK_END)
+
+    def quantize(self, values):
+        # integer output: values in output steps, dithered where they fall between steps
+        step = 2**(self.dtype.itemsize*8 - self.bit_depth)
+        if step > 1:
+            values = values/step
+        if self.dither:
+            fractional = values != np.rint(values)
+            noise = self.random.random(values.shape) - self.random.random(values.shape)
+            values = np.where(fractional, values + noise, values)
+        values = np.rint(values)
+        low = np.iinfo(self.dtype).min//step
+        high = np.iinfo(self.dtype).max//step
+        out_of_range = np.count_nonzero((values < low) | (values > high))
+        if out_of_range and not self.clip:
+            raise OverflowError(f"{out_of_range} samples out of the {self.bit_depth}-bit range in '{self.file_path}'")
+        self.clipped += out_of_range
+        return np.clip(values, low, high).astype(self.dtype)
+
+    def convert(self, block):
+        if block.dtype == self.dtype and self.input_dtype == self.dtype and self.bit_depth != 24:
+            return block
+        input_offset, input_scale = get_sample_scale(self.input_dtype)
+        offset, scale = get_sample_scale(self.dtype)
+        values = block
+        if (input_offset, input_scale) != (offset, scale):
+            values = (block - input_offset)*(scale/input_scale) + offset
+        if self.dtype.kind == 'f':
+            return values.astype(self.dtype)
+        return self.quantize(np.asarray(values, dtype=float))
+
+    def write(self, block):
+        # channel-major block in, interleaved samples out
+        block = np.atleast_2d(block)
+        for start in range(0, block.shape[-1], self.block_size):
+            samples = np.ascontiguousarray(self.convert(block[:, start:start + self.block_size]).T)
+            if self.bit_depth == 24:
+                samples = pack_24_bit(samples)
+            self.file.write(samples.tobytes())
+        self.length += block.shape[-1]
+
+    def close(self):
+        if self.length*self.channel_count*self.sample_width % 2:
+            self.file.write(b'\0')
+        self.write_header()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()